@@ -1,81 +1,237 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, request, jsonify # type: ignore
-import os, requests, random # type: ignore
+from flask import Blueprint, request, jsonify, Response, stream_with_context # type: ignore
+import os, requests, random, json, base64 # type: ignore
 from uuid import uuid4
-from app import db, SpeakingSession, SpeakingTurn  # Thêm dòng này
-from datetime import datetime
+from sqlalchemy import or_
+from auth import token_user_id
+from app import db, SpeakingSession, SpeakingTurn, SpeakingQuestion, Quiz, append_rows  # Thêm dòng này
+import metrics
+import response_cache
+import upstream
+from provider_router import ProviderRouter, chat_providers, parse_json_reply
+from quiz_sampler import QuizSampler
+from chat_memory import ChatMemory
+from db_helpers import insert_ignore
+from datetime import datetime, timedelta
 ai_bp = Blueprint("ai_bp", __name__)
 
 # ===== Cấu hình AI =====
 AI_API_KEY  = os.getenv("OPENAI_API_KEY")
-OPENAI_BASE = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-OPENAI_MODEL= os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
 
 if not AI_API_KEY:
     raise RuntimeError("Thiếu OPENAI_API_KEY trong env (ai.env hoặc .env)")
 
+CHAT_SYSTEM_PROMPT = "Bạn là trợ giảng lịch thiệp, trả lời ngắn gọn, rõ ràng."
+DEFAULT_FEEDBACK = "Good effort! Try to speak more naturally next time."
+# Provider bị ngắt mạch / quá tải: trả lời ngay thay vì giữ thread chờ
+BUSY_REPLY = "[Fallback] AI service is busy, please try again shortly."
+# AI không trả lời được: provider bị ngắt mạch/quá tải, hoặc mọi provider đều trả mã lỗi HTTP (429, 5xx...)
+# → route speaking dùng câu hỏi/feedback dự phòng thay vì 500
+AI_UNAVAILABLE = (upstream.UpstreamUnavailable, upstream.UpstreamHTTPError)
+EMPTY_REPLY = "[Fallback] Empty AI response."
+SESSION_NOT_FOUND = "Phiên học không tồn tại trong hệ thống"
+
+
+def _fallback_reply(error, timeout_errors=(requests.Timeout,)):
+    """Câu trả lời dự phòng cho lỗi lúc gọi AI; asgi.py truyền lớp timeout của httpx."""
+    if isinstance(error, upstream.UpstreamHTTPError):
+        return f"[Fallback] AI upstream error {error.status_code}: {error.text}"
+    if isinstance(error, upstream.UpstreamUnavailable):
+        return BUSY_REPLY
+    if isinstance(error, timeout_errors):
+        return "[Fallback] AI service timeout"
+    return f"[Fallback] Flask exception: {str(error)}"
+
+
+# Chat được gửi tới provider kiểu OpenAI nhanh/khỏe nhất (CHAT_PROVIDERS, mặc định chỉ "openai";
+# đặt "openai,groq" để chuyển sang Groq khi OpenAI lỗi)
+CHAT_PROVIDERS = chat_providers("CHAT_PROVIDERS", "openai")
+chat_router = ProviderRouter("chat")
+
+
+def _chat(messages, temperature, max_tokens, **extra):
+    """Gọi /chat/completions qua router (xếp hạng + hedge + chuyển provider khi lỗi), trả về text."""
+    _, text = chat_router.call([
+        (p.name, lambda p=p: p.complete(messages, temperature, max_tokens, **extra)) for p in CHAT_PROVIDERS
+    ])
+    return text
+
+
+# ============================================================
+# 💾 Cache câu trả lời chat (response_cache.py): câu hỏi lặp lại với history ngắn → trả ngay, không gọi AI
+# ============================================================
+chat_cache = response_cache.from_env()
+# Router có thể trả lời bằng bất kỳ provider nào trong danh sách → key theo cả danh sách model
+CHAT_MODEL_KEY = ",".join(f"{p.name}:{p.model}" for p in CHAT_PROVIDERS)
+CHAT_PARAMS = {"temperature": 0.7, "max_tokens": 300}
+
+
+def _chat_cache_key(messages):
+    return chat_cache.key(messages, CHAT_MODEL_KEY, CHAT_PARAMS)
+
+
+@metrics.on_scrape
+def collect_chat_cache_metrics():
+    stats = chat_cache.stats()
+    metrics.export_cache("chat_response", stats["hits"], stats["misses"], stats["size"])
+
+
+# ============================================================
+# 📡 Streaming (Server-Sent Events)
+# Client gửi "stream": true (hoặc header Accept: text/event-stream) để nhận token ngay khi AI sinh ra:
+#   data: {"delta": "..."}            ← từng đoạn text
+#   event: done / data: {...}         ← kết quả cuối, cùng dạng với response JSON thường
+#   event: error / data: {...}        ← lỗi upstream (cùng nội dung fallback như bản không stream)
+# ============================================================
+def _stream_requested(data, headers=None):
+    accept = (headers if headers is not None else request.headers).get("Accept") or ""
+    return data.get("stream") is True or "text/event-stream" in accept
+
+
+def _sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_chat(messages, temperature, max_tokens):
+    """
+    Yield từng đoạn text (stream=True) từ provider đang xếp hạng cao nhất; lỗi HTTP → upstream.UpstreamHTTPError.
+    Stream không hedge được (đã gửi token cho client thì không đổi provider giữa chừng).
+    """
+    by_name = {p.name: p for p in CHAT_PROVIDERS}
+    provider = by_name[chat_router.rank(list(by_name))[0]]
+    resp = provider.post(messages, temperature, max_tokens, stream=True)
+    if resp.status_code >= 400:
+        text = resp.text[:120]
+        resp.close()
+        raise upstream.UpstreamHTTPError(provider.name, resp.status_code, text)
+    yield from upstream.iter_chat_stream(resp)
+
+
+def _chat_events(messages, memory=None, msg=None, cache_key=None):
+    parts = []
+    try:
+        for text in _stream_chat(messages, CHAT_PARAMS["temperature"], CHAT_PARAMS["max_tokens"]):
+            parts.append(text)
+            yield _sse({"delta": text})
+    except Exception as e:
+        yield _sse(_chat_result(_fallback_reply(e), memory, msg), event="error")
+        return
+
+    reply = "".join(parts).strip() or EMPTY_REPLY
+    chat_cache.set(cache_key, reply)
+    yield _sse(_chat_result(reply, memory, msg), event="done")
+
+
+def _cached_chat_events(reply, memory, msg):
+    yield _sse({"delta": reply})
+    yield _sse(_chat_result(reply, memory, msg, cached=True), event="done")
+
+def _chat_messages(msg, history):
+    messages = [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT}
+    ]
+    for m in history:
+        r, c = m.get("role"), m.get("content")
+        if r in ("user", "assistant") and isinstance(c, str):
+            messages.append({"role": r, "content": c})
+    messages.append({"role": "user", "content": msg})
+    return messages
+
+# ============================================================
+# 🧠 Bộ nhớ hội thoại phía server (chat_memory.py)
+# Client gửi "conversation_id" (hoặc "new_conversation": true để mở hội thoại mới) thay vì cả mảng history;
+# response trả lại conversation_id. Không có hai trường này → chạy như cũ với history do client gửi.
+# ============================================================
+chat_memory = ChatMemory(
+    summarize=lambda messages, max_tokens: _chat(messages, 0.3, max_tokens),
+    history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", 1500)),
+    summary_tokens=int(os.getenv("CHAT_SUMMARY_TOKENS", 300)),
+    fold_tokens=int(os.getenv("CHAT_FOLD_TOKENS", 600)),
+    max_workers=int(os.getenv("CHAT_SUMMARY_WORKERS", 2)),
+)
+CONVERSATION_NOT_FOUND = "Hội thoại không tồn tại"
+
+
+def _memory_requested(data):
+    return bool(data.get("conversation_id")) or data.get("new_conversation") is True
+
+
+def _chat_input(data):
+    """(message, lỗi) từ body /ai/chat."""
+    msg = (data.get("message") or "").strip()
+    return msg, (None if msg else "message is required")
+
+
+def _chat_prompt(data, msg, memory):
+    """Messages gửi AI: từ hội thoại phía server (memory) hoặc từ history client gửi."""
+    if memory is not None:
+        return chat_memory.messages(memory, CHAT_SYSTEM_PROMPT, msg)
+    return _chat_messages(msg, data.get("history") or [])  # [{role, content}]
+
+
+def _chat_result(reply, memory, msg, cached=False):
+    """Payload trả về cho client; lưu lượt hỏi/đáp vào hội thoại (trừ khi là fallback)."""
+    if memory is None:
+        return {"reply": reply, "cached": cached}
+    if not reply.startswith("[Fallback]"):
+        try:
+            chat_memory.remember(memory, msg, reply)
+        except Exception as db_err:
+            db.session.rollback()
+            print(f"⚠️ [CHAT-MEMORY] Lưu hội thoại thất bại: {db_err}")
+    return {"reply": reply, "cached": cached, "conversation_id": memory["conversation_id"]}
+
+
 # ============================================================
 # 🎓 1️⃣ Chat chung (dùng cho assistant tổng quát)
 # ============================================================
 @ai_bp.route("/ai/chat", methods=["POST"])
 def ai_chat():
+    memory, msg = None, ""
     try:
         data = request.get_json(silent=True) or {}
-        msg = (data.get("message") or "").strip()
-        history = data.get("history") or []  # [{role, content}]
-
-        if not msg:
-            return jsonify({"error": "message is required"}), 400
+        msg, error = _chat_input(data)
+        if error:
+            return jsonify({"error": error}), 400
 
         # ===== Chuẩn bị messages =====
-        messages = [
-            {"role": "system", "content": "Bạn là trợ giảng lịch thiệp, trả lời ngắn gọn, rõ ràng."}
-        ]
-        for m in history:
-            r, c = m.get("role"), m.get("content")
-            if r in ("user", "assistant") and isinstance(c, str):
-                messages.append({"role": r, "content": c})
-        messages.append({"role": "user", "content": msg})
-
-        # ===== Gọi OpenAI API =====
-        resp = requests.post(
-            f"{OPENAI_BASE}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {AI_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": OPENAI_MODEL,
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 300,
-            },
-            timeout=25,
-        )
+        if _memory_requested(data):
+            memory = chat_memory.open(data.get("conversation_id"), token_user_id() or data.get("user_id"))
+            if memory is None:
+                return jsonify({"error": CONVERSATION_NOT_FOUND}), 404
+        messages = _chat_prompt(data, msg, memory)
 
-        # ===== Xử lý lỗi HTTP =====
-        if resp.status_code >= 400:
-            return jsonify({
-                "reply": f"[Fallback] AI upstream error {resp.status_code}: {resp.text[:120]}"
-            }), 200
+        # ===== Cache (câu hỏi đã gặp với history ngắn) =====
+        cache_key = _chat_cache_key(messages)
+        cached = chat_cache.get(cache_key)
 
-        # ===== Trả kết quả =====
-        payload = resp.json()
-        reply = (
-            payload.get("choices", [{}])[0]
-                   .get("message", {})
-                   .get("content", "")
-                   .strip()
-        )
-        if not reply:
-            reply = "[Fallback] Empty AI response."
+        if _stream_requested(data):
+            if cached is not None:
+                return _sse_response(_cached_chat_events(cached, memory, msg))
+            return _sse_response(_chat_events(messages, memory, msg, cache_key))
+
+        if cached is not None:
+            return jsonify(_chat_result(cached, memory, msg, cached=True)), 200
 
-        return jsonify({"reply": reply}), 200
+        # ===== Gọi AI (provider nhanh nhất) =====
+        reply = _chat(messages, CHAT_PARAMS["temperature"], CHAT_PARAMS["max_tokens"]) or EMPTY_REPLY
+
+        # ===== Trả kết quả =====
+        chat_cache.set(cache_key, reply)
+        return jsonify(_chat_result(reply, memory, msg)), 200
 
-    except requests.Timeout:
-        return jsonify({"reply": "[Fallback] AI service timeout"}), 200
     except Exception as e:
-        return jsonify({"reply": f"[Fallback] Flask exception: {str(e)}"}), 200
+        # Lỗi HTTP từ AI, quá tải, timeout...: trả câu dự phòng (không cache)
+        return jsonify(_chat_result(_fallback_reply(e), memory, msg)), 200
 
 
 # ============================================================
@@ -83,68 +239,130 @@ def ai_chat():
 # ============================================================
 _sessions = {}  # Lưu session tạm (RAM)
 
+def _speaking_start_messages(topic):
+    prompt = f"Hãy tạo 3 câu hỏi luyện nói IELTS Speaking Part 1, chủ đề '{topic}', viết bằng tiếng Anh. \
+Mỗi câu hỏi nên ngắn gọn, tự nhiên như trong bài thi thật."
+    return [
+        {"role": "system", "content": "Bạn là giám khảo IELTS tạo câu hỏi Speaking Part 1."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _split_questions(text):
+    # Tách thành 3 câu hỏi (bằng dấu ?)
+    raw_qs = [q.strip("-• \n") for q in text.replace("\n", " ").split("?") if q.strip()]
+    return [q + "?" for q in raw_qs[:3]]
+
+
+# ===== Ngân hàng câu hỏi theo topic =====
+# Topic đã có ít nhất SPEAKING_BANK_MIN câu → lấy mẫu ngay trong RAM, không gọi AI.
+# Dưới ngưỡng → gọi AI như cũ và cất câu hỏi mới vào ngân hàng (bỏ câu trùng).
+SPEAKING_BANK_MIN = int(os.getenv("SPEAKING_BANK_MIN", 30))
+
+
+def _bank_topic(topic):
+    return " ".join(topic.lower().split())[:255]
+
+
+def _load_bank_ids(topic, _level):
+    query = db.session.query(SpeakingQuestion.id).filter(SpeakingQuestion.topic == topic)
+    return (row[0] for row in query)
+
+
+speaking_bank = QuizSampler(
+    _load_bank_ids,
+    ttl=float(os.getenv("SPEAKING_BANK_TTL", 300)),
+    recent_per_user=int(os.getenv("SPEAKING_RECENT_PER_USER", 30)),
+    max_pools=int(os.getenv("SPEAKING_BANK_MAX_TOPICS", 512)),  # Topic do client gửi lên: giữ số topic trong RAM có hạn
+)
+
+
+def _bank_questions(topic, user_id, minimum=SPEAKING_BANK_MIN):
+    """3 câu hỏi ngẫu nhiên của topic (tránh câu user vừa gặp); None nếu ngân hàng còn ít hơn minimum câu."""
+    key = _bank_topic(topic)
+    if len(speaking_bank.ids_for((key, None))) < max(1, minimum):
+        return None
+    picked = speaking_bank.sample(key, None, 3, user_id=user_id)
+    by_id = {q.id: q.question for q in SpeakingQuestion.query.filter(SpeakingQuestion.id.in_(picked))}
+    return [by_id[i] for i in picked if i in by_id] or None
+
+
+def _grow_bank(topic, questions):
+    """Cất câu hỏi AI vừa sinh vào ngân hàng; lỗi DB chỉ in log, không làm hỏng lượt bắt đầu phiên."""
+    key = _bank_topic(topic)
+    rows = {}
+    for question in questions:
+        h = Quiz.hash_question(question)
+        rows.setdefault(h, dict(topic=key, question=question, question_hash=h, created_at=datetime.utcnow()))
+    if not rows:
+        return
+    try:
+        existing = {h for (h,) in db.session.query(SpeakingQuestion.question_hash)
+                    .filter(SpeakingQuestion.topic == key, SpeakingQuestion.question_hash.in_(list(rows)))}
+        new_rows = [row for h, row in rows.items() if h not in existing]
+        if not new_rows:
+            return
+        insert_ignore(db.session, SpeakingQuestion.__table__, new_rows)
+        new_ids = [i for (i,) in db.session.query(SpeakingQuestion.id).filter(
+            SpeakingQuestion.topic == key,
+            SpeakingQuestion.question_hash.in_([row["question_hash"] for row in new_rows]))]
+        db.session.commit()
+        speaking_bank.add_ids((key, None), new_ids)
+    except Exception as db_err:
+        db.session.rollback()
+        print(f"⚠️ [SPEAKING] Không lưu được câu hỏi vào ngân hàng: {db_err}")
+
+
+def _speaking_start_input(data):
+    """(topic, user_id) từ body /ai/speaking/start."""
+    return (data.get("topic") or "daily life").strip(), data.get("user_id")
+
+
+def _session_row(topic, user_id):
+    """Dòng speaking_sessions cho phiên mới."""
+    return dict(id=str(uuid4()), user_id=user_id, topic=topic, created_at=datetime.utcnow())
+
+
+def _speaking_start_payload(session, questions, source):
+    return {"session_id": session["id"], "topic": session["topic"], "questions": questions, "source": source}
+
+
+def _speaking_questions(topic, user_id):
+    """(câu hỏi, nguồn): "bank" nếu ngân hàng đủ lớn, ngược lại "ai" (và ngân hàng lớn thêm)."""
+    questions = _bank_questions(topic, user_id)
+    if questions:
+        return questions, "bank"
+    try:
+        questions = _split_questions(_chat(_speaking_start_messages(topic), 0.8, 400))
+    except AI_UNAVAILABLE:
+        # AI quá tải: dùng tạm các câu đã có dù ngân hàng chưa đủ ngưỡng
+        questions = _bank_questions(topic, user_id, minimum=1)
+        if not questions:
+            raise
+        return questions, "bank"
+    _grow_bank(topic, questions)
+    return questions, "ai"
+
+
 @ai_bp.route("/ai/speaking/start", methods=["POST"])
 def ai_speaking_start():
     """
     📚 Gọi 1 lần → sinh ra 3 câu hỏi luyện nói (Part 1)
     """
     try:
-        data = request.get_json(silent=True) or {}
-        topic = (data.get("topic") or "daily life").strip()
-
-        prompt = f"Hãy tạo 3 câu hỏi luyện nói IELTS Speaking Part 1, chủ đề '{topic}', viết bằng tiếng Anh. \
-Mỗi câu hỏi nên ngắn gọn, tự nhiên như trong bài thi thật."
-
-        resp = requests.post(
-            f"{OPENAI_BASE}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {AI_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": OPENAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": "Bạn là giám khảo IELTS tạo câu hỏi Speaking Part 1."},
-                    {"role": "user", "content": prompt},
-                ],
-                "temperature": 0.8,
-                "max_tokens": 400,
-            },
-            timeout=25,
-        )
+        topic, user_id = _speaking_start_input(request.get_json(silent=True) or {})  # user_id do Flutter gửi lên
 
-        data_ai = resp.json()
-        text = (
-            data_ai.get("choices", [{}])[0]
-                   .get("message", {})
-                   .get("content", "")
-                   .strip()
-        )
+        questions, source = _speaking_questions(topic, user_id)
 
-        # Tách thành 3 câu hỏi (bằng dấu ?)
-        raw_qs = [q.strip("-• \n") for q in text.replace("\n", " ").split("?") if q.strip()]
-        questions = [q + "?" for q in raw_qs[:3]]
-        
-        # BỎ ĐOẠN NÀY:
-        # _sessions[session_id] = { ... } 
-
-        # THAY BẰNG ĐOẠN NÀY:
-        session_id = str(uuid4())
-        new_session = SpeakingSession(
-            id=session_id,
-            user_id=data.get("user_id"), # Lấy user_id từ Flutter gửi lên
-            topic=topic,
-            created_at=datetime.utcnow()
-        )
-        db.session.add(new_session)
-        db.session.commit() # Lưu vào bảng speaking_sessions
+        # Lưu vào bảng speaking_sessions ngay (không qua write-behind): lượt trả lời có thể tới worker khác
+        session = _session_row(topic, user_id)
+        db.session.add(SpeakingSession(**session))
+        db.session.commit()
 
-        return jsonify({
-            "session_id": session_id,
-            "topic": topic,
-            "questions": questions,
-        }), 200
+        return jsonify(_speaking_start_payload(session, questions, source)), 200
 
+    except AI_UNAVAILABLE:
+        return jsonify({"error": BUSY_REPLY}), 503
     except Exception as e:
         return jsonify({"error": f"Exception: {e}"}), 500
 
@@ -152,6 +370,82 @@ Mỗi câu hỏi nên ngắn gọn, tự nhiên như trong bài thi thật."
 # ============================================================
 # 💬 3️⃣ Speaking Feedback – chấm từng câu trả lời học sinh
 # ============================================================
+def _session_exists(session_id):
+    return db.session.get(SpeakingSession, session_id) is not None
+
+
+def _feedback_input(data):
+    """(lượt trả lời {session_id, question, answer}, lỗi) từ body /ai/speaking/feedback."""
+    if not data.get("session_id"):
+        return None, "Thiếu session_id"
+    return {
+        "session_id": data.get("session_id"),
+        "question": data.get("question"),
+        "answer": (data.get("answer") or "").strip(),
+    }, None
+
+
+def _turn_row(turn, feedback):
+    return dict(
+        id=str(uuid4()),
+        session_id=turn["session_id"],
+        question_text=turn["question"],
+        answer_text=turn["answer"],
+        feedback=feedback,
+        created_at=datetime.utcnow()
+    )
+
+
+def _feedback_payload(turn, feedback):
+    return {"session_id": turn["session_id"], "question": turn["question"], "feedback": feedback}
+
+
+def _save_turn(turn, feedback):
+    try:
+        append_rows(SpeakingTurn, [_turn_row(turn, feedback)])
+    except Exception as db_err:
+        db.session.rollback()
+        print(f"Lưu database thất bại: {db_err}")
+
+
+def _feedback_events(turn, messages):
+    stream = _stream_chat(messages, 0.7, 200)
+    parts = []
+    try:
+        for text in stream:
+            parts.append(text)
+            yield _sse({"delta": text})
+    except GeneratorExit:
+        # Client ngắt kết nối giữa chừng: đọc nốt phần còn lại để vẫn lưu được lượt trả lời
+        try:
+            parts.extend(stream)
+        except Exception:
+            pass
+        _save_turn(turn, "".join(parts).strip() or DEFAULT_FEEDBACK)
+        raise
+    except AI_UNAVAILABLE:
+        pass  # Dùng DEFAULT_FEEDBACK như khi AI trả rỗng
+    except Exception as e:
+        yield _sse({"error": f"Exception: {e}"}, event="error")
+        return
+
+    feedback = "".join(parts).strip() or DEFAULT_FEEDBACK
+    _save_turn(turn, feedback)
+    yield _sse(_feedback_payload(turn, feedback), event="done")
+
+def _feedback_messages(question, answer):
+    prompt = f"""
+        You are an IELTS speaking examiner.
+        Evaluate the student's answer below for the question:
+        Question: {question}
+        Answer: {answer}
+        Give a short feedback (1-3 sentences) in English, mentioning pronunciation, vocabulary, and fluency briefly.
+        """
+    return [
+        {"role": "system", "content": "You are a friendly IELTS speaking examiner."},
+        {"role": "user", "content": prompt.strip()},
+    ]
+
 @ai_bp.route("/ai/speaking/feedback", methods=["POST"])
 def ai_speaking_feedback():
     """
@@ -159,73 +453,244 @@ def ai_speaking_feedback():
     """
     try:
         data = request.get_json(silent=True) or {}
-        session_id = data.get("session_id")
-        answer = (data.get("answer") or "").strip()
-        question = data.get("question")
-        
+        turn, error = _feedback_input(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        if not _session_exists(turn["session_id"]):
+            return jsonify({"error": SESSION_NOT_FOUND}), 404
+
+        messages = _feedback_messages(turn["question"], turn["answer"])
+
+        if _stream_requested(data):
+            return _sse_response(_feedback_events(turn, messages))
+
+        try:
+            feedback = _chat(messages, 0.7, 200)
+        except AI_UNAVAILABLE:
+            feedback = ""
+
+        feedback = feedback or DEFAULT_FEEDBACK
+        _save_turn(turn, feedback)
+
+        return jsonify(_feedback_payload(turn, feedback)), 200
 
-        if not session_id:
-            return jsonify({"error": "Thiếu session_id"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Exception: {e}"}), 500
+
+
+# ============================================================
+# 📦 4️⃣ Speaking Feedback theo lô – chấm cả phiên trong một lần gọi AI
+# Body: {"session_id": "...", "answers": [{"question": "...", "answer": "..."}, ...]}
+# ============================================================
+SPEAKING_BATCH_MAX = int(os.getenv("SPEAKING_BATCH_MAX", 10))
 
-        session_record = SpeakingSession.query.get(session_id)
-        if not session_record:
-            return jsonify({"error": "Phiên học không tồn tại trong hệ thống"}), 404
 
-        prompt = f"""
+def _batch_items(data):
+    """(items, lỗi): items là list {"question", "answer"} đã làm sạch; lỗi là chuỗi báo cho client."""
+    answers = data.get("answers")
+    if not isinstance(answers, list) or not answers:
+        return None, "Thiếu answers"
+    if len(answers) > SPEAKING_BATCH_MAX:
+        return None, f"Tối đa {SPEAKING_BATCH_MAX} câu trả lời mỗi lần"
+    items = []
+    for a in answers:
+        if not isinstance(a, dict):
+            return None, "answers phải là danh sách {question, answer}"
+        items.append({"question": a.get("question"), "answer": (a.get("answer") or "").strip()})
+    return items, None
+
+
+def _batch_input(data):
+    """(session_id, items, lỗi) từ body /ai/speaking/feedback-batch."""
+    if not data.get("session_id"):
+        return None, None, "Thiếu session_id"
+    items, error = _batch_items(data)
+    return data.get("session_id"), items, error
+
+
+def _batch_feedback_messages(items):
+    numbered = [{"index": i, "question": it["question"], "answer": it["answer"]} for i, it in enumerate(items)]
+    prompt = f"""
         You are an IELTS speaking examiner.
-        Evaluate the student's answer below for the question:
-        Question: {question}
-        Answer: {answer}
-        Give a short feedback (1-3 sentences) in English, mentioning pronunciation, vocabulary, and fluency briefly.
+        Evaluate each student's answer below for its question.
+        Items (JSON): {json.dumps(numbered, ensure_ascii=False)}
+        For every item give a short feedback (1-3 sentences) in English, mentioning pronunciation, vocabulary, and fluency briefly.
+        Return ONLY a JSON object: {{"feedback": [{{"index": 0, "feedback": "..."}}]}} with one entry per item.
         """
+    return [
+        {"role": "system", "content": "You are a friendly IELTS speaking examiner."},
+        {"role": "user", "content": prompt.strip()},
+    ]
 
-        resp = requests.post(
-            f"{OPENAI_BASE}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {AI_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": OPENAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": "You are a friendly IELTS speaking examiner."},
-                    {"role": "user", "content": prompt.strip()},
-                ],
-                "temperature": 0.7,
-                "max_tokens": 200,
-            },
-            timeout=25,
-        )
 
-        fb_data = resp.json()
-        feedback = (
-            fb_data.get("choices", [{}])[0]
-                   .get("message", {})
-                   .get("content", "")
-                   .strip()
-        )
+def _batch_feedback_result(items, text):
+    """Ghép feedback AI trả về theo index; câu nào thiếu / JSON hỏng → DEFAULT_FEEDBACK."""
+    by_index = {}
+    try:
+        for entry in parse_json_reply(text).get("feedback") or []:
+            if isinstance(entry, dict) and isinstance(entry.get("feedback"), str):
+                by_index[entry.get("index")] = entry["feedback"].strip()
+    except ValueError as e:
+        print(f"⚠️ [SPEAKING] Feedback theo lô không đúng JSON: {e}")
+    return [by_index.get(i) or DEFAULT_FEEDBACK for i in range(len(items))]
+
+
+def _batch_turn_rows(session_id, items, feedbacks):
+    # Cách nhau 1 micro giây → lịch sử giữ đúng thứ tự câu hỏi trong lô
+    now = datetime.utcnow()
+    return [dict(
+        id=str(uuid4()),
+        session_id=session_id,
+        question_text=it["question"],
+        answer_text=it["answer"],
+        feedback=feedback,
+        created_at=now + timedelta(microseconds=i),
+    ) for i, (it, feedback) in enumerate(zip(items, feedbacks))]
+
+
+def _batch_payload(session_id, items, feedbacks):
+    return {
+        "session_id": session_id,
+        "results": [
+            {"question": it["question"], "answer": it["answer"], "feedback": feedback}
+            for it, feedback in zip(items, feedbacks)
+        ],
+    }
+
+
+@ai_bp.route("/ai/speaking/feedback-batch", methods=["POST"])
+def ai_speaking_feedback_batch():
+    """
+    Chấm tất cả câu trả lời của một phiên: 1 lần tra session, 1 lần gọi AI (JSON), 1 lệnh insert hàng loạt.
+    """
+    try:
+        session_id, items, error = _batch_input(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
+
+        if not _session_exists(session_id):
+            return jsonify({"error": SESSION_NOT_FOUND}), 404
 
-        if not feedback:
-            feedback = "Good effort! Try to speak more naturally next time."
         try:
-            new_turn = SpeakingTurn(
-                id=str(uuid4()),
-                session_id=session_id,
-                question_text=question,
-                answer_text=answer,
-                feedback=feedback
-            )
-            db.session.add(new_turn)
-            db.session.commit()
-        except Exception as db_err:
-            db.session.rollback()
-            print(f"Lưu database thất bại: {db_err}")
+            text = _chat(_batch_feedback_messages(items), 0.7, 150 * len(items),
+                         response_format={"type": "json_object"})
+        except AI_UNAVAILABLE:
+            text = ""
+        feedbacks = _batch_feedback_result(items, text)
+
+        append_rows(SpeakingTurn, _batch_turn_rows(session_id, items, feedbacks))
 
-        return jsonify({
-            "session_id": session_id,
-            "question": question,
-            "feedback": feedback,
-        }), 200
+        return jsonify(_batch_payload(session_id, items, feedbacks)), 200
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({"error": f"Exception: {e}"}), 500
+
+
+# ============================================================
+# 📜 5️⃣ Lịch sử luyện nói – phân trang theo con trỏ (created_at, id)
+# Không dùng OFFSET/COUNT: mỗi trang là một lần quét đoạn index (user_id, created_at) hoặc
+# (session_id, created_at) → thời gian không đổi dù bảng có hàng chục triệu dòng.
+#   GET /ai/speaking/history?limit=20&cursor=...               các phiên của user, mới nhất trước
+#   GET /ai/speaking/history/<session_id>?limit=50&cursor=...  các lượt của phiên, theo thứ tự thời gian
+# Bắt buộc token (Authorization: Bearer ...); ?user_id=... của client cũ chỉ được nhận khi trùng user của token.
+# ============================================================
+HISTORY_PAGE_MAX = 100
+
+
+def _encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """(created_at, id) từ chuỗi cursor; cursor hỏng → ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except Exception:
+        raise ValueError("cursor không hợp lệ")
+
+
+def _page_limit(default):
+    limit = request.args.get("limit", default, type=int) or default
+    return max(1, min(limit, HISTORY_PAGE_MAX))
+
+
+def _keyset_page(query, model, cursor, limit, descending):
+    """Một trang theo (created_at, id); trả về (rows, next_cursor hoặc None nếu đã hết)."""
+    if cursor:
+        at, row_id = _decode_cursor(cursor)
+        # Điều kiện created_at <= / >= riêng để DB giới hạn đoạn quét index ngay tại con trỏ
+        # (chỉ có OR thì SQLite/MySQL có thể quét lại toàn bộ các trang trước)
+        if descending:
+            query = query.filter(model.created_at <= at, or_(model.created_at < at, model.id < row_id))
+        else:
+            query = query.filter(model.created_at >= at, or_(model.created_at > at, model.id > row_id))
+    order = (model.created_at.desc(), model.id.desc()) if descending else (model.created_at, model.id)
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], _encode_cursor(last.created_at, last.id)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+@ai_bp.route("/ai/speaking/history", methods=["GET"])
+def ai_speaking_history():
+    user_id = token_user_id()
+    if not user_id:
+        return jsonify({"error": "Cần đăng nhập"}), 401
+    if request.args.get("user_id") not in (None, "", user_id):
+        return jsonify({"error": "Không xem được lịch sử của tài khoản khác"}), 403
+    try:
+        sessions, next_cursor = _keyset_page(
+            SpeakingSession.query.filter(SpeakingSession.user_id == user_id),
+            SpeakingSession, request.args.get("cursor"), _page_limit(20), descending=True,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "sessions": [
+            {"session_id": s.id, "topic": s.topic, "created_at": _iso(s.created_at)} for s in sessions
+        ],
+        "next_cursor": next_cursor,
+    }), 200
+
+
+@ai_bp.route("/ai/speaking/history/<session_id>", methods=["GET"])
+def ai_speaking_history_turns(session_id):
+    user_id = token_user_id()
+    if not user_id:
+        return jsonify({"error": "Cần đăng nhập"}), 401
+    session_record = db.session.get(SpeakingSession, session_id)
+    if not session_record:
+        return jsonify({"error": SESSION_NOT_FOUND}), 404
+    if session_record.user_id != user_id:
+        return jsonify({"error": "Phiên học không thuộc tài khoản này"}), 403
+    try:
+        turns, next_cursor = _keyset_page(
+            SpeakingTurn.query.filter(SpeakingTurn.session_id == session_id),
+            SpeakingTurn, request.args.get("cursor"), _page_limit(50), descending=False,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "session_id": session_id,
+        "topic": session_record.topic,
+        "created_at": _iso(session_record.created_at),
+        "turns": [{
+            "question": t.question_text,
+            "answer": t.answer_text,
+            "feedback": t.feedback,
+            "created_at": _iso(t.created_at),
+        } for t in turns],
+        "next_cursor": next_cursor,
+    }), 200
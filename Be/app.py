@@ -1,14 +1,27 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import hashlib
+import secrets
 import logging
+import multiprocessing
+import time
 from datetime import datetime
 from uuid import uuid4
-from flask import Flask, request, jsonify, send_from_directory
+import click
+from flask import Flask, request, jsonify, send_from_directory, send_file, g, Response
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from auth import hash_password, verify_password, issue_token, token_user_id, HashingBusy, TOKEN_TTL
 from dotenv import load_dotenv
+from sqlalchemy import event, func, inspect
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.dialects import mysql
+from ttl_cache import TTLCache
+from db_helpers import add_missing_schema, insert_ignore, upsert_increment
+from blob_store import BlobStore, InvalidImage, decode_base64_image
+from write_behind import WriteBehindBuffer
+import metrics
 
 # ============================================================
 # 🔐 1. NẠP CẤU HÌNH & KHỞI TẠO APP
@@ -17,6 +30,8 @@ load_dotenv("ai.env")
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 app.config['JSON_AS_ASCII'] = False 
+# Khoá ký token đăng nhập: mọi worker phải dùng chung một giá trị → đặt SECRET_KEY trong env
+app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 # Cấu hình CORS mở rộng để tránh lỗi Preflight/Options
@@ -53,13 +68,98 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "connect_args": {"ssl": {"fake_config": True}} if "aivencloud" in str(DATABASE_URL) else {}
 }
 
+# Chạy local: python app.py, FLASK_DEBUG=1, hoặc DB nằm trên máy này
+_LOCAL_RUN = __name__ == "__main__" or os.getenv("FLASK_DEBUG") == "1" or DATABASE_URL.startswith("sqlite") \
+    or any(host in DATABASE_URL for host in ("@127.0.0.1", "@localhost"))
+
+# Process con của pool băm mật khẩu (auth.py) chạy lại file chạy chính (python app.py / main.py) khi khởi động:
+# (tên process đã được đặt trước lúc đó) → chỉ cần định nghĩa, bỏ qua việc khởi động của worker (SECRET_KEY, blueprint, schema...)
+_MP_CHILD = multiprocessing.current_process().name != "MainProcess"
+
+if not app.config['SECRET_KEY'] and not _MP_CHILD:
+    # Không tự suy khoá từ DATABASE_URL: ai biết URL DB là giả được token của mọi user
+    if not _LOCAL_RUN:
+        raise RuntimeError("Thiếu SECRET_KEY trong env (ai.env hoặc .env): cần một khoá bí mật dùng chung cho mọi worker")
+    print("⚠️ [SYSTEM] Thiếu SECRET_KEY, đang dùng khoá ngẫu nhiên của process này: "
+          "token đăng nhập mất hiệu lực khi khởi động lại và không dùng được giữa các worker.")
+    app.config['SECRET_KEY'] = secrets.token_hex(32)
+
 # Khởi tạo đối tượng DB
 db = SQLAlchemy(app)
+
+# Kho ảnh đại diện theo nội dung (sha256) trên đĩa
+avatar_store = BlobStore(
+    os.getenv("AVATAR_STORE_DIR") or os.path.join(app.root_path, "blobs", "avatars"),
+    thumb_size=int(os.getenv("AVATAR_THUMB_SIZE", 128)),
+)
+# avatar_store mặc định nằm trên đĩa local của instance (mất khi deploy lại, không chung giữa các máy):
+# users.avatar vẫn là bản gốc, avatar_store chỉ là bản sao phục vụ nhanh và được dựng lại từ DB khi thiếu.
+# Chỉ đặt AVATAR_DROP_DB_COPY=1 khi AVATAR_STORE_DIR là ổ dùng chung và bền (volume, NFS...).
+AVATAR_DROP_DB_COPY = os.getenv("AVATAR_DROP_DB_COPY", "0") in ("1", "true", "True")
 @app.before_request
 def handle_db_session():
     # Đảm bảo mỗi request đều có một session sạch sẽ
     if db.session.is_active is False:
         db.session.rollback()
+
+# ===== 📈 SỐ LIỆU REQUEST & CONNECTION POOL =====
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds",
+    "Thời gian xử lý request theo blueprint/route (giây, tới khi trả header)",
+    ("blueprint", "endpoint", "method", "status"),
+)
+DB_POOL_WAIT = metrics.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Thời gian chờ lấy connection từ pool SQLAlchemy (giây)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL = metrics.gauge("db_pool_connections", "Connection trong pool SQLAlchemy theo trạng thái", ("state",))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        REQUEST_LATENCY.observe(
+            request.blueprint or "core",
+            request.endpoint or "unmatched",  # 404 không khớp route nào: gộp chung, tránh nổ số series
+            request.method,
+            response.status_code,
+            value=time.perf_counter() - started,
+        )
+    return response
+
+def _instrument_pool(pool):
+    """Bọc pool._do_get để đo thời gian chờ checkout (SQLAlchemy không có event trước khi chờ)."""
+    if getattr(pool, "_metrics_wrapped", False):
+        return
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_WAIT.observe(value=time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+    pool._metrics_wrapped = True
+
+@metrics.on_scrape
+def collect_core_metrics():
+    pool = db.engine.pool
+    _instrument_pool(pool)  # engine.dispose() tạo pool mới → bọc lại
+    for state, fn in (("size", "size"), ("checked_out", "checkedout"), ("checked_in", "checkedin"), ("overflow", "overflow")):
+        if hasattr(pool, fn):  # SQLite/StaticPool không có đủ các hàm này
+            DB_POOL.set(state, value=getattr(pool, fn)())
+    stats = dictionary_memo.stats()
+    metrics.export_cache("dictionary", stats["hits"], stats["misses"], stats["size"], stats["negative_hits"])
+
+with app.app_context():
+    _instrument_pool(db.engine.pool)
 # ============================================================
 # 📋 3. MODELS (Cấu trúc dữ liệu)
 # ============================================================
@@ -72,7 +172,10 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     xp = db.Column(db.Integer, default=0)
     streak = db.Column(db.Integer, default=0)
-    avatar = db.Column(db.Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=True)
+    # Ảnh gốc base64 (tới 16MB): bản lưu bền của ảnh đại diện, không nạp cùng user
+    avatar = db.deferred(db.Column(db.Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=True))
+    # sha256 của ảnh trong avatar_store, phục vụ qua GET /avatars/<hash>
+    avatar_hash = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -82,7 +185,8 @@ class User(db.Model):
             "username": self.username, 
             "xp": self.xp, 
             "streak": self.streak, 
-            "avatar": self.avatar
+            "avatar_url": f"/avatars/{self.avatar_hash}" if self.avatar_hash else None,
+            "avatar_thumb_url": f"/avatars/{self.avatar_hash}?size=thumb" if self.avatar_hash else None
         }
 
 class DictionaryCache(db.Model):
@@ -97,8 +201,28 @@ class DictionaryCache(db.Model):
     examples = db.Column(db.Text)
     grammar_notes = db.Column(db.Text)
 
+    def to_dict(self):
+        return {
+            "word": self.word,
+            "phonetic": self.phonetic,
+            "word_type": self.word_type,
+            "definition": self.definition,
+            "examples": self.examples,
+            "grammar_notes": self.grammar_notes
+        }
+
+# Cache tra từ trong RAM của mỗi worker, đứng trước bảng dictionary_cache.
+# Key là từ đã chuẩn hoá (lowercase), value là DictionaryCache.to_dict() hoặc None (không có trong DB).
+dictionary_memo = TTLCache(
+    maxsize=int(os.getenv("DICT_CACHE_SIZE", 5000)),
+    ttl=float(os.getenv("DICT_CACHE_TTL", 3600)),
+    negative_ttl=float(os.getenv("DICT_CACHE_NEGATIVE_TTL", 30)),
+)
+
 class Quiz(db.Model):
     __tablename__ = "quizzes"
+    # Đọc mảng id theo pool (topic, level) cho bộ lấy mẫu quiz
+    __table_args__ = (db.Index("ix_quizzes_topic_level", "topic", "level"),)
     id = db.Column(db.Integer, primary_key=True)
     topic = db.Column(db.String(100), index=True)
     level = db.Column(db.String(50), index=True)
@@ -107,9 +231,49 @@ class Quiz(db.Model):
     options = db.Column(db.Text) 
     answer = db.Column(db.Integer)
     explanation = db.Column(db.Text)
+    # sha256 của câu hỏi đã chuẩn hoá → kiểm tra trùng bằng unique index thay vì so sánh cột TEXT
+    question_hash = db.Column(db.String(64), unique=True, index=True)
+
+    @staticmethod
+    def hash_question(text):
+        normalized = re.sub(r"\s+", " ", (text or "").strip().lower())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+class QuizCounter(db.Model):
+    """
+    Số câu hỏi của từng pool (topic, level), cập nhật cùng transaction với mỗi lần thêm/xoá Quiz
+    → get_quiz không phải COUNT(*) trên bảng quizzes.
+    Thêm/xoá bằng ORM được đếm tự động qua mapper event; insert hàng loạt thì gọi QuizCounter.bump().
+    Lệnh sửa số liệu: flask --app app rebuild-quiz-counts / check-quiz-counts.
+    """
+    __tablename__ = "quiz_counters"
+    topic = db.Column(db.String(100), primary_key=True)
+    level = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(executor, topic, level, delta):
+        if delta:
+            upsert_increment(executor, QuizCounter.__table__,
+                             {"topic": topic or "", "level": level or ""}, "count", delta)
+
+    @staticmethod
+    def get(topic, level):
+        row = db.session.get(QuizCounter, (topic or "", level or ""))
+        return row.count if row else 0
+
+@event.listens_for(Quiz, "after_insert")
+def _count_quiz_insert(mapper, connection, target):
+    QuizCounter.bump(connection, target.topic, target.level, 1)
+
+@event.listens_for(Quiz, "after_delete")
+def _count_quiz_delete(mapper, connection, target):
+    QuizCounter.bump(connection, target.topic, target.level, -1)
 
 class SpeakingSession(db.Model):
     __tablename__ = "speaking_sessions"
+    # Lịch sử phiên của user (phân trang theo created_at, id)
+    __table_args__ = (db.Index("ix_speaking_sessions_user_created", "user_id", "created_at"),)
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), index=True)
     topic = db.Column(db.String(255))
@@ -117,11 +281,92 @@ class SpeakingSession(db.Model):
 
 class SpeakingTurn(db.Model):
     __tablename__ = "speaking_turns"
+    # Các lượt của một phiên theo thứ tự thời gian (phân trang theo created_at, id)
+    __table_args__ = (db.Index("ix_speaking_turns_session_created", "session_id", "created_at"),)
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     session_id = db.Column(db.String(36), db.ForeignKey('speaking_sessions.id'))
     question_text = db.Column(db.Text)
     answer_text = db.Column(db.Text)
     feedback = db.Column(db.Text)
+    # Có phần micro giây (MySQL DATETIME(6)) để các lượt chấm cùng lô vẫn giữ đúng thứ tự
+    created_at = db.Column(db.DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), default=datetime.utcnow)
+
+class SpeakingQuestion(db.Model):
+    """
+    Ngân hàng câu hỏi Speaking Part 1 theo topic (đã chuẩn hoá chữ thường), lớn dần từ câu AI sinh ra.
+    Trùng lặp được chặn bằng unique (topic, question_hash), hash giống Quiz.hash_question.
+    """
+    __tablename__ = "speaking_questions"
+    __table_args__ = (db.UniqueConstraint("topic", "question_hash", name="uq_speaking_questions_topic_hash"),)
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(255), nullable=False, index=True)
+    question = db.Column(db.Text, nullable=False)
+    question_hash = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Conversation(db.Model):
+    """
+    Hội thoại /ai/chat lưu phía server: các tin nhắn gần đây giữ nguyên văn, phần cũ hơn được gộp
+    vào summary (tóm tắt cuốn chiếu) → prompt không phình theo độ dài cuộc trò chuyện.
+    """
+    __tablename__ = "conversations"
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), index=True)
+    summary = db.Column(db.Text)
+    # id của ConversationMessage cuối cùng đã được gộp vào summary (0 = chưa gộp gì)
+    summarized_until = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ConversationMessage(db.Model):
+    __tablename__ = "conversation_messages"
+    __table_args__ = (db.Index("ix_conversation_messages_conversation_id", "conversation_id", "id"),)
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
+    role = db.Column(db.String(16), nullable=False)  # user / assistant
+    content = db.Column(db.Text, nullable=False)
+    tokens = db.Column(db.Integer, nullable=False, default=0)  # Ước lượng, xem ai_routes.estimate_tokens
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# ===== Ghi trễ cho bản ghi chỉ-thêm (phiên nói, lượt trả lời) =====
+# Gom nhiều dòng thành một INSERT + một commit ở thread nền thay vì commit từng dòng trong request.
+# Chỉ đệm lượt trả lời; phiên nói ghi ngay trong request vì lượt trả lời ở worker khác tham chiếu tới nó.
+# WRITE_BEHIND=0 để ghi ngay như trước.
+def _write_rows(table, rows):
+    with app.app_context():
+        try:
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+write_behind = WriteBehindBuffer(
+    _write_rows,
+    [SpeakingTurn.__table__],
+    max_batch=int(os.getenv("WRITE_BEHIND_BATCH", 200)),
+    flush_interval=float(os.getenv("WRITE_BEHIND_INTERVAL", 0.5)),
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10000)),
+    drain_timeout=float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", 10)),
+    enabled=os.getenv("WRITE_BEHIND", "1") not in ("0", "false", "False") and not _MP_CHILD,
+    row_errors=(IntegrityError, DataError),  # Khoá ngoại sai, dữ liệu quá dài...: chỉ bỏ dòng lỗi
+)
+
+def append_rows(model, rows):
+    """Thêm dòng cho bảng chỉ-thêm: qua write-behind nếu được, không thì INSERT + commit ngay."""
+    if not write_behind.add_many(model.__table__, rows):
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+WRITE_BEHIND_ROWS = metrics.counter("write_behind_rows_total", "Số dòng write-behind theo kết quả", ("result",))
+WRITE_BEHIND_PENDING = metrics.gauge("write_behind_pending", "Số dòng đang chờ ghi trong bộ đệm")
+
+@metrics.on_scrape
+def collect_write_behind_metrics():
+    stats = write_behind.stats()
+    for result in ("written", "rejected", "lost", "dropped"):
+        WRITE_BEHIND_ROWS.set(result, value=stats[result])
+    WRITE_BEHIND_PENDING.set(value=stats["pending"])
 
 # ============================================================
 # 🚀 4. ROUTES CƠ BẢN
@@ -144,7 +389,7 @@ def register():
         return jsonify({"error": "User exists"}), 409
     
     # Hash password
-    hashed_pw = generate_password_hash(data['password'])
+    hashed_pw = hash_password(data['password'])
     new_user = User(name=data['name'], username=data['username'], password=hashed_pw)
     
     db.session.add(new_user)
@@ -155,9 +400,13 @@ def register():
 def login():
     data = request.get_json()
     user = User.query.filter_by(username=data.get("username")).first()
-    if user and check_password_hash(user.password, data.get("password")):
-        return jsonify({"token": user.id, "user": user.to_dict()})
+    if user and verify_password(user.password, data.get("password")):
+        return jsonify({"token": issue_token(user.id), "expires_in": TOKEN_TTL, "user": user.to_dict()})
     return jsonify({"error": "Unauthorized"}), 401
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    return jsonify({"error": str(e)}), 503
 # --- YÊU CẦU BỔ SUNG: ĐẶT LẠI MẬT KHẨU ---
 @app.post("/reset-password")
 def reset_password():
@@ -172,21 +421,69 @@ def reset_password():
         return jsonify({"error": "Tên tài khoản không tồn tại"}), 404
 
     # Cập nhật mật khẩu mới (đã hash)
-    user.password = generate_password_hash(new_password)
+    user.password = hash_password(new_password)
     db.session.commit()
     
     return jsonify({"message": "Đặt lại mật khẩu thành công"}), 200
 
+# --- ẢNH ĐẠI DIỆN ---
+def _set_avatar(user, avatar_data):
+    """Lưu ảnh base64 vào avatar_store và giữ hash; cột avatar vẫn giữ ảnh gốc (xem AVATAR_DROP_DB_COPY). Chuỗi rỗng = gỡ ảnh."""
+    if avatar_data:
+        user.avatar_hash = avatar_store.put_image(decode_base64_image(avatar_data))
+        user.avatar = None if AVATAR_DROP_DB_COPY else avatar_data
+    else:
+        user.avatar_hash = None
+        user.avatar = None
+
+def _ensure_avatar_blob(digest):
+    """avatar_store thiếu ảnh (instance mới, đĩa bị xoá...) → ghi lại từ users.avatar. Trả về True nếu ảnh có sẵn."""
+    if avatar_store.exists(digest) and avatar_store.exists(digest, "thumb"):
+        return True
+    legacy = db.session.query(User.avatar) \
+        .filter(User.avatar_hash == digest, User.avatar.isnot(None)).limit(1).scalar()
+    if not legacy:
+        return False
+    try:
+        return avatar_store.put_image(decode_base64_image(legacy)) == digest
+    except InvalidImage:
+        return False
+
+@app.get("/avatars/<digest>")
+def get_avatar(digest):
+    variant = "thumb" if request.args.get("size") == "thumb" else None
+    if not BlobStore.is_valid_hash(digest) or not _ensure_avatar_blob(digest):
+        return jsonify({"error": "Avatar not found"}), 404
+    resp = send_file(
+        avatar_store.path(digest, variant),
+        mimetype=avatar_store.mimetype(digest, variant),
+        etag=f"{digest}.{variant or 'full'}",
+        max_age=31536000,
+        conditional=True,
+    )
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
 # --- TIẾN TRÌNH NGƯỜI DÙNG ---
 @app.post("/update-progress")
 def update_progress():
     data = request.get_json()
-    user = User.query.get(data.get("user_id"))
+    # Client mới gửi token (Authorization: Bearer ...), client cũ chỉ gửi user_id trong body
+    user_id = token_user_id()
+    if user_id and data.get("user_id") and str(data.get("user_id")) != str(user_id):
+        return jsonify({"error": "Forbidden"}), 403
+    user_id = user_id or data.get("user_id")
+    user = User.query.get(user_id) if user_id else None
     if not user: return jsonify({"error": "Not found"}), 404
     
     user.xp += int(data.get("xp_gain", 0))
     if data.get("streak"): user.streak = int(data.get("streak"))
-    if data.get("avatar"): user.avatar = data.get("avatar")
+    if data.get("avatar"):
+        try:
+            _set_avatar(user, data.get("avatar"))
+        except InvalidImage as e:
+            return jsonify({"error": str(e)}), 400
     
     db.session.commit()
     return jsonify(user.to_dict())
@@ -201,9 +498,12 @@ def update_avatar():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    user.avatar = avatar_data
+    try:
+        _set_avatar(user, avatar_data)
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 400
     db.session.commit()
-    return jsonify({"status": "success", "message": "Avatar updated"})
+    return jsonify({"status": "success", "message": "Avatar updated", "avatar_url": user.to_dict()["avatar_url"]})
 
 
 # --- CÁC TÍNH NĂNG PHỤ TRỢ ---
@@ -212,13 +512,15 @@ def cache_dict():
     data = request.get_json()
     existing = DictionaryCache.query.filter_by(word=data.get("word")).first()
     if not existing:
-        new_word = DictionaryCache(
+        existing = DictionaryCache(
             word=data.get("word"), phonetic=data.get("phonetic"),
             word_type=data.get("word_type"), definition=data.get("definition"),
             examples=data.get("examples"), grammar_notes=data.get("grammar_notes")
         )
-        db.session.add(new_word)
+        db.session.add(existing)
         db.session.commit()
+    # Ghi đè luôn kết quả "không có" đang nằm trong cache RAM
+    dictionary_memo.set((existing.word or "").strip().lower(), existing.to_dict())
     return jsonify({"status": "cached"})
 
 @app.get("/user-info/<user_id>")
@@ -226,29 +528,246 @@ def get_user_info(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    return jsonify(user.to_dict())
+    info = user.to_dict()
+    # Bản app đang chạy vẫn đọc trường "avatar" (base64) → chỉ gửi thumbnail, không gửi ảnh gốc.
+    # User chưa chuyển sang avatar_store (chưa chạy flask --app app migrate-avatars) thì gửi cột cũ như trước.
+    if user.avatar_hash:
+        info["avatar"] = avatar_store.read_base64(user.avatar_hash, "thumb") \
+            if _ensure_avatar_blob(user.avatar_hash) else None
+    else:
+        info["avatar"] = user.avatar
+    return jsonify(info)
 
 @app.post("/save-quiz")
 def save_quiz():
     data = request.get_json()
-    new_quiz = Quiz(
+    new_quiz = dict(
         topic=data.get("topic"), level=data.get("level"),
         question=data.get("question"), options=str(data.get("options")),
         answer=data.get("answer"), explanation=data.get("explanation"),
-        type=data.get("type", "text")
+        type=data.get("type", "text"), question_hash=Quiz.hash_question(data.get("question"))
     )
-    db.session.add(new_quiz)
+    inserted = insert_ignore(db.session, Quiz.__table__, [new_quiz])
+    QuizCounter.bump(db.session, new_quiz["topic"], new_quiz["level"], inserted)
     db.session.commit()
-    return jsonify({"status": "quiz saved"})
+    return jsonify({"status": "quiz saved" if inserted else "duplicate"})
+
+@app.get("/metrics")
+def metrics_endpoint():
+    # Định dạng text của Prometheus; số liệu là của worker đang trả lời request này
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.get("/health")
 def health():
     # Gọi cái này để đảm bảo bảng DB được tạo nếu chưa có (trên Cloud)
     with app.app_context():
         db.create_all()
+        upgrade_schema()
     return jsonify({"status": "ok", "db": "connected"})
 
 
+# ============================================================
+# 🛠️ LỆNH BẢO TRÌ (flask --app app <lệnh>)
+# ============================================================
+# Cột/index thêm vào bảng đã có sau khi deploy lần đầu: db.create_all() không sửa bảng cũ nên
+# upgrade_schema() tự ALTER TABLE khi worker khởi động (hoặc chạy tay: flask --app app upgrade-schema).
+# (model, các cột, các index)
+SCHEMA_UPGRADES = [
+    (Quiz, ("question_hash",), ("ix_quizzes_question_hash", "ix_quizzes_topic_level")),
+    (User, ("avatar_hash",), ("ix_users_avatar_hash",)),
+    (SpeakingSession, (), ("ix_speaking_sessions_user_created",)),
+    (SpeakingTurn, ("created_at",), ("ix_speaking_turns_session_created",)),
+]
+
+def _seed_quiz_counts():
+    """
+    DB có quizzes từ trước khi có quiz_counters: tạo bảng và đếm một lần từ quizzes, nếu không get_quiz thấy
+    mọi pool bằng 0 và bắt AI sinh thêm cho cả pool đã đầy. Bảng đã có dòng thì không làm gì.
+    """
+    if not inspect(db.engine).has_table(Quiz.__tablename__):
+        return []  # DB mới: create_all tạo cả hai bảng, counter được đếm dần qua mapper event
+    QuizCounter.__table__.create(db.engine, checkfirst=True)
+    if db.session.query(QuizCounter.topic).first() is not None or db.session.query(Quiz.id).first() is None:
+        return []
+    counts = _real_quiz_counts()
+    # insert_ignore: worker khác khởi động cùng lúc có thể vừa đếm xong
+    insert_ignore(db.session, QuizCounter.__table__,
+                  [dict(topic=t, level=l, count=n) for (t, l), n in counts.items()])
+    db.session.commit()
+    return [f"{QuizCounter.__tablename__} ({len(counts)} pool)"]
+
+def upgrade_schema():
+    """
+    Thêm các cột/index trong SCHEMA_UPGRADES còn thiếu, điền dữ liệu cho bảng mới suy ra từ bảng cũ và
+    điền các cột mới còn trống ở dòng cũ;
+    chạy lại nhiều lần không sao. Trả về các thay đổi.
+    """
+    changes = []
+    for model, columns, indexes in SCHEMA_UPGRADES:
+        changes += add_missing_schema(db.engine, model.__table__, columns, indexes)
+    changes += _seed_quiz_counts()
+    if inspect(db.engine).has_table(Quiz.__tablename__):
+        # Câu cũ chưa có hash thì /save-quiz không nhận ra câu mới trùng với chúng
+        filled, _ = _backfill_quiz_hashes()
+        if filled:
+            changes.append(f"question_hash cho {filled} câu quiz cũ")
+    filled = _backfill_speaking_times()
+    if filled:
+        changes.append(f"created_at cho {filled} phiên/lượt nói cũ")
+    if changes:
+        print(f"✅ [SCHEMA] Đã thêm: {', '.join(changes)}")
+    return changes
+
+@app.cli.command("upgrade-schema")
+def upgrade_schema_command():
+    """Thêm vào DB đang chạy các cột/index mới của model và điền chúng cho dữ liệu cũ (gồm các bước backfill-*)."""
+    changes = upgrade_schema()
+    print("✅ Schema đã đủ cột/index." if not changes else f"✅ Đã cập nhật {len(changes)} mục.")
+
+def _backfill_quiz_hashes(batch_size=1000):
+    """
+    Điền question_hash cho các câu quiz cũ theo từng lô; câu trùng nội dung với câu đã có hash giữ NULL.
+    Trả về (số câu đã điền, số câu trùng).
+    """
+    last_id = filled = duplicates = 0
+    retries = 0
+    while True:
+        rows = Quiz.query.filter(Quiz.question_hash.is_(None), Quiz.id > last_id) \
+            .order_by(Quiz.id).limit(batch_size).all()
+        if not rows:
+            break
+        hashes = {q.id: Quiz.hash_question(q.question) for q in rows}
+        # Chỉ hỏi DB các hash của lô này thay vì nạp cả bảng vào RAM
+        seen = {h for (h,) in db.session.query(Quiz.question_hash).filter(Quiz.question_hash.in_(set(hashes.values())))}
+        batch_filled = batch_duplicates = 0
+        for q in rows:
+            h = hashes[q.id]
+            if h in seen:
+                batch_duplicates += 1
+                continue
+            q.question_hash = h
+            seen.add(h)
+            batch_filled += 1
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Worker khác (cùng khởi động) vừa điền một phần lô này: đọc lại lô
+            db.session.rollback()
+            retries += 1
+            if retries > 3:
+                raise
+            continue
+        filled += batch_filled
+        duplicates += batch_duplicates
+        last_id = rows[-1].id
+    return filled, duplicates
+
+@app.cli.command("backfill-quiz-hashes")
+def backfill_quiz_hashes():
+    """Điền question_hash cho các câu quiz cũ (upgrade_schema cũng tự chạy bước này)."""
+    filled, duplicates = _backfill_quiz_hashes()
+    print(f"✅ Đã điền {filled} question_hash, bỏ qua {duplicates} câu trùng nội dung.")
+
+@app.cli.command("migrate-avatars")
+def migrate_avatars():
+    """Đưa toàn bộ ảnh base64 trong users.avatar vào avatar_store (cột avatar chỉ bị xoá khi AVATAR_DROP_DB_COPY=1)."""
+    moved = failed = 0
+    last_id = ""
+    # Bật AVATAR_DROP_DB_COPY sau khi đã chuyển: chạy lại lệnh này để xoá cả bản DB của các ảnh đã có hash
+    pending = db.true() if AVATAR_DROP_DB_COPY else User.avatar_hash.is_(None)
+    while True:
+        users = User.query.options(db.undefer(User.avatar)) \
+            .filter(pending, User.avatar.isnot(None), User.id > last_id) \
+            .order_by(User.id).limit(100).all()
+        if not users:
+            break
+        for user in users:
+            try:
+                _set_avatar(user, user.avatar)
+                moved += 1
+            except InvalidImage:
+                failed += 1
+        last_id = users[-1].id
+        db.session.commit()
+    print(f"✅ Đã chuyển {moved} ảnh đại diện, {failed} ảnh không hợp lệ giữ nguyên.")
+
+def _backfill_speaking_times(batch_size=1000):
+    """
+    Điền created_at còn NULL (dữ liệu từ trước khi có cột): phiên → mốc 1970, lượt nói → thời điểm tạo phiên.
+    Lịch sử phân trang theo (created_at, id) nên không được còn dòng NULL. Trả về số dòng đã điền.
+    """
+    epoch = datetime(1970, 1, 1)
+    filled = 0
+    session_time = db.select(SpeakingSession.created_at) \
+        .where(SpeakingSession.id == SpeakingTurn.session_id).scalar_subquery()
+    for model, value in ((SpeakingSession, epoch), (SpeakingTurn, func.coalesce(session_time, epoch))):
+        if not inspect(db.engine).has_table(model.__tablename__):
+            continue  # DB mới: create_all tạo bảng sau
+        last_id = ""
+        while True:
+            ids = [i for (i,) in db.session.query(model.id)
+                   .filter(model.created_at.is_(None), model.id > last_id)
+                   .order_by(model.id).limit(batch_size)]
+            if not ids:
+                break
+            db.session.execute(db.update(model).where(model.id.in_(ids)).values(created_at=value)
+                               .execution_options(synchronize_session=False))
+            db.session.commit()
+            filled += len(ids)
+            last_id = ids[-1]
+    return filled
+
+@app.cli.command("backfill-speaking-turn-times")
+def backfill_speaking_turn_times():
+    """Điền created_at cho các phiên/lượt nói cũ (upgrade_schema cũng tự chạy bước này)."""
+    print(f"✅ Đã điền created_at cho {_backfill_speaking_times()} phiên/lượt nói.")
+
+@app.cli.command("prewarm-dictionary")
+@click.option("--batch-size", default=20, show_default=True, help="Số từ mỗi prompt gửi AI")
+@click.option("--workers", default=2, show_default=True, help="Số lô gọi AI song song")
+@click.option("--checkpoint", default=None, help="File lưu tiến độ (mặc định DICT_PREWARM_CHECKPOINT)")
+@click.option("--reset", is_flag=True, help="Bỏ qua checkpoint, làm lại từ đầu")
+@click.option("--seed-only", is_flag=True, help="Chỉ nạp dữ liệu có sẵn trong vocabulary.json, không gọi AI")
+def prewarm_dictionary(batch_size, workers, checkpoint, reset, seed_only):
+    """Nạp dictionary_cache từ static/assets/assets/vocabulary.json rồi nhờ AI điền các cột còn thiếu."""
+    import dictionary_prewarm
+    stats = dictionary_prewarm.prewarm(
+        batch_size=batch_size, workers=workers, checkpoint=checkpoint or dictionary_prewarm.CHECKPOINT_PATH,
+        reset=reset, enrich_missing=not seed_only,
+    )
+    print(f"✅ Prewarm từ điển: {stats}")
+
+def _real_quiz_counts():
+    rows = db.session.query(Quiz.topic, Quiz.level, func.count(Quiz.id)).group_by(Quiz.topic, Quiz.level)
+    counts = {}
+    for topic, level, n in rows:
+        key = (topic or "", level or "")
+        counts[key] = counts.get(key, 0) + n
+    return counts
+
+@app.cli.command("rebuild-quiz-counts")
+def rebuild_quiz_counts():
+    """Tính lại toàn bộ bảng quiz_counters từ bảng quizzes (trong một transaction)."""
+    counts = _real_quiz_counts()
+    QuizCounter.query.delete()
+    db.session.add_all(QuizCounter(topic=t, level=l, count=n) for (t, l), n in counts.items())
+    db.session.commit()
+    print(f"✅ Đã tính lại {len(counts)} pool, tổng {sum(counts.values())} câu hỏi.")
+
+@app.cli.command("check-quiz-counts")
+def check_quiz_counts():
+    """So sánh quiz_counters với COUNT thật; trả exit code 1 nếu lệch."""
+    real = _real_quiz_counts()
+    stored = {(c.topic, c.level): c.count for c in QuizCounter.query.all()}
+    mismatches = [(k, stored.get(k, 0), real.get(k, 0)) for k in sorted(set(real) | set(stored))
+                  if stored.get(k, 0) != real.get(k, 0)]
+    for (topic, level), have, want in mismatches:
+        print(f"⚠️ {topic}/{level}: counter={have}, thực tế={want}")
+    if mismatches:
+        raise SystemExit(1)
+    print(f"✅ {len(real)} pool khớp với số liệu thật.")
+
+
 # ============================================================
 # ⚙️ 5. ĐĂNG KÝ BLUEPRINTS (QUAN TRỌNG: ĐỂ NGOÀI __MAIN__)
 # ============================================================
@@ -269,7 +788,21 @@ def register_blueprints(application):
         print(f"⚠️ [ERROR] Lỗi khi nạp AI routes: {e}")
 
 # 🔥 GỌI HÀM NÀY NGAY TẠI ĐÂY ĐỂ SERVER PRODUCTION NẠP ĐƯỢC ROUTES
-register_blueprints(app)
+if not _MP_CHILD:
+    register_blueprints(app)
+
+# Bảng đã có từ bản trước thiếu cột mới → /login, quiz... lỗi "Unknown column": thêm ngay khi worker khởi động
+if os.getenv("DB_AUTO_UPGRADE", "1") not in ("0", "false", "False") and not _MP_CHILD:
+    try:
+        with app.app_context():
+            upgrade_schema()
+    except Exception as e:
+        print(f"⚠️ [SCHEMA] Không cập nhật được schema (chạy tay: flask --app app upgrade-schema): {e}")
+
+# Nạp sẵn từ điển từ vocabulary.json ở nền khi worker khởi động (xem dictionary_prewarm.py)
+if os.getenv("DICT_PREWARM_ON_STARTUP") == "1" and not _MP_CHILD:
+    import dictionary_prewarm
+    dictionary_prewarm.start_background()
 
 # ============================================================
 # 🏁 MAIN ENTRY POINT (Chỉ chạy khi run local: python app.py)
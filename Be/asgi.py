@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+"""
+⚡ Chế độ chạy async (ASGI) cho các route AI.
+
+Các route chủ yếu ngồi chờ HTTP tới AI (ai_chat, speaking start/feedback/feedback-batch, gemini_chat, batch-lookup, get_quiz)
+được viết lại bằng coroutine: gọi upstream bằng httpx.AsyncClient (async_upstream.py) và đọc/ghi DB bằng SQLAlchemy async,
+nên một process giữ được hàng trăm lời gọi LLM cùng lúc thay vì 4 thread/worker.
+Đọc body, dựng prompt và dựng response dùng chung hàm với bản Flask (ai_routes, gemini_routes, deepseek_routes);
+file này chỉ giữ các điểm await (gọi AI, đọc/ghi DB).
+/gemini/autocomplete chỉ đọc chỉ mục trong RAM nên cũng chạy thẳng trên event loop, không qua thread pool WSGI.
+Mọi route còn lại (đăng nhập, tiến độ học, ảnh đại diện, Flutter web...) vẫn là app Flask, chạy trong
+thread pool qua a2wsgi → hành vi không đổi.
+
+Chạy:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:app     (nhiều process)
+
+Cấu hình:
+    ASYNC_DATABASE_URL    URL DB cho driver async; mặc định suy ra từ DATABASE_URL
+                          (pymysql → aiomysql, postgresql → asyncpg, sqlite → aiosqlite)
+    ASYNC_DB_POOL_SIZE    số connection async tối đa (mặc định 10)
+    ASGI_WSGI_THREADS     số thread chạy các route Flask còn lại (mặc định 4)
+"""
+import asyncio
+import os
+import ssl
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import async_upstream
+import response_cache
+from app import (app as flask_app, db, DictionaryCache, Quiz, QuizCounter, SpeakingSession, SpeakingTurn,
+                 dictionary_memo, write_behind, REQUEST_LATENCY)
+from ttl_cache import MISSING
+from singleflight import AsyncSingleFlight
+from upstream import UpstreamHTTPError, UpstreamUnavailable
+from auth import verify_token
+from ai_routes import (AI_UNAVAILABLE, BUSY_REPLY, CHAT_PARAMS, CHAT_PROVIDERS, CONVERSATION_NOT_FOUND, DEFAULT_FEEDBACK,
+                       EMPTY_REPLY, SESSION_NOT_FOUND, chat_cache, chat_memory, chat_router, _bank_questions,
+                       _batch_feedback_messages, _batch_feedback_result, _batch_input, _batch_payload,
+                       _batch_turn_rows, _chat_cache_key, _chat_input, _chat_prompt, _chat_result,
+                       _fallback_reply, _feedback_input, _feedback_messages, _feedback_payload, _grow_bank,
+                       _memory_requested, _session_row, _speaking_start_input, _speaking_start_messages,
+                       _speaking_start_payload, _split_questions, _sse, _stream_requested, _turn_row)
+from gemini_routes import (GeminiLookupError, UNAVAILABLE_REPLY, autocomplete_index, dictionary_router,
+                           _autocomplete_payload, _batch_candidates,
+                           _batch_entries, _batch_payload as _lookup_batch_payload, _batch_words,
+                           _chat_lookup_messages,
+                           _dictionary_candidates, _dictionary_prompt, _entry_response, _gemini_request,
+                           _gemini_result, _batch_lemmas, _lookup_input, _memo_lookup, _memo_remember,
+                           _new_entry, _parse_entry, _store_batch)
+from deepseek_routes import (_emergency_payload, _pick_quiz_ids, _plan_quiz, _quiz_payload, _quiz_request)
+
+# ============================================================
+# 🗄️ DB async (cùng bảng, cùng model với app Flask)
+# ============================================================
+_ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_database_url():
+    if os.getenv("ASYNC_DATABASE_URL"):
+        return os.getenv("ASYNC_DATABASE_URL")
+    # Lấy URL từ engine của Flask-SQLAlchemy (đường dẫn sqlite tương đối đã được chuẩn hoá)
+    with flask_app.app_context():
+        url = db.engine.url
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.drivername, url.drivername)).render_as_string(hide_password=False)
+
+
+def _engine_options(url):
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_recycle": 280,
+        "pool_pre_ping": True,
+        "pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", 10)),
+    }
+    if "aivencloud" in url:
+        # Giống {"ssl": {"fake_config": True}} của bản Flask: bật SSL, không kiểm tra chứng chỉ
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        options["connect_args"] = {"ssl": context}
+    return options
+
+
+ASYNC_DATABASE_URL = _async_database_url()
+engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _in_app_context(fn, *args, **kwargs):
+    # Cho các hàm dùng chung với bản Flask còn đọc/ghi DB qua db.session (chạy trong threadpool)
+    with flask_app.app_context():
+        return fn(*args, **kwargs)
+
+
+def _token_user_id(request):
+    """Như auth.token_user_id cho request Starlette."""
+    header = request.headers.get("Authorization") or ""
+    if header.lower().startswith("bearer "):
+        return verify_token(header[7:].strip())
+    return None
+
+
+async def _insert_rows(model, rows):
+    async with Session() as session:
+        await session.execute(insert(model), rows)
+        await session.commit()
+
+
+async def _append_rows(model, rows):
+    """Như app.append_rows: qua write-behind nếu được, không thì INSERT bằng session async."""
+    if not write_behind.add_many(model.__table__, rows):
+        await _insert_rows(model, rows)
+
+
+async def _session_exists(session_id):
+    async with Session() as session:
+        return await session.get(SpeakingSession, session_id) is not None
+
+
+def _sse_response(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============================================================
+# 🤖 Gọi AI (bản async của các hàm trong ai_routes)
+# ============================================================
+async def _chat(messages, temperature, max_tokens, **extra):
+    _, text = await chat_router.acall([
+        (p.name, lambda p=p: p.acomplete(messages, temperature, max_tokens, **extra)) for p in CHAT_PROVIDERS
+    ])
+    return text
+
+
+async def _stream_chat(messages, temperature, max_tokens):
+    by_name = {p.name: p for p in CHAT_PROVIDERS}
+    provider = by_name[chat_router.rank(list(by_name))[0]]
+    resp = await provider.apost(messages, temperature, max_tokens, stream=True)
+    if resp.status_code >= 400:
+        await resp.aread()
+        await resp.aclose()
+        raise UpstreamHTTPError(provider.name, resp.status_code, resp.text[:120])
+    async for text in async_upstream.aiter_chat_stream(resp):
+        yield text
+
+
+async def _chat_payload(reply, memory, msg, cached=False):
+    # Có hội thoại server-side → lưu lượt hỏi/đáp bằng db.session trong threadpool
+    if memory is None:
+        return {"reply": reply, "cached": cached}
+    return await run_in_threadpool(_in_app_context, _chat_result, reply, memory, msg, cached)
+
+
+async def _cached_reply(cache_key):
+    # Backend sqlite đọc file (có thể chờ khoá) → không đọc trên event loop; backend RAM thì đọc thẳng
+    if isinstance(chat_cache.backend, response_cache.MemoryBackend) or chat_cache.backend is None:
+        return chat_cache.get(cache_key)
+    return await run_in_threadpool(chat_cache.get, cache_key)
+
+
+async def _cache_reply(cache_key, reply):
+    # Backend sqlite có thể phải chờ khoá ghi → không ghi trên event loop
+    if cache_key is not None:
+        await run_in_threadpool(chat_cache.set, cache_key, reply)
+
+
+async def _cached_chat_events(reply, memory, msg):
+    yield _sse({"delta": reply})
+    yield _sse(await _chat_payload(reply, memory, msg, cached=True), event="done")
+
+
+async def _chat_events(messages, memory=None, msg=None, cache_key=None):
+    parts = []
+    try:
+        async for text in _stream_chat(messages, CHAT_PARAMS["temperature"], CHAT_PARAMS["max_tokens"]):
+            parts.append(text)
+            yield _sse({"delta": text})
+    except Exception as e:
+        reply = _fallback_reply(e, (httpx.TimeoutException,))
+    else:
+        reply = "".join(parts).strip() or EMPTY_REPLY
+        await _cache_reply(cache_key, reply)
+        yield _sse(await _chat_payload(reply, memory, msg), event="done")
+        return
+    yield _sse(await _chat_payload(reply, memory, msg), event="error")
+
+
+async def ai_chat(request):
+    memory, msg = None, ""
+    try:
+        data = await _json_body(request)
+        msg, error = _chat_input(data)
+        if error:
+            return JSONResponse({"error": error}, 400)
+
+        if _memory_requested(data):
+            memory = await run_in_threadpool(_in_app_context, chat_memory.open, data.get("conversation_id"),
+                                             _token_user_id(request) or data.get("user_id"))
+            if memory is None:
+                return JSONResponse({"error": CONVERSATION_NOT_FOUND}, 404)
+        messages = _chat_prompt(data, msg, memory)
+
+        cache_key = _chat_cache_key(messages)
+        cached = await _cached_reply(cache_key)
+
+        if _stream_requested(data, request.headers):
+            if cached is not None:
+                return _sse_response(_cached_chat_events(cached, memory, msg))
+            return _sse_response(_chat_events(messages, memory, msg, cache_key))
+
+        if cached is not None:
+            return JSONResponse(await _chat_payload(cached, memory, msg, cached=True))
+
+        reply = await _chat(messages, CHAT_PARAMS["temperature"], CHAT_PARAMS["max_tokens"]) or EMPTY_REPLY
+        await _cache_reply(cache_key, reply)
+        return JSONResponse(await _chat_payload(reply, memory, msg))
+
+    except Exception as e:
+        return JSONResponse(await _chat_payload(_fallback_reply(e, (httpx.TimeoutException,)), memory, msg))
+
+
+async def ai_speaking_start(request):
+    try:
+        topic, user_id = _speaking_start_input(await _json_body(request))
+
+        # Ngân hàng câu hỏi đủ lớn → không cần gọi AI (xem ai_routes._speaking_questions)
+        questions = await run_in_threadpool(_in_app_context, _bank_questions, topic, user_id)
+        source = "bank"
+        if not questions:
+            try:
+                questions = _split_questions(await _chat(_speaking_start_messages(topic), 0.8, 400))
+                source = "ai"
+            except AI_UNAVAILABLE:
+                questions = await run_in_threadpool(_in_app_context, _bank_questions, topic, user_id, 1)
+                if not questions:
+                    raise
+            if source == "ai":
+                await run_in_threadpool(_in_app_context, _grow_bank, topic, questions)
+
+        # Ghi ngay, không qua write-behind (xem ai_routes.ai_speaking_start)
+        session = _session_row(topic, user_id)
+        await _insert_rows(SpeakingSession, [session])
+
+        return JSONResponse(_speaking_start_payload(session, questions, source))
+
+    except AI_UNAVAILABLE:
+        return JSONResponse({"error": BUSY_REPLY}, 503)
+    except Exception as e:
+        return JSONResponse({"error": f"Exception: {e}"}, 500)
+
+
+async def _save_turn(turn, feedback):
+    try:
+        await _append_rows(SpeakingTurn, [_turn_row(turn, feedback)])
+    except Exception as db_err:
+        print(f"Lưu database thất bại: {db_err}")
+
+
+_background = set()  # Task đọc nốt feedback khi client đã ngắt kết nối
+
+
+async def _feedback_events(turn, messages):
+    # Đọc stream từ AI ở task riêng: client ngắt giữa chừng thì task vẫn chạy hết và lưu lượt trả lời
+    queue = asyncio.Queue()
+
+    async def produce():
+        parts = []
+        try:
+            async for text in _stream_chat(messages, 0.7, 200):
+                parts.append(text)
+                queue.put_nowait(("delta", text))
+        except AI_UNAVAILABLE:
+            pass  # Dùng DEFAULT_FEEDBACK như khi AI trả rỗng
+        except Exception as e:
+            queue.put_nowait(("error", e))
+            return
+        feedback = "".join(parts).strip() or DEFAULT_FEEDBACK
+        await _save_turn(turn, feedback)
+        queue.put_nowait(("done", feedback))
+
+    task = asyncio.ensure_future(produce())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+    while True:
+        kind, value = await queue.get()
+        if kind == "delta":
+            yield _sse({"delta": value})
+        elif kind == "error":
+            yield _sse({"error": f"Exception: {value}"}, event="error")
+            return
+        else:
+            yield _sse(_feedback_payload(turn, value), event="done")
+            return
+
+
+async def ai_speaking_feedback(request):
+    try:
+        data = await _json_body(request)
+        turn, error = _feedback_input(data)
+        if error:
+            return JSONResponse({"error": error}, 400)
+
+        if not await _session_exists(turn["session_id"]):
+            return JSONResponse({"error": SESSION_NOT_FOUND}, 404)
+
+        messages = _feedback_messages(turn["question"], turn["answer"])
+
+        if _stream_requested(data, request.headers):
+            return _sse_response(_feedback_events(turn, messages))
+
+        try:
+            feedback = await _chat(messages, 0.7, 200)
+        except AI_UNAVAILABLE:
+            feedback = ""
+
+        feedback = feedback or DEFAULT_FEEDBACK
+        await _save_turn(turn, feedback)
+
+        return JSONResponse(_feedback_payload(turn, feedback))
+
+    except Exception as e:
+        return JSONResponse({"error": f"Exception: {e}"}, 500)
+
+
+async def ai_speaking_feedback_batch(request):
+    try:
+        session_id, items, error = _batch_input(await _json_body(request))
+        if error:
+            return JSONResponse({"error": error}, 400)
+
+        if not await _session_exists(session_id):
+            return JSONResponse({"error": SESSION_NOT_FOUND}, 404)
+
+        try:
+            text = await _chat(_batch_feedback_messages(items), 0.7, 150 * len(items),
+                               response_format={"type": "json_object"})
+        except AI_UNAVAILABLE:
+            text = ""
+        feedbacks = _batch_feedback_result(items, text)
+
+        await _append_rows(SpeakingTurn, _batch_turn_rows(session_id, items, feedbacks))
+
+        return JSONResponse(_batch_payload(session_id, items, feedbacks))
+
+    except Exception as e:
+        return JSONResponse({"error": f"Exception: {e}"}, 500)
+
+
+# ============================================================
+# 📖 Tra từ (bản async của gemini_routes.gemini_chat)
+# ============================================================
+def _gemini_call(version, prompt, max_tokens=1024):
+    url, payload = _gemini_request(version, prompt, max_tokens)
+
+    async def call():
+        return _gemini_result(await async_upstream.post("gemini", url, json=payload))
+    return call
+
+
+def _chat_call(provider, prompt, max_tokens=1024):
+    async def call():
+        try:
+            text = await provider.acomplete(_chat_lookup_messages(prompt), 0.1, max_tokens,
+                                            response_format={"type": "json_object"})
+        except UpstreamHTTPError as e:
+            raise GeminiLookupError(f"Lỗi API: {e.text}")
+        return _parse_entry(text)
+    return call
+
+
+async def _find_word(session, word):
+    result = await session.execute(select(DictionaryCache).filter_by(word=word))
+    return result.scalars().first()
+
+
+async def _fetch_and_store(search_word):
+    """
+    Chạy một lần cho mỗi từ trong process (xem _inflight). Không dùng host_lock như bản Flask
+    (khoá file sẽ chặn event loop); trùng giữa các process vẫn được unique index trên word chặn lại.
+    """
+    async with Session() as session:
+        row = await _find_word(session, search_word)
+        if row:
+            entry = row.to_dict()
+            dictionary_memo.set(search_word, entry)
+            return entry, "database"
+
+    # Không giữ connection DB trong lúc chờ AI (vài giây): pool async chỉ có ASYNC_DB_POOL_SIZE connection
+    _, ai_data = await dictionary_router.acall(
+        _dictionary_candidates(_dictionary_prompt(search_word), _gemini_call, _chat_call)
+    )
+
+    async with Session() as session:
+        new_entry = _new_entry(search_word, ai_data)
+        session.add(new_entry)
+        try:
+            await session.commit()
+            entry = new_entry.to_dict()
+        except IntegrityError:
+            await session.rollback()
+            row = await _find_word(session, search_word)
+            if not row:
+                raise
+            entry = row.to_dict()
+    dictionary_memo.set(search_word, entry)
+    autocomplete_index.add(search_word)
+    return entry, "api"
+
+
+_inflight = AsyncSingleFlight(wait_timeout=60)
+
+
+async def gemini_chat(request):
+    try:
+        search_word, lemma, error = _lookup_input(await _json_body(request))
+        if error:
+            return JSONResponse({"error": error}, 400)
+
+        cached = dictionary_memo.get(lemma)
+        if cached is MISSING:
+            async with Session() as session:
+                row = await _find_word(session, lemma)
+            cached = row.to_dict() if row else None
+            dictionary_memo.set(lemma, cached)
+        if cached:
+            return JSONResponse(_entry_response(cached, "database", search_word))
+
+        try:
+            entry, source = await _inflight.do(lemma, lambda: _fetch_and_store(lemma))
+        except GeminiLookupError as e:
+            return JSONResponse({"reply": str(e)})
+        except UpstreamUnavailable:
+            return JSONResponse({"reply": UNAVAILABLE_REPLY})
+
+        return JSONResponse(_entry_response(entry, source, search_word))
+
+    except Exception as e:
+        return JSONResponse({"reply": f"Lỗi hệ thống: {str(e)}"})
+
+
+async def _lookup_words(words):
+    """Như gemini_routes._lookup_words: cache RAM rồi một truy vấn IN (...) bằng session async."""
+    found, rest = _memo_lookup(words)
+    if rest:
+        async with Session() as session:
+            result = await session.execute(select(DictionaryCache).where(DictionaryCache.word.in_(rest)))
+            _memo_remember(rest, result.scalars(), found)
+    return found
+
+
+async def gemini_batch_lookup(request):
+    try:
+        try:
+            words = _batch_words(await _json_body(request))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, 400)
+
+        lemmas, keys = _batch_lemmas(words)
+        found = await _lookup_words(keys)
+        missing = [w for w in keys if w not in found]
+        fetched, error = {}, None
+        if missing:
+            try:
+                _, ai_data = await dictionary_router.acall(_batch_candidates(missing, _gemini_call, _chat_call))
+                # Upsert theo dialect dùng chung db_helpers (session sync) → chạy trong threadpool
+                fetched = await run_in_threadpool(_in_app_context, _store_batch, _batch_entries(missing, ai_data))
+            except GeminiLookupError as e:
+                error = str(e)
+            except UpstreamUnavailable:
+                error = UNAVAILABLE_REPLY
+        return JSONResponse(_lookup_batch_payload(words, found, fetched, error, lemmas))
+
+    except Exception as e:
+        return JSONResponse({"reply": f"Lỗi hệ thống: {str(e)}"})
+
+
+async def gemini_autocomplete(request):
+    if not autocomplete_index.loaded:
+        # Lần dựng chỉ mục đầu tiên đọc DB + vocabulary.json → không chạy trên event loop
+        payload, status = await run_in_threadpool(_autocomplete_payload, request.query_params)
+    else:
+        payload, status = _autocomplete_payload(request.query_params)
+    return JSONResponse(payload, status)
+
+
+# ============================================================
+# 📝 Quiz (bản async của deepseek_routes.get_quiz)
+# ============================================================
+async def get_quiz(request):
+    try:
+        topic, level, user_id = _quiz_request(await _json_body(request))
+
+        async with Session() as session:
+            counter = await session.get(QuizCounter, (topic or "", level or ""))
+        current_count = counter.count if counter else 0
+        source = _plan_quiz(topic, level, current_count)
+        # Bộ lấy mẫu có thể phải nạp mảng id từ DB bằng session Flask (lần đầu / hết TTL)
+        picked, source = await run_in_threadpool(_in_app_context, _pick_quiz_ids, topic, level, user_id, source)
+
+        new_questions = []
+        if picked:
+            async with Session() as session:
+                result = await session.execute(select(Quiz).where(Quiz.id.in_(picked)))
+            by_id = {q.id: q for q in result.scalars()}
+            new_questions = [by_id[i] for i in picked if i in by_id]
+
+        if not new_questions:
+            return JSONResponse(_emergency_payload(topic))
+
+        return JSONResponse(_quiz_payload(source, current_count, topic, level, new_questions))
+
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, 500)
+
+
+# ============================================================
+# 🧩 Ghép app: route async trước, còn lại chuyển cho Flask
+# ============================================================
+_CORS = Middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin"],
+)
+
+
+def _timed(blueprint, endpoint, handler):
+    """Đo thời gian với cùng nhãn như app Flask (record_request_latency) để dashboard không đổi."""
+    async def timed(request):
+        started = time.perf_counter()
+        if request.method == "OPTIONS":
+            response = Response(status_code=200)
+        else:
+            response = await handler(request)
+        REQUEST_LATENCY.observe(blueprint, f"{blueprint}.{endpoint}", request.method, response.status_code,
+                                value=time.perf_counter() - started)
+        return response
+    return timed
+
+
+def _routes(path, blueprint, handler, methods=("POST",)):
+    endpoint = _timed(blueprint, handler.__name__, handler)
+    # strict_slashes=False ở bản Flask: chấp nhận cả URL có "/" ở cuối
+    return [
+        Route(p, endpoint, methods=[*methods, "OPTIONS"], middleware=[_CORS],
+              max_body_size=flask_app.config["MAX_CONTENT_LENGTH"])
+        for p in (path, path + "/")
+    ]
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    await run_in_threadpool(write_behind.close)  # Ghi nốt bộ đệm trước khi đóng kết nối
+    await async_upstream.aclose()
+    await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        *_routes("/ai/chat", "ai_bp", ai_chat),
+        *_routes("/ai/speaking/start", "ai_bp", ai_speaking_start),
+        *_routes("/ai/speaking/feedback", "ai_bp", ai_speaking_feedback),
+        *_routes("/ai/speaking/feedback-batch", "ai_bp", ai_speaking_feedback_batch),
+        *_routes("/gemini/chat", "gemini_bp", gemini_chat),
+        *_routes("/gemini/batch-lookup", "gemini_bp", gemini_batch_lookup),
+        *_routes("/gemini/autocomplete", "gemini_bp", gemini_autocomplete, methods=("GET",)),
+        *_routes("/deepseek/generate-quiz", "deepseek_bp", get_quiz),
+        Mount("/", WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", 4)))),
+    ],
+    lifespan=lifespan,
+)
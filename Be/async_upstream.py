@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+🌐 Bản async của upstream.py cho chế độ ASGI (asgi.py), dùng httpx.AsyncClient.
+
+- Mỗi provider một AsyncClient (connection pool keep-alive) trên event loop đang chạy.
+- Dùng chung circuit breaker + timeout/retry với upstream.ProviderClient của provider đó,
+  nên ngắt mạch ở chế độ nào cũng có hiệu lực cho cả hai.
+- Giới hạn số request đang chạy (AIMD) là bộ riêng với trần cao hơn nhiều: một request đang chờ
+  chỉ là một coroutine, không giữ thread, nên một process giữ được hàng trăm lời gọi LLM cùng lúc.
+
+Cấu hình thêm (ngoài các biến của upstream.py):
+    UPSTREAM_ASYNC_LIMIT_INITIAL / <PROVIDER>_ASYNC_LIMIT_INITIAL   mặc định 256
+    UPSTREAM_ASYNC_LIMIT_MAX     / <PROVIDER>_ASYNC_LIMIT_MAX       mặc định 1024
+    UPSTREAM_ASYNC_MAX_CONNECTIONS / <PROVIDER>_ASYNC_MAX_CONNECTIONS  số kết nối tối đa (mặc định 512)
+"""
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+
+import metrics
+import upstream
+from upstream import UpstreamHTTPError, UpstreamUnavailable, _env  # noqa: F401 (re-export cho route)
+
+_clients = {}     # (provider, id(loop)) -> httpx.AsyncClient
+_limiters = {}    # provider -> AdaptiveLimiter
+_lock = threading.Lock()
+
+
+def _limiter(name):
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                sync_client = upstream.get_client(name)
+                limiter = _limiters[name] = upstream.AdaptiveLimiter(
+                    initial=_env(name, "ASYNC_LIMIT_INITIAL", 256, int),
+                    minimum=_env(name, "LIMIT_MIN", 1, int),
+                    maximum=_env(name, "ASYNC_LIMIT_MAX", 1024, int),
+                    latency_target=sync_client.latency_target,
+                )
+    return limiter
+
+
+def get_client(name):
+    loop = asyncio.get_running_loop()
+    key = (name, id(loop))
+    client = _clients.get(key)
+    if client is None:
+        sync_client = upstream.get_client(name)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(sync_client.read_timeout, connect=sync_client.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=_env(name, "ASYNC_MAX_CONNECTIONS", 512, int),
+                max_keepalive_connections=sync_client.pool_maxsize,
+            ),
+            # Chỉ thử lại lỗi kết nối ở tầng transport; lỗi 5xx thử lại bên dưới
+            transport=httpx.AsyncHTTPTransport(retries=sync_client.retries),
+        )
+        _clients[key] = client
+    return client
+
+
+async def request(provider, method, url, stream=False, **kwargs):
+    """
+    Giống upstream.ProviderClient.request: trả về httpx.Response (stream=True → chưa đọc body,
+    caller phải aclose()). Bị ngắt mạch / vượt giới hạn → UpstreamUnavailable ngay.
+    """
+    sync_client = upstream.get_client(provider)
+    breaker, limiter = sync_client.breaker, _limiter(provider)
+    if not breaker.allow():
+        metrics.UPSTREAM_REJECTED.inc(provider, "circuit_open")
+        raise UpstreamUnavailable(provider, "circuit open")
+    token = limiter.acquire()
+    if token is None:
+        metrics.UPSTREAM_REJECTED.inc(provider, "concurrency_limit")
+        breaker.cancel()
+        raise UpstreamUnavailable(provider, "concurrency limit")
+
+    client = get_client(provider)
+    started = time.perf_counter()
+    resp = None
+    cancelled = False
+    try:
+        for attempt in range(sync_client.retries + 1):
+            resp = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+            if resp.status_code not in upstream._RETRY_STATUSES or attempt == sync_client.retries:
+                break
+            await resp.aclose()
+            await asyncio.sleep(sync_client.backoff * (2 ** attempt))
+    except httpx.HTTPError as e:
+        resp = None
+        metrics.observe_upstream(provider, type(e).__name__, started)
+        raise
+    except asyncio.CancelledError:
+        # Client ngắt / request hedge thua bị huỷ: không phải lỗi của provider
+        cancelled = True
+        raise
+    finally:
+        latency = time.perf_counter() - started
+        if cancelled:
+            limiter.cancel(token)
+            breaker.cancel()
+        else:
+            failed = resp is None or resp.status_code == 429 or resp.status_code >= 500
+            limiter.release(token, latency, failed)
+            breaker.record(failed or latency > sync_client.latency_target)
+    metrics.observe_upstream(provider, str(resp.status_code), started)
+    return resp
+
+
+async def post(provider, url, **kwargs):
+    return await request(provider, "POST", url, **kwargs)
+
+
+async def aiter_chat_stream(resp):
+    """Bản async của upstream.iter_chat_stream (SSE kiểu OpenAI → từng đoạn delta.content)."""
+    try:
+        async for line in resp.aiter_lines():
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+    finally:
+        await resp.aclose()
+
+
+async def aclose():
+    """Đóng các AsyncClient của event loop hiện tại (gọi lúc tắt app)."""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _clients if k[1] == loop_id]:
+        await _clients.pop(key).aclose()
+
+
+@metrics.on_scrape
+def collect_async_metrics():
+    for name, limiter in list(_limiters.items()):
+        metrics.UPSTREAM_LIMIT.set(f"{name}-async", value=round(limiter.limit, 2))
+        metrics.UPSTREAM_IN_FLIGHT.set(f"{name}-async", value=limiter.in_flight)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+🔑 Băm mật khẩu ngoài request thread + token đăng nhập có chữ ký.
+
+- hash_password / verify_password chạy trong ProcessPoolExecutor (số process giới hạn),
+  nên lúc cả lớp đăng nhập cùng lúc, các request khác trong worker không phải chờ CPU băm mật khẩu.
+  PASSWORD_HASH_WORKERS=0 → băm ngay trên request thread như trước.
+- issue_token / verify_token: token ký bằng SECRET_KEY, có hạn dùng (AUTH_TOKEN_TTL giây),
+  kiểm tra chỉ cần chữ ký, không truy vấn DB.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+import password_hashing
+
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+# Số lượt băm tối đa đang chờ/chạy mỗi worker; vượt quá thì trả lỗi bận thay vì xếp hàng vô hạn
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", max(1, HASH_WORKERS) * 8))
+TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", 7 * 24 * 3600))
+_TOKEN_SALT = "auth-token"
+
+
+class HashingBusy(RuntimeError):
+    pass
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+def _mp_context():
+    # forkserver: process con fork từ một server sạch đã nạp sẵn password_hashing, không fork từ worker
+    # đang chạy nhiều thread và không phải import lại werkzeug mỗi lần. Không có forkserver (Windows) → spawn.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["password_hashing"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=_mp_context())
+                _executor_pid = pid
+    return _executor
+
+
+def _run(fn, *args):
+    if HASH_WORKERS <= 0:
+        return fn(*args)
+    if not _pending.acquire(timeout=HASH_TIMEOUT):
+        raise HashingBusy("Hệ thống đang bận, vui lòng thử lại")
+    try:
+        return _get_executor().submit(fn, *args).result(timeout=HASH_TIMEOUT)
+    finally:
+        _pending.release()
+
+
+def hash_password(password):
+    return _run(password_hashing.hash_password, password)
+
+
+def verify_password(pwhash, password):
+    if not pwhash or password is None:
+        return False
+    return _run(password_hashing.verify_password, pwhash, password)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt=_TOKEN_SALT)
+
+
+def issue_token(user_id):
+    return _serializer().dumps({"uid": user_id})
+
+
+def verify_token(token, max_age=None):
+    """Trả về user_id nếu token hợp lệ và còn hạn, ngược lại None."""
+    if not token:
+        return None
+    try:
+        data = _serializer().loads(token, max_age=max_age or TOKEN_TTL)
+    except (SignatureExpired, BadSignature):
+        return None
+    return data.get("uid") if isinstance(data, dict) else None
+
+
+def token_user_id():
+    """user_id từ header Authorization: Bearer <token> của request hiện tại (hoặc None)."""
+    header = request.headers.get("Authorization") or ""
+    if header.lower().startswith("bearer "):
+        return verify_token(header[7:].strip())
+    return None
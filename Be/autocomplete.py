@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+🔎 Gợi ý từ khi đang gõ (search-as-you-type) hoàn toàn trong RAM, không LIKE vào dictionary_cache mỗi phím.
+
+- Khớp tiền tố: mảng từ đã sắp xếp + bisect → O(log n) để tìm vị trí, rồi đọc tuần tự `limit` từ.
+- Gõ sai (khoảng cách sửa ≤ max_distance, Damerau-Levenshtein kiểu OSA): chỉ mục "xoá ký tự" kiểu SymSpell
+  trên các tiền tố độ dài fuzzy_min_length..fuzzy_prefix của mỗi từ: mỗi tiền tố p được ghi dưới mọi chuỗi
+  thu được khi xoá ≤ max_distance ký tự của p. Lúc tra, sinh các chuỗi xoá của tiền tố truy vấn, lấy tiền tố
+  ứng viên, kiểm lại khoảng cách, rồi dùng bisect để lấy từ bắt đầu bằng tiền tố đó.
+  Chỉ mục lưu tiền tố (nhiều từ dùng chung) chứ không lưu từng từ → nhỏ hơn nhiều so với SymSpell trên cả từ.
+- Nạp lười lần đầu dùng (load_words), nạp lại ở nền sau ttl giây (vẫn phục vụ bản cũ trong lúc nạp);
+  add(word) cập nhật ngay khi có từ mới (gemini_chat, batch-lookup, prewarm).
+"""
+import bisect
+import os
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def _deletes(text, max_distance):
+    """Mọi chuỗi thu được khi xoá 0..max_distance ký tự của text."""
+    result = {text}
+    frontier = {text}
+    for _ in range(max_distance):
+        frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b, limit):
+    """Khoảng cách Damerau-Levenshtein (OSA) giữa a và b; trả về limit + 1 nếu chắc chắn vượt limit."""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if limit == 1:
+        # Một lỗi: chỉ cần so phần còn lại sau vị trí khác nhau đầu tiên (nhanh hơn quy hoạch động nhiều lần)
+        i = len(os.path.commonprefix((a, b)))
+        if (a[i + 1:] == b[i + 1:] or a[i + 1:] == b[i:] or a[i:] == b[i + 1:]
+                or (a[i:i + 2] == b[i + 1:i + 2] + b[i:i + 1] and a[i + 2:] == b[i + 2:])):
+            return 1
+        return 2
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def prefix_distance(query, word, limit):
+    """
+    Số lỗi gõ ít nhất giữa query và một tiền tố nào đó của word; limit + 1 nếu vượt limit.
+    limit = 1 (mặc định) đi đường nhanh: so tại vị trí khác nhau đầu tiên bằng các phép so chuỗi.
+    """
+    if word.startswith(query):
+        return 0
+    if limit != 1:
+        return min(edit_distance(query, word[:len(query) + k], limit) for k in range(-limit, limit + 1))
+    i = len(os.path.commonprefix((query, word)))
+    if (word.startswith(query[i + 1:], i + 1)      # gõ sai một ký tự
+            or word.startswith(query[i + 1:], i)   # gõ thừa một ký tự
+            or word.startswith(query[i:], i + 1)   # gõ thiếu một ký tự
+            or (word[i:i + 2] == query[i + 1:i + 2] + query[i:i + 1] and word.startswith(query[i + 2:], i + 2))):
+        return 1
+    return 2
+
+
+class _Snapshot:
+    """Một phiên bản chỉ mục: mảng từ đã sắp xếp + chỉ mục xoá ký tự của các tiền tố."""
+
+    def __init__(self, max_distance, fuzzy_prefix, fuzzy_min_length):
+        self.max_distance = max_distance
+        self.fuzzy_prefix = fuzzy_prefix
+        self.fuzzy_min_length = fuzzy_min_length
+        self.words = []
+        self.present = set()
+        self.prefixes = set()
+        self.deletes = {}  # chuỗi đã xoá ký tự -> set tiền tố
+
+    def build(self, words):
+        self.present = set(words)
+        self.words = sorted(self.present)
+        for word in self.words:
+            self._index(word)
+        return self
+
+    def _index(self, word):
+        for length in range(self.fuzzy_min_length, min(len(word), self.fuzzy_prefix) + 1):
+            prefix = word[:length]
+            if prefix in self.prefixes:
+                continue
+            self.prefixes.add(prefix)
+            for key in _deletes(prefix, self.max_distance):
+                self.deletes.setdefault(key, set()).add(prefix)
+
+    def add(self, word):
+        if word in self.present:
+            return False
+        self.present.add(word)
+        bisect.insort(self.words, word)
+        self._index(word)
+        return True
+
+    def with_prefix(self, prefix, limit):
+        words = self.words
+        start = bisect.bisect_left(words, prefix)
+        result = []
+        for i in range(start, min(start + limit, len(words))):
+            if not words[i].startswith(prefix):
+                break
+            result.append(words[i])
+        return result
+
+
+class AutocompleteIndex:
+    def __init__(self, load_words, ttl=600, max_distance=1, fuzzy_prefix=6, fuzzy_min_length=3, scan_limit=200):
+        """
+        load_words() -> iterable các từ (đã chuẩn hoá) để dựng chỉ mục; gọi lúc nạp lần đầu và mỗi ttl giây.
+        max_distance: số lỗi gõ tối đa được gợi ý (mỗi mức tăng làm chỉ mục lớn lên nhiều).
+        scan_limit: số từ tối đa được xét dưới mỗi tiền tố ứng viên còn dư lỗi khi truy vấn dài hơn chỉ mục.
+        """
+        self.load_words = load_words
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.fuzzy_prefix = fuzzy_prefix
+        self.fuzzy_min_length = fuzzy_min_length
+        self.scan_limit = scan_limit
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+        self._reloading = False
+        self._added_during_reload = []
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    # ---------- Nạp / cập nhật ----------
+    def _build(self):
+        started = time.perf_counter()
+        snapshot = _Snapshot(self.max_distance, self.fuzzy_prefix, self.fuzzy_min_length).build(
+            w for w in self.load_words() if w
+        )
+        with self._lock:
+            # Từ được add() trong lúc đang dựng có thể chưa có trong dữ liệu vừa đọc
+            for word in self._added_during_reload:
+                snapshot.add(word)
+            self._added_during_reload = []
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+            self._reloading = False
+            self.loads += 1
+            self.load_seconds = round(time.perf_counter() - started, 3)
+        return snapshot
+
+    def _reload_in_background(self):
+        try:
+            self._build()
+        except Exception as e:
+            with self._lock:
+                self._reloading = False
+                self._loaded_at = time.monotonic()  # Thử lại sau ttl, vẫn dùng bản cũ
+            print(f"⚠️ [AUTOCOMPLETE] Nạp lại chỉ mục lỗi: {e}")
+
+    def _current(self):
+        with self._lock:
+            snapshot = self._snapshot
+            stale = snapshot is not None and time.monotonic() - self._loaded_at >= self.ttl
+            if stale and not self._reloading:
+                self._reloading = True
+                threading.Thread(target=self._reload_in_background, name="autocomplete-reload", daemon=True).start()
+        if snapshot is None:
+            # Lần đầu: các request cùng lúc chờ chung một lần dựng chỉ mục; add() trong lúc dựng được giữ lại
+            with self._lock:
+                self._reloading = True
+            try:
+                snapshot = self._loads.do("build", self._build)
+            except Exception:
+                with self._lock:
+                    self._reloading = False
+                    self._added_during_reload = []
+                raise
+        return snapshot
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def warm(self):
+        return self._current()
+
+    def add(self, word):
+        """Thêm một từ mới vào chỉ mục đang dùng (chưa nạp thì bỏ qua: lần nạp đầu sẽ đọc từ nguồn)."""
+        if not word:
+            return
+        with self._lock:
+            if self._reloading:
+                self._added_during_reload.append(word)
+            if self._snapshot is not None:
+                self._snapshot.add(word)
+
+    # ---------- Truy vấn ----------
+    def suggest(self, query, limit=10):
+        """[(từ, khoảng cách)]: khớp tiền tố trước (khoảng cách 0), sau đó các từ gần đúng (lỗi gõ)."""
+        if not query or limit <= 0:
+            return []
+        snapshot = self._current()
+        with self._lock:
+            results = [(w, 0) for w in snapshot.with_prefix(query, limit)]
+            if len(results) < limit and len(query) >= self.fuzzy_min_length and self.max_distance > 0:
+                seen = {w for w, _ in results}
+                fuzzy = self._fuzzy(snapshot, query, limit, seen)
+                results.extend(fuzzy[:limit - len(results)])
+        return results
+
+    def _fuzzy(self, snapshot, query, limit, seen):
+        distance_limit = self.max_distance
+        # Truy vấn dài: chỉ tra chỉ mục bằng phần đầu, ngắn hơn fuzzy_prefix đúng distance_limit ký tự, để mọi
+        # tiền tố ứng viên (dài head ± distance_limit) đều nằm trong chỉ mục; phần đuôi được kiểm sau.
+        long_query = len(query) > self.fuzzy_prefix - distance_limit
+        head = query[:self.fuzzy_prefix - distance_limit] if long_query else query
+        tail = query[len(head):]
+        candidates = set()
+        for key in _deletes(head, distance_limit):
+            candidates.update(snapshot.deletes.get(key, ()))
+        found = []
+        for prefix in candidates:
+            distance = edit_distance(head, prefix, distance_limit)
+            if distance > distance_limit:
+                continue
+            if not long_query:
+                if distance == 0:
+                    continue  # Đã nằm trong phần khớp tiền tố
+                found.extend((distance, len(w), w) for w in snapshot.with_prefix(prefix, limit) if w not in seen)
+            elif distance == distance_limit:
+                # Phần đầu đã dùng hết số lỗi cho phép → phần đuôi phải khớp nguyên văn: tra thẳng bằng bisect
+                found.extend((distance, len(w), w) for w in snapshot.with_prefix(prefix + tail, limit) if w not in seen)
+            else:
+                # Còn lỗi cho phần đuôi: xét tối đa scan_limit từ bắt đầu bằng tiền tố này
+                for word in snapshot.with_prefix(prefix, self.scan_limit):
+                    if word in seen:
+                        continue
+                    distance = prefix_distance(query, word, distance_limit)
+                    if distance <= distance_limit:
+                        found.append((distance, len(word), word))
+        found.sort()
+        result, picked = [], set()
+        for distance, _, word in found:
+            if word not in picked:
+                picked.add(word)
+                result.append((word, distance))
+        return result
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "loaded": snapshot is not None,
+                "words": len(snapshot.words) if snapshot else 0,
+                "prefixes": len(snapshot.prefixes) if snapshot else 0,
+                "delete_keys": len(snapshot.deletes) if snapshot else 0,
+                "loads": self.loads,
+                "load_seconds": self.load_seconds,
+                "age_seconds": round(time.monotonic() - self._loaded_at, 1) if snapshot else None,
+            }
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh số lời gọi AI chạy đồng thời được: gunicorn sync (--threads 4) và chế độ async (asgi.py, uvicorn).
+
+Provider giả lập trả lời chậm (mặc định 1000ms) giống LLM thật; --concurrency client bắn /ai/chat cùng lúc,
+trong lúc đó một client khác gọi /health đều đặn để xem route thường có bị kẹt sau các lời gọi AI không.
+Cả hai bên đều chạy 1 process, DB SQLite tạm.
+
+Chạy:
+  python benchmarks/bench_asgi.py --concurrency 200 --latency-ms 1000
+  python benchmarks/bench_asgi.py --servers asgi --concurrency 500
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from loadtest import BE_DIR, free_port, percentile, wait_http  # noqa: E402
+
+SERVERS = ("gunicorn", "asgi")
+
+
+def start_app(server, args, workdir, fake_base):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, f"{server}.db"),
+        "SECRET_KEY": "bench",
+        "OPENAI_API_KEY": "fake", "GEMINI_API_KEY": "fake", "GROQ_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{fake_base}/openai/v1",
+        "GROQ_BASE_URL": f"{fake_base}/groq/v1",
+        "GEMINI_BASE_URL": f"{fake_base}/gemini",
+        "LOCK_DIR": os.path.join(workdir, "locks"),
+    })
+    log = open(os.path.join(workdir, f"{server}.log"), "w")
+    subprocess.run([sys.executable, "-c", "import app; app.app.app_context().push(); app.db.create_all()"],
+                   cwd=BE_DIR, env=env, check=True, stdout=log, stderr=subprocess.STDOUT)
+    port = free_port()
+    if server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "--worker-class", "sync", "--threads", str(args.threads),
+               "--workers", "1", "--timeout", "300", "--bind", f"127.0.0.1:{port}", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--no-access-log", "--backlog", "2048"]
+    proc = subprocess.Popen(cmd, cwd=BE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_http(base + "/health", timeout=60, proc=proc)
+    except Exception:
+        proc.kill()
+        raise
+    return proc, base
+
+
+async def run_load(base, concurrency, request_timeout):
+    limits = httpx.Limits(max_connections=concurrency + 10, max_keepalive_connections=concurrency + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=request_timeout, limits=limits) as client:
+        await client.post("/ai/chat", json={"message": "warm up"})
+
+        async def chat(i):
+            started = time.perf_counter()
+            try:
+                resp = await client.post("/ai/chat", json={"message": f"Question {i}?"})
+                reply = resp.json().get("reply", "") if resp.status_code == 200 else ""
+                ok = resp.status_code == 200 and not reply.startswith("[Fallback]")
+            except httpx.HTTPError:
+                ok = False
+            return ok, time.perf_counter() - started
+
+        health = []
+        done = asyncio.Event()
+
+        async def probe():
+            async with httpx.AsyncClient(base_url=base, timeout=request_timeout) as probe_client:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    try:
+                        await probe_client.get("/health")
+                        health.append(time.perf_counter() - started)
+                    except httpx.HTTPError:
+                        health.append(request_timeout)
+                    await asyncio.sleep(0.1)
+
+        prober = asyncio.ensure_future(probe())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(chat(i) for i in range(concurrency)))
+        total = time.perf_counter() - started
+        done.set()
+        await prober
+
+    latencies = [lat for ok, lat in results if ok]
+    return {
+        "total_s": round(total, 2),
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "health_p50_ms": round(percentile(health, 50) * 1000, 1) if health else None,
+        "health_max_ms": round(max(health) * 1000, 1) if health else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default=",".join(SERVERS), help="gunicorn, asgi (cách nhau bởi dấu phẩy)")
+    parser.add_argument("--concurrency", type=int, default=200, help="số lời gọi /ai/chat bắn cùng lúc")
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="độ trễ của provider giả lập")
+    parser.add_argument("--threads", type=int, default=4, help="số thread của gunicorn sync")
+    parser.add_argument("--timeout", type=float, default=300.0, help="timeout mỗi request của client")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-asgi-")
+    fake_port = free_port()
+    fake_base = f"http://127.0.0.1:{fake_port}"
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_providers.py"), "--port", str(fake_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", "0",
+    ], stdout=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_http(fake_base + "/stats", proc=fake)
+        for server in [s.strip() for s in args.servers.split(",") if s.strip()]:
+            print(f"▶ {server} ...", flush=True)
+            proc, base = start_app(server, args, workdir, fake_base)
+            try:
+                results[server] = asyncio.run(run_load(base, args.concurrency, args.timeout))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+    finally:
+        fake.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.concurrency} lời gọi /ai/chat đồng thời, provider trễ {args.latency_ms:.0f}ms")
+    print(f"{'server':<9} {'total':>8} {'ok':>5} {'failed':>7} {'p50':>10} {'p99':>10} {'/health p50':>12} {'/health max':>12}")
+    for server, r in results.items():
+        print(f"{server:<9} {r['total_s']:>7}s {r['ok']:>5} {r['failed']:>7} {r['p50_ms'] or '-':>8}ms "
+              f"{r['p99_ms'] or '-':>8}ms {r['health_p50_ms'] or '-':>10}ms {r['health_max_ms'] or '-':>10}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Đo AutocompleteIndex (autocomplete.py) trên bộ từ lớn: từ trong vocabulary.json + từ giả ghép từ âm tiết
+cho đủ --words từ. So với cách cũ là LIKE 'tiền tố%' vào bảng SQLite có unique index trên word
+(LIKE không gợi ý được từ gõ sai).
+
+Loại truy vấn:
+  prefix  tiền tố ngẫu nhiên (1..hết từ) của một từ có thật
+  typo    tiền tố ≥ 3 ký tự của một từ có thật, thêm 1 lỗi gõ (thay/xoá/chèn/đảo 2 ký tự)
+  miss    chuỗi ngẫu nhiên (thường không khớp gì → phải chạy hết nhánh gần đúng)
+
+Thoát với mã 1 nếu p99 của một loại truy vấn vượt --target-ms.
+
+Chạy:  python benchmarks/bench_autocomplete.py --words 100000 --queries 5000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import string
+import sys
+import time
+
+BE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BE_DIR)
+
+from autocomplete import AutocompleteIndex  # noqa: E402
+
+VOCABULARY = os.path.join(BE_DIR, "static", "assets", "assets", "vocabulary.json")
+ONSETS = ["", "b", "c", "d", "f", "g", "h", "l", "m", "n", "p", "r", "s", "t", "v", "w", "br", "cl", "pr", "st", "tr", "sh", "ch", "th"]
+VOWELS = ["a", "e", "i", "o", "u", "ea", "ou", "io", "ai"]
+CODAS = ["", "n", "r", "s", "t", "l", "m", "nd", "st", "ck", "ng"]
+SUFFIXES = ["", "", "", "s", "ed", "ing", "er", "ly", "tion", "ment", "ness", "able"]
+
+
+def make_words(n, seed):
+    rnd = random.Random(seed)
+    with open(VOCABULARY, encoding="utf-8") as f:
+        words = {item["word"].lower() for c in json.load(f) for item in c["words"]}
+    while len(words) < n:
+        syllables = rnd.choice((1, 2, 2, 3, 3, 4))
+        word = "".join(rnd.choice(ONSETS) + rnd.choice(VOWELS) + rnd.choice(CODAS) for _ in range(syllables))
+        words.add(word + rnd.choice(SUFFIXES))
+    return sorted(words)[:n] if len(words) > n else sorted(words)
+
+
+def typo(rnd, text):
+    i = rnd.randrange(len(text))
+    kind = rnd.choice(("sub", "del", "ins", "swap"))
+    if kind == "sub":
+        return text[:i] + rnd.choice(string.ascii_lowercase) + text[i + 1:]
+    if kind == "del" and len(text) > 3:
+        return text[:i] + text[i + 1:]
+    if kind == "swap" and i < len(text) - 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + rnd.choice(string.ascii_lowercase) + text[i:]
+
+
+def make_queries(words, n, seed):
+    rnd = random.Random(seed + 1)
+    queries = []
+    for _ in range(n):
+        word = rnd.choice(words)
+        queries.append(("prefix", word[:rnd.randint(1, len(word))]))
+        long_words = [w for w in (rnd.choice(words) for _ in range(5)) if len(w) >= 4] or ["word"]
+        word = long_words[0]
+        queries.append(("typo", typo(rnd, word[:rnd.randint(3, len(word))])))
+        queries.append(("miss", "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 9)))))
+    rnd.shuffle(queries)
+    return queries
+
+
+def report(label, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<34} p50={statistics.median(ordered):9.3f} ms  p99={p99:9.3f} ms")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=5000, help="số truy vấn mỗi loại")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--max-distance", type=int, default=1)
+    parser.add_argument("--target-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    words = make_words(args.words, args.seed)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = AutocompleteIndex(lambda: words, ttl=3600, max_distance=args.max_distance)
+    index.warm()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats = index.stats()
+    print(f"Chỉ mục {stats['words']} từ, {stats['prefixes']} tiền tố, {stats['delete_keys']} khoá xoá ký tự: "
+          f"dựng {stats['load_seconds']:.2f}s, RSS +{(rss_after - rss_before) / 1024:.0f} MB")
+
+    queries = make_queries(words, args.queries, args.seed)
+    for kind, query in queries[:200]:  # Làm nóng
+        index.suggest(query, args.limit)
+
+    latencies = {"prefix": [], "typo": [], "miss": []}
+    typo_found = 0
+    for kind, query in queries:
+        started = time.perf_counter()
+        result = index.suggest(query, args.limit)
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+        if kind == "typo" and result:
+            typo_found += 1
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dictionary_cache (id INTEGER PRIMARY KEY, word VARCHAR(255) UNIQUE NOT NULL)")
+    conn.executemany("INSERT INTO dictionary_cache (word) VALUES (?)", ((w,) for w in words))
+    conn.execute("PRAGMA case_sensitive_like = ON")  # Để SQLite dùng được index cho LIKE 'x%' (MySQL dùng sẵn)
+    like = []
+    for kind, query in queries:
+        if kind != "prefix":
+            continue
+        started = time.perf_counter()
+        conn.execute("SELECT word FROM dictionary_cache WHERE word LIKE ? ORDER BY word LIMIT ?",
+                     (query + "%", args.limit)).fetchall()
+        like.append((time.perf_counter() - started) * 1000)
+
+    print(f"\n{len(queries)} truy vấn, limit={args.limit}, max_distance={args.max_distance}")
+    failed = False
+    for kind, values in latencies.items():
+        failed |= report(f"AutocompleteIndex {kind}", values) > args.target_ms
+    report("SQLite LIKE 'x%' (chỉ prefix)", like)
+    print(f"\nTruy vấn gõ sai có gợi ý: {typo_found}/{len(latencies['typo'])}")
+    print(f"p99 mục tiêu {args.target_ms}ms: {'KHÔNG ĐẠT' if failed else 'đạt'}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tỉ lệ trúng cache tra từ trước/sau khi đưa từ về dạng gốc (lemmatizer.py).
+
+Luồng từ mẫu: các câu ví dụ tiếng Anh trong vocabulary.json, tách thành từ, mỗi từ là một lượt tra /gemini/chat
+(chữ thường, bỏ dấu câu hai đầu như _search_word). Cache là dictionary_cache: từ chưa có → một lần gọi AI
+rồi thêm một dòng. Hai kịch bản:
+  cold      bảng rỗng
+  prewarm   bảng đã nạp sẵn các từ của vocabulary.json (dictionary_prewarm)
+
+  trước     key = từ như người dùng gõ ("running", "runs", "ran" là ba dòng, ba lần gọi AI)
+  sau       key = lemmatizer.lemma(từ), known = bộ từ vựng
+
+Kèm độ chính xác của phần quy tắc trên một bảng (dạng biến đổi, dạng gốc) viết tay, vài từ bẫy (herring ≠ her)
+và thời gian mỗi lần lemma().
+
+Chạy:  python benchmarks/bench_lemma_cache.py --repeat 3
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BE_DIR)
+
+from lemmatizer import Lemmatizer  # noqa: E402
+
+VOCABULARY = os.path.join(BE_DIR, "static", "assets", "assets", "vocabulary.json")
+_TOKEN = re.compile(r"[A-Za-z][A-Za-z'’]*")
+
+GOLD = dict(pair.split(":") for pair in """
+    running:run runs:run ran:run making:make made:make using:use used:use studies:study studied:study
+    cities:city boxes:box watches:watch heroes:hero shoes:shoe houses:house buses:bus knives:knife
+    gloves:glove children:child children's:child women:woman mice:mouse teeth:tooth stopped:stop
+    planned:plan liked:like loved:love played:play cried:cry tried:try died:die lying:lie wanted:want
+    visited:visit related:relate changed:change arranged:arrange dancing:dance writing:write
+    coming:come eating:eat seeing:see swimming:swim getting:get sitting:sit going:go went:go
+    was:be were:be is:be has:have did:do thought:think bought:buy taught:teach caught:catch
+    news:news always:always bus:bus this:this species:species teacher:teacher computer:computer
+    player:player morning:morning nothing:nothing during:during hundred:hundred need:need
+    forest:forest clothes:clothes series:series analysis:analysis famous:famous
+""".split())
+
+
+def load(path=VOCABULARY):
+    with open(path, encoding="utf-8") as f:
+        categories = json.load(f)
+    items = [item for c in categories for item in c.get("words") or []]
+    vocabulary = {" ".join((i.get("word") or "").lower().split()).strip("'.?!") for i in items} - {""}
+    stream = [t.lower().strip("'.?!’") for i in items for t in _TOKEN.findall(i.get("example") or "")]
+    return vocabulary, [t for t in stream if t]
+
+
+def simulate(stream, key, seeded=()):
+    table = set(seeded)
+    hits = 0
+    for word in stream:
+        k = key(word)
+        if k in table:
+            hits += 1
+        else:
+            table.add(k)  # Một lần gọi AI + một dòng mới
+    return hits, len(stream) - hits, len(table) - len(seeded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1, help="lặp luồng từ (trộn thứ tự) để giống lượng tra thật")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vocabulary, sentences = load()
+    stream = list(sentences)
+    rnd = random.Random(args.seed)
+    for _ in range(args.repeat - 1):
+        extra = list(sentences)
+        rnd.shuffle(extra)
+        stream.extend(extra)
+    lemmatizer = Lemmatizer(known=vocabulary.__contains__)
+    print(f"{len(stream)} lượt tra, {len(set(stream))} dạng từ khác nhau, bộ từ vựng {len(vocabulary)} từ\n")
+
+    print(f"{'kịch bản':<22} {'trúng':>8} {'gọi AI':>8} {'dòng mới':>9} {'hit rate':>9}")
+    for scenario, seeded in (("cold", ()), ("prewarm", vocabulary)):
+        for label, key in (("trước", lambda w: w), ("sau", lemmatizer.lemma)):
+            hits, misses, rows = simulate(stream, key, seeded)
+            print(f"{scenario + ' ' + label:<22} {hits:>8} {misses:>8} {rows:>9} {hits / len(stream):>8.1%}")
+
+    # Quy tắc có sinh đúng ứng viên không: known = các dạng gốc trong bảng (với bộ từ vựng, "running"/"shoes"
+    # có mục riêng nên được giữ nguyên)
+    rules = Lemmatizer(known=set(GOLD.values()).__contains__)
+    wrong = {form: rules.lemma(form) for form, lemma in GOLD.items() if rules.lemma(form) != lemma}
+    print(f"\nQuy tắc (known = dạng gốc trong bảng): đúng {len(GOLD) - len(wrong)}/{len(GOLD)} cặp"
+          + (f", sai: {wrong}" if wrong else ""))
+    # Từ mà bỏ hậu tố sẽ ra một từ khác hẳn: không có trong known thì phải giữ nguyên
+    traps = ["earring", "herring", "darling", "united", "shred", "hatred", "sibling"]
+    changed = {w: lemmatizer.lemma(w) for w in traps if lemmatizer.lemma(w) != w}
+    print(f"Từ bẫy giữ nguyên: {len(traps) - len(changed)}/{len(traps)}" + (f", bị đổi: {changed}" if changed else ""))
+
+    words = list(set(stream))
+    started = time.perf_counter()
+    for word in words:
+        lemmatizer.lemma(word)
+    elapsed = time.perf_counter() - started
+    print(f"lemma(): {elapsed / len(words) * 1e6:.2f} µs / từ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Đo thông lượng /login lúc "cả lớp đăng nhập cùng lúc", so sánh:
+  - inline: băm mật khẩu ngay trên request thread (PASSWORD_HASH_WORKERS=0, như trước)
+  - pool:   băm trong ProcessPoolExecutor (PASSWORD_HASH_WORKERS=N)
+
+Mô phỏng một gunicorn worker (--threads 4): 4 thread gọi /login liên tục, song song
+một thread gọi /user-info để xem request nhẹ bị chậm đi bao nhiêu trong lúc đó.
+DB là SQLite tạm, không cần MySQL.
+
+Chạy:  python benchmarks/bench_login.py --logins 200 --threads 4 --hash-workers 2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(args):
+    sys.path.insert(0, BE_DIR)
+    import app as appmod  # noqa: E402
+
+    app = appmod.app
+    with app.app_context():
+        appmod.db.create_all()
+    client = app.test_client()
+    users = []
+    for i in range(args.threads):
+        r = client.post("/register", json={"name": f"U{i}", "username": f"bench{i}", "password": "secret-pass"})
+        users.append(r.get_json()["id"])
+
+    stop = threading.Event()
+    light = []
+
+    def light_traffic():
+        c = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            c.get(f"/user-info/{users[0]}")
+            light.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+
+    def login(n):
+        c = app.test_client()
+        start = time.perf_counter()
+        r = c.post("/login", json={"username": f"bench{n % args.threads}", "password": "secret-pass"})
+        assert r.status_code == 200, r.get_data(as_text=True)
+        return (time.perf_counter() - start) * 1000
+
+    login(0)  # warm-up (khởi động process pool)
+    watcher = threading.Thread(target=light_traffic)
+    watcher.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    watcher.join()
+
+    light.sort()
+    print(json.dumps({
+        "logins_per_s": round(args.logins / elapsed, 1),
+        "login_p50_ms": round(statistics.median(latencies), 1),
+        "user_info_p50_ms": round(statistics.median(light), 2),
+        "user_info_p99_ms": round(light[min(len(light) - 1, int(len(light) * 0.99))], 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_mode(args)
+
+    # Mỗi chế độ chạy trong process riêng vì cấu hình được đọc lúc import app
+    for label, workers in (("inline", 0), (f"pool({args.hash_workers})", args.hash_workers)):
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"),
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "bench"),
+            "PASSWORD_HASH_WORKERS": str(workers),
+        })
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", "--logins", str(args.logins), "--threads", str(args.threads)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{label:<10} " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh lấy 20 câu quiz ngẫu nhiên trên bảng quizzes 1 triệu dòng (SQLite tạm):
+  - ORDER BY RANDOM() LIMIT 20 (cách cũ, cả nhánh theo topic+level và nhánh fallback theo level)
+  - QuizSampler: mảng id trong RAM + một truy vấn id IN (...)
+
+Chạy:  python benchmarks/bench_quiz_sampling.py --rows 1000000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quiz_sampler import QuizSampler  # noqa: E402
+
+TOPICS = ["Animals", "Food", "Clothes", "Jobs", "Technology", "Sports"]
+LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE quizzes (id INTEGER PRIMARY KEY, topic VARCHAR(100), level VARCHAR(50), "
+        "type VARCHAR(50), question TEXT, options TEXT, answer INTEGER, explanation TEXT)"
+    )
+    options = json.dumps(["will have been working", "will be working", "have worked", "will have worked"])
+    batch = []
+    for i in range(rows):
+        batch.append((random.choice(TOPICS), random.choice(LEVELS), "text",
+                      f"Question {i}: By the time ..., the engineers _____ on the prototype.",
+                      options, i % 4, "Giải thích"))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO quizzes (topic, level, type, question, options, answer, explanation) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO quizzes (topic, level, type, question, options, answer, explanation) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.execute("CREATE INDEX ix_quizzes_topic_level ON quizzes (topic, level)")
+    conn.execute("CREATE INDEX ix_quizzes_level ON quizzes (level)")
+    conn.commit()
+    return conn
+
+
+def report(label, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<34} p50={statistics.median(ordered):9.3f} ms  p99={p99:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "quizzes.db")
+    t0 = time.perf_counter()
+    conn = build_db(path, args.rows)
+    print(f"Tạo {args.rows} dòng trong {time.perf_counter() - t0:.1f}s ({path})")
+
+    def load_ids(topic, level):
+        if topic is None:
+            return (r[0] for r in conn.execute("SELECT id FROM quizzes WHERE level = ?", (level,)))
+        return (r[0] for r in conn.execute("SELECT id FROM quizzes WHERE topic = ? AND level = ?", (topic, level)))
+
+    def fetch(ids):
+        marks = ",".join("?" * len(ids))
+        return conn.execute(f"SELECT * FROM quizzes WHERE id IN ({marks})", ids).fetchall()
+
+    pools = [(random.choice(TOPICS), random.choice(LEVELS)) for _ in range(args.queries)]
+
+    old_pool, old_level = [], []
+    for topic, level in pools:
+        start = time.perf_counter()
+        conn.execute("SELECT * FROM quizzes WHERE topic = ? AND level = ? ORDER BY RANDOM() LIMIT 20",
+                     (topic, level)).fetchall()
+        old_pool.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        conn.execute("SELECT * FROM quizzes WHERE level = ? ORDER BY RANDOM() LIMIT 20", (level,)).fetchall()
+        old_level.append((time.perf_counter() - start) * 1000)
+
+    sampler = QuizSampler(load_ids, ttl=3600)
+    t0 = time.perf_counter()
+    for topic in TOPICS:
+        for level in LEVELS:
+            sampler.ids_for((topic, level))
+    for level in LEVELS:
+        sampler.ids_for((None, level))
+    print(f"Nạp mảng id cho mọi pool: {(time.perf_counter() - t0) * 1000:.0f} ms (một lần mỗi TTL)")
+
+    new_pool, new_level = [], []
+    for n, (topic, level) in enumerate(pools):
+        user = f"user-{n % 20}"
+        start = time.perf_counter()
+        rows = fetch(sampler.sample(topic, level, 20, user_id=user))
+        new_pool.append((time.perf_counter() - start) * 1000)
+        assert len(rows) == 20
+        start = time.perf_counter()
+        fetch(sampler.sample(None, level, 20, user_id=user))
+        new_level.append((time.perf_counter() - start) * 1000)
+
+    report("ORDER BY RANDOM() (topic, level)", old_pool)
+    report("ORDER BY RANDOM() (level)", old_level)
+    report("QuizSampler (topic, level)", new_pool)
+    report("QuizSampler (level)", new_level)
+    conn.close()
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh độ trễ gọi upstream: requests.post(...) mỗi lần (cách cũ) và upstream.post(...) (pool keep-alive).
+
+Provider được giả lập bằng một HTTP server local:
+  --handshake-ms  độ trễ thêm vào khi mở một kết nối mới (mô phỏng TCP + TLS handshake)
+  --latency-ms    thời gian "sinh câu trả lời" của mỗi request
+
+Chạy:  python benchmarks/bench_upstream.py --requests 400 --concurrency 4
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+import upstream  # noqa: E402
+
+_REPLY = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+
+
+def make_handler(handshake_s, latency_s):
+    class FakeProviderHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Cho phép keep-alive
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            time.sleep(handshake_s)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency_s)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(_REPLY)))
+            self.end_headers()
+            self.wfile.write(_REPLY)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeProviderHandler
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def run(label, call, n, concurrency):
+    def timed(_):
+        start = time.perf_counter()
+        resp = call()
+        resp.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    call()  # warm-up
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(n)))
+    print(
+        f"{label:<22} p50={statistics.median(latencies):7.2f} ms  "
+        f"p99={percentile(latencies, 99):7.2f} ms  max={max(latencies):7.2f} ms"
+    )
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=120.0)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.handshake_ms / 1000, args.latency_ms / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    body = {"model": "fake", "messages": [{"role": "user", "content": "hi"}]}
+
+    print(f"{args.requests} requests, concurrency={args.concurrency}, "
+          f"handshake={args.handshake_ms} ms, latency={args.latency_ms} ms")
+    run("requests.post (cũ)", lambda: requests.post(url, json=body, timeout=25), args.requests, args.concurrency)
+    run("upstream.post (pool)", lambda: upstream.post("openai", url, json=body), args.requests, args.concurrency)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
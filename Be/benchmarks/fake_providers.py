@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Server giả lập các AI provider để đo tải mà không tốn quota thật.
+
+Trả lời đúng dạng mà các route đang gọi:
+  POST .../chat/completions          OpenAI / Groq (kể cả "stream": true → SSE,
+                                     response_format json_object → bộ câu hỏi quiz,
+                                     hoặc feedback theo lô nếu prompt có "Items (JSON): [...]")
+  POST .../models/<m>:generateContent Gemini (JSON từ điển cho từ trong prompt,
+                                     hoặc object {từ: entry} nếu prompt có "Words (JSON): [...]")
+  GET  /stats                        số lời gọi theo provider (đoạn đầu của path)
+  POST /stats/reset                  đặt lại bộ đếm
+
+Đặt base URL của app trỏ vào đây, ví dụ với --port 9100:
+  OPENAI_BASE_URL=http://127.0.0.1:9100/openai/v1
+  GROQ_BASE_URL=http://127.0.0.1:9100/groq/v1
+  GEMINI_BASE_URL=http://127.0.0.1:9100/gemini
+
+Chạy:  python benchmarks/fake_providers.py --port 9100 --latency-ms 400 --jitter-ms 100 --error-rate 0.02
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SPEAKING_QUESTIONS = "Do you enjoy cooking at home? How often do you eat out? What food is popular in your country?"
+_FEEDBACK = "Good answer with clear ideas. Try to vary your vocabulary and keep a steady pace."
+_WORD_RE = re.compile(r'từ: "([^"]+)"')
+_ITEMS_RE = re.compile(r"Items \(JSON\): (\[.*\])")
+_WORDS_RE = re.compile(r"Words \(JSON\): (\[.*\])")
+
+
+class FakeConfig:
+    def __init__(self, latency_ms=300.0, jitter_ms=0.0, error_rate=0.0, token_ms=15.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token_ms = token_ms
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self._question_ids = itertools.count(1)
+
+    def delay(self):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.random.random() < self.error_rate
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+        return fail
+
+    def record(self, provider):
+        with self.lock:
+            self.calls[provider] += 1
+
+    def quiz_batch(self, n=20):
+        quiz = []
+        for _ in range(n):
+            i = next(self._question_ids)
+            quiz.append({
+                "question": f"By the time benchmark run {i} finishes, the servers _____ for hours.",
+                "options": ["will have been running", "will be running", "have run", "will run"],
+                "answer": 0,
+                "explanation": "Thì tương lai hoàn thành tiếp diễn (câu hỏi giả lập).",
+            })
+        return {"quiz": quiz}
+
+
+def _chat_content(body, config):
+    text = " ".join(str(m.get("content", "")) for m in body.get("messages") or [])
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        items = _ITEMS_RE.search(text)
+        if items:
+            # Chấm speaking theo lô: một feedback cho mỗi item
+            feedback = [{"index": it["index"], "feedback": _FEEDBACK} for it in json.loads(items.group(1))]
+            return json.dumps({"feedback": feedback}, ensure_ascii=False)
+        return json.dumps(config.quiz_batch(), ensure_ascii=False)
+    if "Speaking Part 1" in text:
+        return _SPEAKING_QUESTIONS
+    return _FEEDBACK
+
+
+def _entry(word):
+    return {
+        "phonetic": f"/{word}/",
+        "word_type": "noun",
+        "definition": f"Nghĩa giả lập của {word}",
+        "examples": f"This is an example with {word}.",
+        "grammar_notes": "Danh từ đếm được.",
+    }
+
+
+def _dictionary_entry(prompt):
+    words = _WORDS_RE.search(prompt)
+    if words:
+        return json.dumps({w: _entry(w) for w in json.loads(words.group(1))}, ensure_ascii=False)
+    match = _WORD_RE.search(prompt)
+    return json.dumps(_entry(match.group(1) if match else "word"), ensure_ascii=False)
+
+
+def make_handler(config):
+    class FakeProviderHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _send_json(self, status, payload):
+            raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with config.lock:
+                    return self._send_json(200, dict(config.calls))
+            self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path == "/stats/reset":
+                with config.lock:
+                    config.calls.clear()
+                return self._send_json(200, {})
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                return self._send_json(400, {"error": {"message": "invalid JSON"}})
+
+            provider = self.path.strip("/").split("/", 1)[0]
+            config.record(provider)
+            if config.delay():
+                return self._send_json(503, {"error": {"message": "fake provider overloaded"}})
+
+            path = self.path.split("?", 1)[0]
+            if path.endswith("/chat/completions"):
+                content = _chat_content(body, config)
+                if body.get("stream"):
+                    return self._stream(content)
+                return self._send_json(200, {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+                })
+            if path.endswith(":generateContent"):
+                prompt = body["contents"][0]["parts"][0]["text"]
+                return self._send_json(200, {
+                    "candidates": [{"content": {"parts": [{"text": _dictionary_entry(prompt)}]}}]
+                })
+            self._send_json(404, {"error": {"message": f"unknown path {path}"}})
+
+        def _stream(self, content):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(data):
+                raw = data.encode("utf-8")
+                self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                self.wfile.flush()
+
+            for word in content.split(" "):
+                delta = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+                time.sleep(config.token_ms / 1000.0)
+            chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    return FakeProviderHandler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Hàng trăm kết nối mở cùng lúc khi đo chế độ async
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Chạy server trong thread nền, trả về (server, base_url)."""
+    server = FakeServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="độ trễ mỗi lời gọi provider")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="dao động ± quanh latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ trả 503 (0..1)")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="khoảng cách giữa các chunk khi stream")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return FakeConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.token_ms, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = FakeServer((args.host, args.port), make_handler(config_from_args(args)))
+    print(f"Fake providers tại http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
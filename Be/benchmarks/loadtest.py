@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Đo tải toàn bộ backend với provider AI giả lập (benchmarks/fake_providers.py) và DB SQLite tạm.
+
+Mỗi lần chạy:
+  1. bật fake provider và app (server thật, trong process riêng) với DB trống,
+  2. chạy lần lượt các kịch bản, mỗi kịch bản --requests thao tác với --concurrency client song song,
+  3. in bảng thông lượng + percentile độ trễ, ghi ra JSON (--out) để so sánh giữa các commit.
+
+Kịch bản:
+  login       cả lớp đăng nhập cùng lúc (POST /login, mỗi client một tài khoản)
+  dictionary  tra từ /gemini/chat, từ được chọn lệch (vài từ rất phổ biến, nhiều từ hiếm)
+  quiz        /deepseek/generate-quiz với 6 topic x 3 level, mỗi client một user_id
+  speaking    một phiên nói: /ai/speaking/start + 3 lượt /ai/speaking/feedback
+  speaking_batch  như speaking nhưng chấm cả 3 câu bằng một lần /ai/speaking/feedback-batch
+
+Chạy:
+  python benchmarks/loadtest.py --requests 200 --concurrency 8 --out before.json
+  python benchmarks/loadtest.py --server gunicorn --workers 2 --threads 4 --out after.json
+  python benchmarks/loadtest.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ("login", "dictionary", "quiz", "speaking", "speaking_batch")
+TOPICS = ("Animals", "Food", "Clothes", "Jobs", "Technology", "Sports")
+LEVELS = ("Beginner", "Intermediate", "Advanced")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def wait_http(url, timeout=30.0, proc=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"Process thoát sớm (mã {proc.returncode}) khi chờ {url}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"Hết thời gian chờ {url}")
+
+
+# ============================================================
+# Kịch bản: mỗi hàm chạy một thao tác, trả về (ok, ghi chú)
+# ============================================================
+class Context:
+    def __init__(self, base, vocab):
+        self.base = base
+        self.users = []
+        self.words = [f"benchword{i}" for i in range(vocab)]
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        # Mỗi client (thread) một Session keep-alive, giống một app Flutter đang mở
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def post(self, path, payload):
+        return self.http.post(self.base + path, json=payload, timeout=120)
+
+
+def setup_login(ctx, concurrency):
+    for i in range(concurrency):
+        username = f"loadtest{i}"
+        resp = ctx.post("/register", {"name": f"Load {i}", "username": username, "password": "secret-pass"})
+        user_id = resp.json().get("id") if resp.status_code == 201 else None
+        ctx.users.append((username, user_id))
+
+
+def op_login(ctx, i, rnd):
+    username, _ = ctx.users[i % len(ctx.users)]
+    resp = ctx.post("/login", {"username": username, "password": "secret-pass"})
+    return resp.status_code == 200 and "token" in resp.json(), str(resp.status_code)
+
+
+def op_dictionary(ctx, i, rnd):
+    # Phân bố lệch kiểu Zipf: chỉ số nhỏ (từ phổ biến) được chọn nhiều hơn hẳn
+    idx = min(len(ctx.words) - 1, int(rnd.paretovariate(1.2)) - 1)
+    resp = ctx.post("/gemini/chat", {"message": ctx.words[idx]})
+    body = resp.json()
+    return resp.status_code == 200 and "word" in body, body.get("source", "error")
+
+
+def op_quiz(ctx, i, rnd):
+    _, user_id = ctx.users[i % len(ctx.users)] if ctx.users else (None, None)
+    resp = ctx.post("/deepseek/generate-quiz", {
+        "topic": rnd.choice(TOPICS), "level": rnd.choice(LEVELS), "user_id": user_id,
+    })
+    body = resp.json()
+    return resp.status_code == 200 and len(body.get("quiz") or []) == 20, body.get("source", "error")
+
+
+def op_speaking(ctx, i, rnd):
+    _, user_id = ctx.users[i % len(ctx.users)] if ctx.users else (None, None)
+    resp = ctx.post("/ai/speaking/start", {"topic": rnd.choice(TOPICS), "user_id": user_id})
+    if resp.status_code != 200:
+        return False, f"start {resp.status_code}"
+    session = resp.json()
+    for question in session.get("questions") or ["Tell me about yourself?"]:
+        resp = ctx.post("/ai/speaking/feedback", {
+            "session_id": session["session_id"], "question": question,
+            "answer": "I usually cook at home because it is cheaper and healthier.",
+        })
+        if resp.status_code != 200 or not resp.json().get("feedback"):
+            return False, f"feedback {resp.status_code}"
+    return True, "ok"
+
+
+def op_speaking_batch(ctx, i, rnd):
+    _, user_id = ctx.users[i % len(ctx.users)] if ctx.users else (None, None)
+    resp = ctx.post("/ai/speaking/start", {"topic": rnd.choice(TOPICS), "user_id": user_id})
+    if resp.status_code != 200:
+        return False, f"start {resp.status_code}"
+    session = resp.json()
+    questions = session.get("questions") or ["Tell me about yourself?"]
+    resp = ctx.post("/ai/speaking/feedback-batch", {
+        "session_id": session["session_id"],
+        "answers": [{"question": q, "answer": "I usually cook at home because it is cheaper and healthier."}
+                    for q in questions],
+    })
+    results = (resp.json().get("results") or []) if resp.status_code == 200 else []
+    if len(results) != len(questions):
+        return False, f"feedback-batch {resp.status_code}"
+    return True, "ok"
+
+
+OPERATIONS = {
+    "login": op_login,
+    "dictionary": op_dictionary,
+    "quiz": op_quiz,
+    "speaking": op_speaking,
+    "speaking_batch": op_speaking_batch,
+}
+
+
+def run_scenario(name, ctx, n, concurrency, fake_base, seed):
+    fn = OPERATIONS[name]
+    requests.post(fake_base + "/stats/reset", timeout=5)
+
+    def timed(i):
+        rnd = random.Random(seed * 100003 + i)
+        start = time.perf_counter()
+        try:
+            ok, note = fn(ctx, i, rnd)
+        except Exception as e:
+            ok, note = False, type(e).__name__
+        return (time.perf_counter() - start) * 1000, ok, note
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(n)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [r[0] for r in results]
+    return {
+        "ops": n,
+        "errors": sum(1 for r in results if not r[1]),
+        "ops_per_s": round(n / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "outcomes": dict(Counter(r[2] for r in results)),
+        "upstream_calls": requests.get(fake_base + "/stats", timeout=5).json(),
+    }
+
+
+# ============================================================
+# Bật fake provider + app
+# ============================================================
+def serve_app(port):
+    """Chạy trong process con: tạo bảng rồi phục vụ app bằng server đa luồng của werkzeug."""
+    sys.path.insert(0, BE_DIR)
+    from werkzeug.serving import run_simple
+    import app as appmod
+
+    with appmod.app.app_context():
+        appmod.db.create_all()
+    run_simple("127.0.0.1", port, appmod.app, threaded=True)
+
+
+def start_stack(args, workdir):
+    fake_port, app_port = free_port(), free_port()
+    fake_base = f"http://127.0.0.1:{fake_port}"
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_providers.py"), "--port", str(fake_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--token-ms", str(args.token_ms), "--seed", str(args.seed),
+    ], stdout=subprocess.DEVNULL)
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, "loadtest.db"),
+        "SECRET_KEY": "loadtest",
+        "OPENAI_API_KEY": "fake", "GEMINI_API_KEY": "fake", "GROQ_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{fake_base}/openai/v1",
+        "GROQ_BASE_URL": f"{fake_base}/groq/v1",
+        "GEMINI_BASE_URL": f"{fake_base}/gemini",
+        "AVATAR_STORE_DIR": os.path.join(workdir, "avatars"),
+        "LOCK_DIR": os.path.join(workdir, "locks"),
+    })
+    log = open(os.path.join(workdir, "app.log"), "w")
+    if args.server == "gunicorn":
+        subprocess.run([sys.executable, "-c", "import app; app.app.app_context().push(); app.db.create_all()"],
+                       cwd=BE_DIR, env=env, check=True, stdout=log, stderr=subprocess.STDOUT)
+        cmd = [sys.executable, "-m", "gunicorn", "--worker-class", "sync", "--threads", str(args.threads),
+               "--workers", str(args.workers), "--bind", f"127.0.0.1:{app_port}", "app:app"]
+    else:
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve-app", str(app_port)]
+    app_proc = subprocess.Popen(cmd, cwd=BE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    try:
+        wait_http(fake_base + "/stats", proc=fake)
+        wait_http(f"http://127.0.0.1:{app_port}/health", proc=app_proc)
+    except Exception:
+        for proc in (fake, app_proc):
+            proc.kill()
+        raise
+    return fake, app_proc, fake_base, f"http://127.0.0.1:{app_port}"
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_results(result):
+    print(f"\n{'scenario':<14} {'ops/s':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'errors':>7}  upstream calls")
+    for name, s in result["scenarios"].items():
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(s["upstream_calls"].items())) or "-"
+        print(f"{name:<14} {s['ops_per_s']:>8.2f} {s['p50_ms']:>7.1f}ms {s['p90_ms']:>7.1f}ms "
+              f"{s['p99_ms']:>7.1f}ms {s['errors']:>7}  {calls}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('revision') or old_path} → {new.get('revision') or new_path}")
+    print(f"{'scenario':<14} {'metric':<10} {'old':>10} {'new':>10} {'change':>9}")
+    for name, s_new in new["scenarios"].items():
+        s_old = old["scenarios"].get(name)
+        if not s_old:
+            continue
+        for metric in ("ops_per_s", "p50_ms", "p90_ms", "p99_ms", "errors"):
+            a, b = s_old[metric], s_new[metric]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+            print(f"{name:<14} {metric:<10} {a:>10} {b:>10} {change:>9}")
+
+
+def main():
+    sys.path.insert(0, HERE)
+    import fake_providers
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="danh sách, cách nhau bởi dấu phẩy")
+    parser.add_argument("--requests", type=int, default=200, help="số thao tác mỗi kịch bản")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--vocab", type=int, default=300, help="số từ khác nhau trong kịch bản dictionary")
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=1, help="số gunicorn worker")
+    parser.add_argument("--threads", type=int, default=4, help="số thread mỗi gunicorn worker")
+    parser.add_argument("--out", help="ghi kết quả JSON ra file")
+    parser.add_argument("--label", help="tên lần chạy (mặc định: commit hiện tại)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="so sánh hai file JSON kết quả")
+    parser.add_argument("--serve-app", type=int, help=argparse.SUPPRESS)
+    fake_providers.add_arguments(parser)
+    parser.set_defaults(seed=1)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        return serve_app(args.serve_app)
+    if args.compare:
+        return compare(*args.compare)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Kịch bản không hợp lệ: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    fake, app_proc, fake_base, base = start_stack(args, workdir)
+    try:
+        ctx = Context(base, args.vocab)
+        setup_login(ctx, args.concurrency)
+        result = {
+            "label": args.label,
+            "revision": git_revision(),
+            "config": {k: getattr(args, k) for k in (
+                "requests", "concurrency", "vocab", "server", "workers", "threads",
+                "latency_ms", "jitter_ms", "error_rate", "token_ms", "seed",
+            )},
+            "scenarios": {},
+        }
+        for name in scenarios:
+            print(f"▶ {name} ...", flush=True)
+            result["scenarios"][name] = run_scenario(name, ctx, args.requests, args.concurrency, fake_base, args.seed)
+    finally:
+        for proc in (app_proc, fake):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi {args.out}")
+
+
+if __name__ == "__main__":
+    main()
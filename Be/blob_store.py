@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+🖼️ Kho file theo nội dung (content-addressed) trên đĩa local, dùng cho ảnh đại diện.
+
+Mỗi file được đặt tên theo sha256 của nội dung: <root>/<2 ký tự đầu>/<hash>.
+Cùng một ảnh chỉ lưu một lần, và URL của một hash không bao giờ đổi nội dung
+→ client/CDN cache được vĩnh viễn (ETag = hash).
+
+Ảnh thu nhỏ (<hash>.thumb) được tạo bằng Pillow nếu có cài; không có Pillow thì dùng luôn ảnh gốc.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow là tuỳ chọn
+    Image = None
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def sniff_mimetype(head):
+    for magic, mimetype in _MAGIC:
+        if head.startswith(magic):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def decode_base64_image(data):
+    """Nhận chuỗi base64 (có hoặc không có tiền tố data:image/...;base64,) → bytes ảnh."""
+    if "," in data[:100] and data.startswith("data:"):
+        data = data.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(data, validate=False)
+    except (binascii.Error, ValueError):
+        raise InvalidImage("Ảnh base64 không hợp lệ")
+    if not sniff_mimetype(raw[:12]):
+        raise InvalidImage("Chỉ hỗ trợ ảnh PNG, JPEG, GIF hoặc WEBP")
+    return raw
+
+
+class BlobStore:
+    def __init__(self, root, thumb_size=128):
+        self.root = root
+        self.thumb_size = thumb_size
+
+    @staticmethod
+    def is_valid_hash(digest):
+        return bool(digest) and bool(_HASH_RE.match(digest))
+
+    def path(self, digest, variant=None):
+        name = f"{digest}.{variant}" if variant else digest
+        return os.path.join(self.root, digest[:2], name)
+
+    def exists(self, digest, variant=None):
+        return os.path.exists(self.path(digest, variant))
+
+    def _write(self, path, data):
+        # Ghi ra file tạm rồi rename → không bao giờ đọc phải file ghi dở
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _thumbnail(self, data):
+        if Image is None:
+            return data
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img = img.convert("RGB")
+                img.thumbnail((self.thumb_size, self.thumb_size))
+                out = io.BytesIO()
+                img.save(out, format="JPEG", quality=85, optimize=True)
+                return out.getvalue()
+        except Exception as e:
+            print(f"⚠️ [BLOB] Không tạo được thumbnail: {e}")
+            return data
+
+    def put_image(self, data):
+        """Lưu ảnh gốc + thumbnail, trả về hash. Ảnh đã có thì không ghi lại."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.exists(digest):
+            self._write(self.path(digest), data)
+        if not self.exists(digest, "thumb"):
+            self._write(self.path(digest, "thumb"), self._thumbnail(data))
+        return digest
+
+    def read(self, digest, variant=None):
+        with open(self.path(digest, variant), "rb") as f:
+            return f.read()
+
+    def read_base64(self, digest, variant=None):
+        try:
+            return base64.b64encode(self.read(digest, variant)).decode("ascii")
+        except FileNotFoundError:
+            return None
+
+    def mimetype(self, digest, variant=None):
+        with open(self.path(digest, variant), "rb") as f:
+            return sniff_mimetype(f.read(12)) or "application/octet-stream"
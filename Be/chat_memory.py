@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+🧠 Bộ nhớ hội thoại phía server cho /ai/chat (bảng conversations + conversation_messages).
+
+Client chỉ gửi conversation_id + tin nhắn mới thay vì cả mảng history. Prompt được dựng theo ngân sách token:
+  system prompt + tóm tắt cuốn chiếu (≤ summary_tokens) + các tin nhắn gần nhất (≤ history_tokens) + tin nhắn mới
+→ kích thước prompt có trần, không phụ thuộc cuộc trò chuyện dài bao nhiêu.
+
+- Token được ước lượng ~ 4 ký tự / token (estimate_tokens), lưu sẵn vào từng dòng lúc ghi.
+- Tin nhắn rơi khỏi cửa sổ gần nhất mà chưa được tóm tắt: khi tích đủ fold_tokens thì một job nền gộp chúng
+  (cùng bản tóm tắt cũ, cũ nhất trước, từng đoạn) thành bản tóm tắt mới bằng LLM. Request không bao giờ chờ việc tóm tắt;
+  trong lúc chờ, phần đó chỉ đơn giản không có trong prompt.
+- Mỗi hội thoại có tối đa một job tóm tắt đang chạy; cập nhật summary kiểu optimistic (so summarized_until)
+  nên hai worker cùng tóm tắt cũng không ghi đè lên nhau.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app import app, db, Conversation, ConversationMessage
+
+_SCAN_LIMIT = 200  # Số tin nhắn tối đa đọc mỗi lần / mỗi đoạn tóm tắt (giới hạn cả thời gian đọc lẫn prompt tóm tắt)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Bạn tóm tắt cuộc trò chuyện giữa người học tiếng Anh và trợ giảng. "
+    "Giữ lại thông tin về người học (trình độ, mục tiêu, lỗi hay mắc), các chủ đề đã bàn và các việc còn dở. "
+    "Chỉ trả về bản tóm tắt, viết liền, không gạch đầu dòng."
+)
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (~4 ký tự / token), đủ dùng để chia ngân sách prompt."""
+    return (len(text or "") + 3) // 4
+
+
+class ChatMemory:
+    def __init__(self, summarize, history_tokens=1500, summary_tokens=300, fold_tokens=600, max_workers=2):
+        """
+        summarize(messages, max_tokens) -> text: gọi LLM (chạy trong thread nền, có app context).
+        history_tokens: ngân sách cho các tin nhắn giữ nguyên văn.
+        summary_tokens: độ dài tối đa của bản tóm tắt.
+        fold_tokens: tóm tắt khi phần đã rơi khỏi cửa sổ mà chưa tóm tắt đạt ngưỡng này.
+        """
+        self.summarize = summarize
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.fold_tokens = fold_tokens
+        self.max_workers = max_workers
+        self._executor = None
+        self._folding = set()
+        self._lock = threading.Lock()
+        self.folds = 0
+        self.fold_errors = 0
+
+    def _get_executor(self):
+        # Tạo lười để thread pool được sinh ra trong worker sau khi fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-summary")
+        return self._executor
+
+    # ---------- Đọc ----------
+    def _window(self, conversation):
+        """(tin nhắn giữ nguyên văn theo thứ tự thời gian, tin nhắn chưa tóm tắt đã rơi khỏi cửa sổ trong _SCAN_LIMIT dòng mới nhất)."""
+        rows = (ConversationMessage.query
+                .filter(ConversationMessage.conversation_id == conversation.id,
+                        ConversationMessage.id > conversation.summarized_until)
+                .order_by(ConversationMessage.id.desc())
+                .limit(_SCAN_LIMIT).all())
+        used, size = 0, 0
+        for row in rows:
+            if used + row.tokens > self.history_tokens:
+                break
+            used += row.tokens
+            size += 1
+        recent = rows[:size]
+        recent.reverse()
+        older = rows[size:]
+        older.reverse()
+        return recent, older
+
+    def open(self, conversation_id, user_id=None):
+        """
+        Lấy (hoặc tạo mới nếu conversation_id rỗng) hội thoại.
+        Trả về dict {conversation_id, summary, recent, pending_tokens}; None nếu không tồn tại / không thuộc user_id.
+        """
+        if conversation_id:
+            conversation = db.session.get(Conversation, conversation_id)
+            if conversation is None or (user_id and conversation.user_id and conversation.user_id != user_id):
+                return None
+            recent, older = self._window(conversation)
+        else:
+            conversation = Conversation(user_id=user_id)
+            db.session.add(conversation)
+            db.session.commit()
+            recent, older = [], []
+        return {
+            "conversation_id": conversation.id,
+            "summary": conversation.summary,
+            "recent": [{"role": m.role, "content": m.content} for m in recent],
+            "pending_tokens": sum(m.tokens for m in older),
+        }
+
+    @staticmethod
+    def messages(memory, system_prompt, msg):
+        """Dựng prompt cho lượt chat mới từ kết quả open()."""
+        messages = [{"role": "system", "content": system_prompt}]
+        if memory["summary"]:
+            messages.append({"role": "system", "content": f"Tóm tắt phần trước của cuộc trò chuyện: {memory['summary']}"})
+        messages.extend(memory["recent"])
+        messages.append({"role": "user", "content": msg})
+        return messages
+
+    # ---------- Ghi ----------
+    def remember(self, memory, msg, reply):
+        """Lưu lượt hỏi/đáp vừa xong; xếp job tóm tắt nếu phần rơi khỏi cửa sổ đã đủ lớn."""
+        conversation_id = memory["conversation_id"]
+        now = datetime.utcnow()
+        db.session.add_all([
+            ConversationMessage(conversation_id=conversation_id, role="user", content=msg,
+                                tokens=estimate_tokens(msg), created_at=now),
+            ConversationMessage(conversation_id=conversation_id, role="assistant", content=reply,
+                                tokens=estimate_tokens(reply), created_at=now),
+        ])
+        db.session.query(Conversation).filter(Conversation.id == conversation_id).update({"updated_at": now})
+        db.session.commit()
+        # Lượt vừa lưu đẩy thêm tin nhắn ra khỏi cửa sổ: ước lượng thô, job nền sẽ tính lại chính xác
+        pending = memory["pending_tokens"] + estimate_tokens(msg) + estimate_tokens(reply)
+        if pending >= self.fold_tokens:
+            self.schedule_fold(conversation_id)
+
+    # ---------- Tóm tắt cuốn chiếu ----------
+    def schedule_fold(self, conversation_id):
+        with self._lock:
+            if conversation_id in self._folding:
+                return False
+            self._folding.add(conversation_id)
+            executor = self._get_executor()
+        executor.submit(self._run_fold, conversation_id)
+        return True
+
+    def _run_fold(self, conversation_id):
+        try:
+            with app.app_context():
+                try:
+                    self.fold(conversation_id)
+                except Exception as e:
+                    db.session.rollback()
+                    self.fold_errors += 1
+                    print(f"⚠️ [CHAT-MEMORY] Tóm tắt hội thoại {conversation_id} lỗi: {e}")
+        finally:
+            with self._lock:
+                self._folding.discard(conversation_id)
+
+    def _summary_messages(self, summary, older):
+        lines = "\n".join(f"{m.role}: {m.content}" for m in older)
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": (
+                f"Tóm tắt hiện có: {summary or '(chưa có)'}\n\n"
+                f"Đoạn hội thoại tiếp theo:\n{lines}\n\n"
+                f"Viết lại bản tóm tắt gộp cả hai, tối đa khoảng {self.summary_tokens * 3 // 4} từ."
+            )},
+        ]
+
+    def _next_chunk(self, conversation):
+        """
+        Các tin nhắn chưa tóm tắt cũ nhất (tối đa _SCAN_LIMIT, theo thứ tự id) nằm trước cửa sổ giữ nguyên văn.
+        Đọc từ summarized_until trở đi nên không bỏ sót tin nhắn nào dù phần chưa tóm tắt dài hơn _SCAN_LIMIT.
+        """
+        recent, older = self._window(conversation)
+        if not older:
+            return []
+        keep_from = recent[0].id if recent else older[-1].id + 1
+        return (ConversationMessage.query
+                .filter(ConversationMessage.conversation_id == conversation.id,
+                        ConversationMessage.id > conversation.summarized_until,
+                        ConversationMessage.id < keep_from)
+                .order_by(ConversationMessage.id)
+                .limit(_SCAN_LIMIT).all())
+
+    def fold(self, conversation_id):
+        """
+        Gộp các tin nhắn đã rơi khỏi cửa sổ vào summary, cũ nhất trước, từng đoạn _SCAN_LIMIT tin nhắn.
+        summarized_until chỉ tiến tới tin nhắn cuối của đoạn vừa tóm tắt thành công; tóm tắt lỗi thì giữ nguyên
+        để lần sau làm lại đúng đoạn đó. Trả về số tin nhắn đã gộp.
+        """
+        folded = 0
+        while True:
+            conversation = db.session.get(Conversation, conversation_id)
+            if conversation is None:
+                return folded
+            chunk = self._next_chunk(conversation)
+            if sum(m.tokens for m in chunk) < self.fold_tokens:
+                return folded
+            previous = conversation.summarized_until
+            summary = (self.summarize(self._summary_messages(conversation.summary, chunk), self.summary_tokens) or "").strip()
+            if not summary or summary.startswith("[Fallback]"):
+                return folded
+            updated = (db.session.query(Conversation)
+                       .filter(Conversation.id == conversation_id, Conversation.summarized_until == previous)
+                       .update({"summary": summary, "summarized_until": chunk[-1].id}))
+            db.session.commit()
+            if not updated:
+                return folded  # Worker khác vừa tóm tắt: để nó làm tiếp
+            self.folds += 1
+            folded += len(chunk)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+🧰 Câu lệnh SQL ghi hàng loạt, tự chọn cú pháp theo dialect của DB đang dùng (MySQL / PostgreSQL / SQLite).
+
+Kèm add_missing_schema(): thêm cột/index mới của model vào bảng đã có (db.create_all() không sửa bảng cũ).
+"""
+from sqlalchemy import func, insert, inspect, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+def _dialect_name(executor):
+    # Nhận cả Session lẫn Connection (ví dụ connection trong mapper event)
+    if hasattr(executor, "dialect"):
+        return executor.dialect.name
+    return executor.get_bind().dialect.name
+
+
+def insert_ignore(session, table, rows):
+    """
+    INSERT nhiều dòng trong một câu lệnh, bỏ qua dòng trùng unique key thay vì báo lỗi.
+    Trả về số dòng thực sự được thêm.
+    """
+    if not rows:
+        return 0
+    dialect = _dialect_name(session)
+    if dialect == "mysql":
+        stmt = mysql.insert(table).prefix_with("IGNORE")
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    else:
+        stmt = insert(table)
+    result = session.execute(stmt, rows)
+    return max(result.rowcount, 0)
+
+
+def upsert_increment(executor, table, keys, column, delta):
+    """
+    Cộng delta vào cột đếm của dòng có khoá keys (dict), tạo dòng nếu chưa có.
+    Chạy trong transaction hiện tại của executor (Session hoặc Connection).
+    """
+    col = table.c[column]
+    dialect = _dialect_name(executor)
+    values = dict(keys, **{column: delta})
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update({column: col + delta})
+    elif dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        stmt = module.insert(table).values(**values).on_conflict_do_update(
+            index_elements=list(keys), set_={column: col + delta}
+        )
+    else:
+        where = [table.c[k] == v for k, v in keys.items()]
+        if executor.execute(update(table).where(*where).values({column: col + delta})).rowcount:
+            return
+        stmt = insert(table).values(**values)
+    executor.execute(stmt)
+
+
+def upsert_rows(session, table, rows, keys, fill_only=False):
+    """
+    INSERT nhiều dòng trong một câu lệnh; dòng đã có (trùng unique key keys) thì cập nhật các cột còn lại.
+    fill_only=True: chỉ điền vào cột đang NULL/rỗng, không ghi đè dữ liệu đã có.
+    Các dòng phải có cùng tập cột. Chạy trong transaction hiện tại của session.
+    """
+    if not rows:
+        return 0
+    columns = [c for c in rows[0] if c not in keys]
+    dialect = _dialect_name(session)
+
+    def merged(current, incoming):
+        return func.coalesce(func.nullif(current, ""), incoming) if fill_only else incoming
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update({c: merged(table.c[c], stmt.inserted[c]) for c in columns})
+    elif dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        stmt = module.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys), set_={c: merged(table.c[c], stmt.excluded[c]) for c in columns}
+        )
+    else:
+        for row in rows:
+            where = [table.c[k] == row[k] for k in keys]
+            if session.execute(select(table.c[keys[0]]).where(*where)).first() is None:
+                session.execute(insert(table).values(**row))
+            else:
+                session.execute(update(table).where(*where).values(
+                    {c: merged(table.c[c], row[c]) for c in columns}
+                ))
+        return len(rows)
+    session.execute(stmt, rows)
+    return len(rows)
+
+
+def add_missing_schema(engine, table, columns=(), indexes=()):
+    """
+    ALTER TABLE ... ADD COLUMN các cột `columns` và CREATE INDEX các index `indexes` (tên) của `table`
+    (sqlalchemy.Table) nếu DB chưa có. Cột được thêm dạng NULL, kiểu theo dialect (vd DATETIME(6) trên MySQL).
+    Bảng chưa tồn tại → bỏ qua (create_all sẽ tạo đủ). Chạy lại nhiều lần không sao; nhiều worker chạy cùng lúc
+    thì worker chậm chân thấy lỗi "đã tồn tại" và bỏ qua. Trả về list các thay đổi đã làm.
+    """
+    if not inspect(engine).has_table(table.name):
+        return []
+    preparer = engine.dialect.identifier_preparer
+    changes = []
+
+    def existing_columns():
+        return {c["name"] for c in inspect(engine).get_columns(table.name)}
+
+    def existing_indexes():
+        return {i["name"] for i in inspect(engine).get_indexes(table.name)}
+
+    def run(name, ddl, exists):
+        try:
+            with engine.begin() as conn:
+                ddl(conn)
+        except DBAPIError:
+            if name not in exists():
+                raise
+            return  # Worker khác vừa thêm xong
+        changes.append(name)
+
+    have = existing_columns()
+    for name in columns:
+        if name in have:
+            continue
+        column = table.c[name]
+        sql = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} "
+               f"{column.type.compile(dialect=engine.dialect)} NULL")
+        run(name, lambda conn: conn.execute(text(sql)), existing_columns)
+
+    have = existing_indexes()
+    for index in table.indexes:
+        if index.name in indexes and index.name not in have:
+            run(index.name, index.create, existing_indexes)
+    return [f"{table.name}.{name}" for name in changes]
@@ -1,59 +1,145 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
-import os, requests, json
-from sqlalchemy import func
+import os, json
+import metrics
+from provider_router import ProviderRouter, chat_providers, parse_json_reply
+from quiz_replenisher import QuizReplenisher
+from quiz_sampler import QuizSampler
+from db_helpers import insert_ignore
 
 deepseek_bp = Blueprint("deepseek_bp", __name__)
 CORS(deepseek_bp)
 
-GROQ_KEY = os.getenv("GROQ_API_KEY")
-GROQ_BASE = "https://api.groq.com/openai/v1"
+# Sinh quiz bằng provider kiểu OpenAI nhanh/khỏe nhất (QUIZ_PROVIDERS, mặc định Groq rồi OpenAI)
+QUIZ_PROVIDERS = chat_providers("QUIZ_PROVIDERS", "groq,openai")
+quiz_router = ProviderRouter("quiz")
+
+def _fill_pool_batch(topic, level):
+    from app import app
+    with app.app_context():
+        new_ids = generate_twenty_grammar_questions(topic, level)
+        quiz_sampler.add_ids((topic, level), new_ids)
+        quiz_sampler.add_ids((None, level), new_ids)
+        return len(new_ids)
+
+def _count_pool(topic, level):
+    from app import app, QuizCounter
+    with app.app_context():
+        return QuizCounter.get(topic, level)
+
+def _load_pool_ids(topic, level):
+    from app import db, Quiz
+    query = db.session.query(Quiz.id).filter(Quiz.level == level)
+    if topic is not None:
+        query = query.filter(Quiz.topic == topic)
+    return (row[0] for row in query.yield_per(20000))
+
+def _fetch_questions(ids):
+    from app import Quiz
+    if not ids:
+        return []
+    by_id = {q.id: q for q in Quiz.query.filter(Quiz.id.in_(ids)).all()}
+    return [by_id[i] for i in ids if i in by_id]
+
+# Mảng id của từng pool nằm trong RAM để lấy ngẫu nhiên mà không ORDER BY RANDOM()
+quiz_sampler = QuizSampler(
+    _load_pool_ids,
+    ttl=float(os.getenv("QUIZ_SAMPLER_TTL", 300)),
+    recent_per_user=int(os.getenv("QUIZ_RECENT_PER_USER", 200)),
+    max_pools=int(os.getenv("QUIZ_SAMPLER_MAX_POOLS", 256)),
+)
+
+# Bổ sung câu hỏi ở nền khi pool (topic, level) dưới ngưỡng
+quiz_replenisher = QuizReplenisher(
+    _fill_pool_batch, _count_pool,
+    low_water=int(os.getenv("QUIZ_POOL_LOW_WATER", 800)),
+    max_workers=int(os.getenv("QUIZ_REPLENISH_WORKERS", 2)),
+    max_batches=int(os.getenv("QUIZ_REPLENISH_MAX_BATCHES", 5)),
+    retry_backoff=float(os.getenv("QUIZ_REPLENISH_RETRY_SECONDS", 60)),
+    max_pools=int(os.getenv("QUIZ_REPLENISH_MAX_POOLS", 1000)),
+)
+
+QUIZ_POOLS = metrics.gauge("quiz_pools", "Số pool (topic, level) theo trạng thái bổ sung", ("state",))
+
+@metrics.on_scrape
+def collect_quiz_metrics():
+    stats = quiz_sampler.stats()
+    # hit: lấy mẫu từ mảng id trong RAM; miss: phải nạp lại id từ DB
+    metrics.export_cache("quiz_pool", stats["hits"], stats["loads"], stats["ids"])
+    states = {}
+    for pool in quiz_replenisher.status()["pools"]:
+        states[pool["state"]] = states.get(pool["state"], 0) + 1
+    for state in ("idle", "queued", "filling", "full", "stalled"):
+        QUIZ_POOLS.set(state, value=states.get(state, 0))
+
+def _quiz_request(data):
+    """(topic, level, user_id) từ body của /deepseek/generate-quiz."""
+    topic = str(data.get("topic", "General English")).strip()
+    level = str(data.get("level", "Intermediate")).strip()
+    return topic, level, data.get("user_id")
+
+def _plan_quiz(topic, level, current_count):
+    """Không chờ AI trong request: pool thiếu thì xếp job bổ sung ở nền; trả về source ban đầu."""
+    quiz_replenisher.ensure(topic, level, current_count)
+    return "database_full" if current_count >= quiz_replenisher.low_water else "database_partial"
+
+def _pick_quiz_ids(topic, level, user_id, source):
+    picked = quiz_sampler.sample(topic, level, 20, user_id=user_id)
+
+    if len(picked) < 20:
+        # Pool của topic còn ít → bù thêm câu cùng level
+        extra = quiz_sampler.sample(None, level, 20 - len(picked), user_id=user_id, exclude=picked)
+        if extra and not picked:
+            source = "fallback_db"
+        picked += extra
+    return picked, source
+
+def _quiz_payload(source, current_count, topic, level, questions):
+    return {
+        "status": "success",
+        "source": source,
+        "total_in_db": current_count,
+        "topic": topic,
+        "level": level,
+        "quiz": [{
+            "question": q.question,
+            "options": q.options if isinstance(q.options, list) else json.loads(q.options),
+            "answer": q.answer,
+            "explanation": q.explanation
+        } for q in questions[:20]]
+    }
 
 @deepseek_bp.route("/deepseek/generate-quiz", methods=["POST"])
 def get_quiz():
-    from app import db, Quiz 
+    from app import QuizCounter
     try:
-        data = request.get_json(silent=True) or {}
-        topic = str(data.get("topic", "General English")).strip()
-        level = str(data.get("level", "Intermediate")).strip()
+        topic, level, user_id = _quiz_request(request.get_json(silent=True) or {})
 
-        current_count = Quiz.query.filter_by(topic=topic, level=level).count()
+        current_count = QuizCounter.get(topic, level)
+        source = _plan_quiz(topic, level, current_count)
+        picked, source = _pick_quiz_ids(topic, level, user_id, source)
 
-        if current_count >= 800:
-            new_questions = Quiz.query.filter_by(topic=topic, level=level).order_by(func.random()).limit(20).all()
-            source = "database_full"
-        else:
-            new_questions = generate_twenty_grammar_questions(topic, level)
-            source = "ai_seeding"
-
-        if not new_questions:
-            new_questions = Quiz.query.filter_by(level=level).order_by(func.random()).limit(20).all()
-            source = "fallback_db"
+        new_questions = _fetch_questions(picked)
 
         if not new_questions:
             return _get_topic_based_emergency(topic, level)
 
-        return jsonify({
-            "status": "success",
-            "source": source,
-            "total_in_db": current_count,
-            "topic": topic,
-            "level": level,
-            "quiz": [{
-                "question": q.question,
-                "options": q.options if isinstance(q.options, list) else json.loads(q.options),
-                "answer": q.answer,
-                "explanation": q.explanation
-            } for q in new_questions[:20]]
-        }), 200
+        return jsonify(_quiz_payload(source, current_count, topic, level, new_questions)), 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@deepseek_bp.route("/deepseek/pool-status", methods=["GET"])
+def pool_status():
+    status = quiz_replenisher.status()
+    status["router"] = quiz_router.stats()
+    return jsonify(status), 200
+
 def generate_twenty_grammar_questions(topic, level):
-    from app import db, Quiz 
-    if not GROQ_KEY: return []
+    """Sinh một batch câu hỏi bằng AI (QUIZ_PROVIDERS qua router), lưu các câu chưa có; trả về danh sách id vừa thêm."""
+    from app import db, Quiz, QuizCounter
+    if not QUIZ_PROVIDERS: return []
 
     # NÂNG CẤP PROMPT ĐỂ TĂNG ĐỘ KHÓ
     system_prompt = (
@@ -80,49 +166,53 @@ def generate_twenty_grammar_questions(topic, level):
         "}"
     )
 
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Create 20 HIGH-LEVEL challenge questions about {topic}. Mix the 12 tenses with academic structures. Ensure level is {level}."}
+    ]
+
+    def ask(provider):
+        # Tăng temperature một chút để AI biến hóa cấu trúc câu hơn
+        content = provider.complete(messages, 0.9, response_format={"type": "json_object"})
+        return parse_json_reply(content).get("quiz", [])
+
     try:
-        response = requests.post(
-            f"{GROQ_BASE}/chat/completions",
-            headers={"Authorization": f"Bearer {GROQ_KEY}", "Content-Type": "application/json"},
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Create 20 HIGH-LEVEL challenge questions about {topic}. Mix the 12 tenses with academic structures. Ensure level is {level}."}
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.9 # Tăng một chút để AI biến hóa cấu trúc câu hơn
-            },
-            timeout=50
-        )
-
-        if response.status_code == 200:
-            content = response.json()['choices'][0]['message']['content']
-            questions_data = json.loads(content).get("quiz", [])
-            
-            new_objects = []
+        _, questions_data = quiz_router.call([(p.name, lambda p=p: ask(p)) for p in QUIZ_PROVIDERS])
+        if questions_data:
+            # Gom câu hỏi của batch theo hash (bỏ trùng ngay trong batch)
+            rows = {}
             for q in questions_data:
-                if Quiz.query.filter_by(question=q['question'].strip()).first():
+                question = q['question'].strip()
+                h = Quiz.hash_question(question)
+                if h in rows:
                     continue
-
-                new_q = Quiz(
+                rows[h] = dict(
                     topic=topic, level=level, type="text",
-                    question=q['question'].strip(), 
+                    question=question,
                     options=json.dumps(q['options'], ensure_ascii=False),
                     answer=int(q['answer']),
-                    explanation=q.get('explanation', "")
+                    explanation=q.get('explanation', ""),
+                    question_hash=h
                 )
-                db.session.add(new_q)
-                new_objects.append(new_q)
-            
+            if not rows:
+                return []
+
+            # Một truy vấn kiểm tra trùng + một lệnh insert hàng loạt, bất kể bảng lớn cỡ nào
+            existing = {h for (h,) in db.session.query(Quiz.question_hash)
+                        .filter(Quiz.question_hash.in_(list(rows)))}
+            new_rows = [row for h, row in rows.items() if h not in existing]
+            inserted = insert_ignore(db.session, Quiz.__table__, new_rows)
+            QuizCounter.bump(db.session, topic, level, inserted)
+            new_ids = [i for (i,) in db.session.query(Quiz.id)
+                       .filter(Quiz.question_hash.in_([row["question_hash"] for row in new_rows]))] if new_rows else []
             db.session.commit()
-            return new_objects
+            return new_ids
         return []
     except Exception as e:
         print(f"Hard-mode AI Error: {e}")
         return []
 
-def _get_topic_based_emergency(topic, level):
+def _emergency_payload(topic):
     quiz = []
     for i in range(1, 21):
         quiz.append({
@@ -131,6 +221,9 @@ def _get_topic_based_emergency(topic, level):
             "answer": 0,
             "explanation": "Đang đồng bộ câu hỏi nâng cao từ hệ thống."
         })
-    return jsonify({
+    return {
         "status": "success", "source": "emergency_sync", "topic": topic, "quiz": quiz
-    }), 200
\ No newline at end of file
+    }
+
+def _get_topic_based_emergency(topic, level):
+    return jsonify(_emergency_payload(topic)), 200
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+🔥 Nạp sẵn bảng dictionary_cache từ bộ từ vựng đóng gói kèm app (static/assets/assets/vocabulary.json).
+
+Hai bước:
+  1. seed   – chuyển từng từ (word, ipa, meaning, example, example_vi) thành dòng DictionaryCache và ghi bằng
+              một lệnh upsert mỗi lô; chỉ điền cột còn trống, không ghi đè dữ liệu đã có.
+  2. enrich – các từ còn thiếu cột (word_type, grammar_notes...) được hỏi AI theo lô nhiều từ trong một prompt
+              ("Words (JSON): [...]"), tối đa `workers` lô chạy song song; mỗi lô kết thúc bằng một upsert.
+
+Tiến độ enrich được ghi vào file checkpoint (JSON) sau mỗi lô → chạy lại sẽ bỏ qua các từ đã xử lý
+(kể cả từ AI không trả về), dùng reset=True để làm lại từ đầu.
+
+Chạy bằng lệnh `flask --app app prewarm-dictionary` hoặc tự chạy nền khi worker khởi động
+với DICT_PREWARM_ON_STARTUP=1 (mỗi host chỉ một worker chạy, nhờ host_lock).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import app, db, DictionaryCache, dictionary_memo
+from db_helpers import upsert_rows
+from gemini_routes import FIELDS, autocomplete_index, normalize_word, _ask_batch
+from provider_router import ProviderRouter
+from singleflight import host_lock
+from upstream import UpstreamUnavailable
+
+VOCABULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "assets", "assets", "vocabulary.json")
+CHECKPOINT_PATH = os.getenv("DICT_PREWARM_CHECKPOINT") or os.path.join(tempfile.gettempdir(), "english-app-dictionary-prewarm.json")
+_SEED_CHUNK = 500
+# Provider bị ngắt mạch/quá tải: job nền chờ rồi thử lại lô đó (chờ tăng dần) thay vì bỏ cả loạt lô phía sau
+UNAVAILABLE_RETRIES = int(os.getenv("DICT_PREWARM_RETRIES", 4))
+UNAVAILABLE_DELAY = float(os.getenv("DICT_PREWARM_RETRY_DELAY", 10))
+
+# Router riêng, không hedge: prewarm chạy nền, không cần nhanh mà không nên tốn gấp đôi quota
+prewarm_router = ProviderRouter("dictionary-prewarm", hedge=False)
+
+
+def load_vocabulary(path=VOCABULARY_PATH):
+    """Đọc vocabulary.json → list dòng DictionaryCache (dict), mỗi từ một dòng (từ lặp giữa các nhóm lấy bản đầu)."""
+    with open(path, encoding="utf-8") as f:
+        categories = json.load(f)
+    rows, seen = [], set()
+    for category in categories:
+        for item in category.get("words") or []:
+            word = normalize_word(item.get("word"))
+            if not word or word in seen:
+                continue
+            seen.add(word)
+            examples = "\n".join(x for x in (item.get("example"), item.get("example_vi")) if x)
+            rows.append({
+                "word": word,
+                "phonetic": item.get("ipa") or None,
+                "word_type": None,
+                "definition": item.get("meaning") or None,
+                "examples": examples or None,
+                "grammar_notes": None,
+            })
+    return rows
+
+
+def seed(rows):
+    """Upsert các dòng từ vocabulary (mỗi lô _SEED_CHUNK dòng một câu lệnh). Trả về số dòng đã ghi."""
+    for start in range(0, len(rows), _SEED_CHUNK):
+        upsert_rows(db.session, DictionaryCache.__table__, rows[start:start + _SEED_CHUNK], ("word",), fill_only=True)
+        db.session.commit()
+    for row in rows:
+        dictionary_memo.invalidate(row["word"])
+        autocomplete_index.add(row["word"])
+    return len(rows)
+
+
+def incomplete_words(words):
+    """Các từ (trong words) chưa có trong bảng hoặc còn thiếu ít nhất một cột."""
+    complete = set()
+    for start in range(0, len(words), _SEED_CHUNK):
+        chunk = words[start:start + _SEED_CHUNK]
+        for row in DictionaryCache.query.filter(DictionaryCache.word.in_(chunk)):
+            if all(getattr(row, f) for f in FIELDS):
+                complete.add(row.word)
+    return [w for w in words if w not in complete]
+
+
+def _enrich_batch(words):
+    """Chạy trong thread của executor: gọi AI rồi upsert một lần cho cả lô. Trả về số từ đã được điền."""
+    for attempt in range(UNAVAILABLE_RETRIES + 1):
+        try:
+            entries = _ask_batch(words, prewarm_router)
+            break
+        except UpstreamUnavailable:
+            if attempt == UNAVAILABLE_RETRIES:
+                raise
+            time.sleep(UNAVAILABLE_DELAY * (2 ** attempt))
+    if not entries:
+        return 0
+    with app.app_context():
+        upsert_rows(db.session, DictionaryCache.__table__,
+                    [dict(word=w, **fields) for w, fields in entries.items()], ("word",), fill_only=True)
+        db.session.commit()
+    for word in entries:
+        dictionary_memo.invalidate(word)
+    return len(entries)
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return set(json.load(f).get("done") or [])
+    except (OSError, ValueError):
+        return set()
+
+
+def _save_checkpoint(path, done):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"done": sorted(done), "updated_at": time.time()}, f, ensure_ascii=False)
+    os.replace(tmp, path)  # Ghi nguyên tử: dừng giữa chừng cũng không hỏng file
+
+
+def enrich(words, batch_size=20, workers=2, checkpoint=CHECKPOINT_PATH, reset=False, log=print):
+    """
+    Điền các cột còn thiếu cho words bằng AI. Trả về dict thống kê.
+    Lô lỗi (quá tải, JSON hỏng...) không được ghi vào checkpoint → lần chạy sau thử lại.
+    """
+    done = set() if reset else _load_checkpoint(checkpoint)
+    todo = [w for w in incomplete_words(words) if w not in done]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    stats = {"todo": len(todo), "batches": len(batches), "enriched": 0, "failed_batches": 0}
+    if not batches:
+        return stats
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dict-prewarm") as executor:
+        futures = {executor.submit(_enrich_batch, batch): batch for batch in batches}
+        for n, future in enumerate(as_completed(futures), 1):
+            batch = futures[future]
+            try:
+                enriched = future.result()
+            except Exception as e:  # Quá tải, ngắt mạch, JSON hỏng... → bỏ lô này, lần chạy sau thử lại
+                stats["failed_batches"] += 1
+                log(f"⚠️ [PREWARM] Lô {n}/{len(batches)} lỗi ({len(batch)} từ): {type(e).__name__}: {e}")
+                continue
+            stats["enriched"] += enriched
+            done.update(batch)
+            _save_checkpoint(checkpoint, done)
+            log(f"🔥 [PREWARM] Lô {n}/{len(batches)}: điền {enriched}/{len(batch)} từ")
+    return stats
+
+
+def prewarm(path=VOCABULARY_PATH, batch_size=20, workers=2, checkpoint=CHECKPOINT_PATH, reset=False,
+            enrich_missing=True, log=print):
+    """seed rồi enrich (cần app context). Trả về dict thống kê."""
+    rows = load_vocabulary(path)
+    stats = {"seeded": seed(rows)}
+    if enrich_missing:
+        stats.update(enrich([r["word"] for r in rows], batch_size, workers, checkpoint, reset, log))
+    return stats
+
+
+def start_background(delay=5.0):
+    """Chạy prewarm ở thread nền của worker; chỉ một process trên mỗi host giữ được khoá và thực sự chạy."""
+    def run():
+        time.sleep(delay)  # Để worker nhận request trước, prewarm chạy sau
+        # Giữ khoá suốt lúc prewarm: file riêng để không chặn các từ tra cứu chung stripe
+        with host_lock("dictionary-prewarm", timeout=0, striped=False) as acquired:
+            if not acquired:
+                return
+            with app.app_context():
+                try:
+                    stats = prewarm(
+                        batch_size=int(os.getenv("DICT_PREWARM_BATCH", 20)),
+                        workers=int(os.getenv("DICT_PREWARM_WORKERS", 2)),
+                    )
+                    print(f"✅ [PREWARM] Xong: {stats}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ [PREWARM] Lỗi: {e}")
+
+    thread = threading.Thread(target=run, name="dict-prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -1,123 +1,506 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, request, jsonify
-import os, requests, json
-from app import db, DictionaryCache 
+import os, json
+from app import db, DictionaryCache, dictionary_memo
+from db_helpers import upsert_rows
+from sqlalchemy.exc import IntegrityError
+from ttl_cache import MISSING
+from singleflight import SingleFlight, host_lock
+from autocomplete import AutocompleteIndex
+from lemmatizer import Lemmatizer
+import upstream
+import metrics
+from provider_router import ProviderRouter, chat_providers, parse_json_reply
 
 gemini_bp = Blueprint("gemini_bp", __name__)
 
 # Lấy Key từ môi trường
 GEMINI_KEY = os.getenv("GEMINI_API_KEY", "").strip()
+GEMINI_BASE = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+
+
+def _lookup_word(word):
+    """
+    Tra từ: cache RAM trước, sau đó mới tới bảng dictionary_cache.
+    Trả về dict của DictionaryCache hoặc None nếu từ chưa có (kết quả None cũng được cache ngắn hạn).
+    """
+    entry = dictionary_memo.get(word)
+    if entry is not MISSING:
+        return entry
+    row = DictionaryCache.query.filter_by(word=word).first()
+    entry = row.to_dict() if row else None
+    dictionary_memo.set(word, entry)
+    return entry
+
+
+def _lookup_input(data):
+    """(từ cần tra, lemma, lỗi) từ body /gemini/chat."""
+    raw_message = (data.get("message") or "").strip()
+    if not raw_message:
+        return None, None, "Vui lòng nhập từ cần tra"
+    search_word = _search_word(raw_message)
+    return search_word, _lemma(search_word), None
+
+
+def _entry_response(entry, source, query=None):
+    response = {
+        "source": source,
+        "word": entry["word"].upper(),
+        "phonetic": entry["phonetic"],
+        "word_type": entry["word_type"],
+        "definition": entry["definition"],
+        "examples": entry["examples"],
+        "grammar_notes": entry["grammar_notes"]
+    }
+    if query and query != entry["word"]:
+        response["inflected_form"] = query  # Người dùng tra "running", trả về mục "run"
+    return response
+
+
+class GeminiLookupError(Exception):
+    """Lỗi từ Gemini, message là nội dung trả về cho client qua trường "reply"."""
+
+
+def _fmt(val):
+    # Xử lý nếu AI trả về List thay vì String
+    if isinstance(val, list): return "\n".join(str(x) for x in val)
+    return str(val or "")
+
+
+GEMINI_MODEL = "gemini-2.5-flash" # Tên chính thức hiện tại của Google
+
+# Các "provider" tra từ: Gemini qua API v1beta và v1 (được đo riêng), có thể thêm "openai"/"groq"
+# bằng DICTIONARY_PROVIDERS=gemini-v1beta,gemini-v1,openai
+DICTIONARY_PROVIDERS = [
+    name.strip().lower()
+    for name in os.getenv("DICTIONARY_PROVIDERS", "gemini-v1beta,gemini-v1").split(",") if name.strip()
+]
+_chat_fallbacks = {p.name: p for p in chat_providers("DICTIONARY_PROVIDERS", "")}
+dictionary_router = ProviderRouter("dictionary")
+
+
+def _dictionary_prompt(search_word):
+    return (
+        f"Trả về JSON duy nhất cho từ: \"{search_word}\".\n"
+        "KHÔNG ĐƯỢC giải thích, KHÔNG dùng Markdown, KHÔNG dùng ```json.\n"
+        "Nội dung phải là tiếng Việt.\n"
+        "Mẫu JSON:\n"
+        "{\n"
+        "  \"phonetic\": \"phiên âm\",\n"
+        "  \"word_type\": \"loại từ\",\n"
+        "  \"definition\": \"nghĩa\",\n"
+        "  \"examples\": \"ví dụ\",\n"
+        "  \"grammar_notes\": \"ngữ pháp\"\n"
+        "}"
+    )
+
+
+def _parse_entry(ai_text):
+    try:
+        return parse_json_reply(ai_text)
+    except Exception as e:
+        print(f"Dữ liệu AI trả về lỗi: {ai_text}")
+        raise GeminiLookupError(f"Lỗi xử lý AI: {str(e)}")
+
+
+def _gemini_request(version, prompt, max_tokens=1024):
+    """(url, payload) của một lần gọi generateContent theo phiên bản API (v1beta / v1)."""
+    url = f"{GEMINI_BASE}/{version}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_KEY}"
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "temperature": 0.1,
+            "maxOutputTokens": max_tokens
+        }
+    }
+    return url, payload
+
+
+def _gemini_result(resp):
+    """Đọc response của Gemini (requests hoặc httpx) → dict từ điển, lỗi → GeminiLookupError."""
+    if resp.status_code != 200:
+        try:
+            error_text = resp.json().get('error', {}).get('message', 'Unknown error')
+        except ValueError:
+            error_text = resp.text[:120]
+        # Trả về lỗi chi tiết để dễ debug (như lỗi Quota 429)
+        raise GeminiLookupError(f"Lỗi API: {error_text}")
+    try:
+        ai_text = resp.json()['candidates'][0]['content']['parts'][0]['text']
+    except Exception as e:
+        raise GeminiLookupError(f"Lỗi xử lý AI: {str(e)}")
+    return _parse_entry(ai_text)
+
+
+def _gemini_call(version, prompt, max_tokens=1024):
+    url, payload = _gemini_request(version, prompt, max_tokens)
+    return lambda: _gemini_result(upstream.post("gemini", url, json=payload))
+
+
+def _chat_lookup_messages(prompt):
+    return [{"role": "user", "content": prompt}]
+
+
+def _chat_call(provider, prompt, max_tokens=1024):
+    """Tra từ bằng provider kiểu OpenAI (cùng prompt, ép trả JSON)."""
+    def call():
+        try:
+            text = provider.complete(_chat_lookup_messages(prompt), 0.1, max_tokens,
+                                     response_format={"type": "json_object"})
+        except upstream.UpstreamHTTPError as e:
+            raise GeminiLookupError(f"Lỗi API: {e.text}")
+        return _parse_entry(text)
+    return call
+
+
+def _dictionary_candidates(prompt, gemini_call=_gemini_call, chat_call=_chat_call):
+    candidates = []
+    for name in DICTIONARY_PROVIDERS:
+        if name.startswith("gemini-"):
+            candidates.append((name, gemini_call(name[len("gemini-"):], prompt)))
+        elif name in _chat_fallbacks:
+            candidates.append((name, chat_call(_chat_fallbacks[name], prompt)))
+    return candidates
+
+
+def _ask_gemini(search_word):
+    """
+    Lấy dữ liệu từ điển cho một từ, trả về dict đã parse từ JSON của AI.
+    Router chọn provider nhanh/khỏe nhất và hedge sang provider kế tiếp thay vì thử v1beta rồi v1 tuần tự.
+    """
+    _, data = dictionary_router.call(_dictionary_candidates(_dictionary_prompt(search_word)))
+    return data
+
+
+def _new_entry(search_word, ai_data):
+    return DictionaryCache(
+        word=search_word,
+        phonetic=_fmt(ai_data.get("phonetic")),
+        word_type=_fmt(ai_data.get("word_type")),
+        definition=_fmt(ai_data.get("definition")),
+        examples=_fmt(ai_data.get("examples")),
+        grammar_notes=_fmt(ai_data.get("grammar_notes"))
+    )
+
+
+def _fetch_and_store(search_word):
+    """
+    Chạy bởi đúng một thread cho mỗi từ (xem _inflight): gọi Gemini rồi lưu vào DB.
+    Trả về (entry, source).
+    """
+    with host_lock(f"dictionary:{search_word}"):
+        # Worker khác trên cùng máy có thể vừa lưu xong từ này trong lúc ta chờ khoá
+        row = DictionaryCache.query.filter_by(word=search_word).first()
+        if row:
+            entry = row.to_dict()
+            dictionary_memo.set(search_word, entry)
+            return entry, "database"
+
+        ai_data = _ask_gemini(search_word)
+
+        new_entry = _new_entry(search_word, ai_data)
+        db.session.add(new_entry)
+        try:
+            db.session.commit()
+            entry = new_entry.to_dict()
+        except IntegrityError:
+            # Máy khác đã ghi từ này trước (unique index trên word) → dùng bản trong DB
+            db.session.rollback()
+            row = DictionaryCache.query.filter_by(word=search_word).first()
+            if not row:
+                raise
+            entry = row.to_dict()
+        dictionary_memo.set(search_word, entry)
+        autocomplete_index.add(search_word)
+        return entry, "api"
+
+
+# Các lượt tra cùng một từ chưa có trong DB được gộp thành một lời gọi Gemini
+_inflight = SingleFlight(wait_timeout=60)
+
+
+UNAVAILABLE_REPLY = "Lỗi API: Dịch vụ AI đang quá tải, vui lòng thử lại sau."
+
+
+def _search_word(raw_message):
+    # Lấy từ cuối cùng để tra cứu
+    return raw_message.lower().split()[-1].strip("'.?!")[:100]
+
+
+# ============================================================
+# 🌱 Đưa từ về dạng gốc trước khi tra cache (lemmatizer.py): "runs"/"ran"/"running" dùng chung mục "run"
+# ============================================================
+LEMMATIZE = os.getenv("DICT_LEMMATIZE", "1") not in ("0", "false", "False")
+_vocabulary = None
+
+
+def _known_word(word):
+    """
+    Từ có trong bộ từ vựng đóng gói. Cố ý không dùng dictionary_cache/chỉ mục autocomplete: tập đó đổi theo
+    thời gian nên cùng một từ sẽ lúc ra key này lúc ra key khác.
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        from dictionary_prewarm import load_vocabulary  # Import lười: dictionary_prewarm import module này
+        _vocabulary = frozenset(row["word"] for row in load_vocabulary())
+    return word in _vocabulary
+
+
+lemmatizer = Lemmatizer(known=_known_word)
+
+
+def _lemma(word):
+    return lemmatizer.lemma(word) if LEMMATIZE else word
+
 
 @gemini_bp.route("/gemini/chat", methods=["POST"])
 def gemini_chat():
     try:
-        data = request.get_json(silent=True) or {}
-        raw_message = (data.get("message") or "").strip()
-        if not raw_message:
-            return jsonify({"error": "Vui lòng nhập từ cần tra"}), 400
-
-        # Lấy từ cuối cùng để tra cứu
-        search_word = raw_message.lower().split()[-1].strip("'.?!")[:100]
+        search_word, lemma, error = _lookup_input(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"error": error}), 400
 
         # 1. Kiểm tra Database Cache (Ưu tiên lấy dữ liệu đã có)
-        cached = DictionaryCache.query.filter_by(word=search_word).first()
+        cached = _lookup_word(lemma)
         if cached:
-            return jsonify({
-                "source": "database",
-                "word": cached.word.upper(),
-                "phonetic": cached.phonetic,
-                "word_type": cached.word_type,
-                "definition": cached.definition,
-                "examples": cached.examples,
-                "grammar_notes": cached.grammar_notes
-            }), 200
-
-        # 2. Cấu hình Model & URL (Theo ý bạn là 2.5 Flash)
-        # Lưu ý: Nếu Google báo lỗi 404, hãy kiểm tra lại tên model trong AI Studio
-        model_name = "gemini-2.5-flash" # Tên chính thức hiện tại của Google
-        full_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={GEMINI_KEY}"
-
-        prompt = (
-            f"Trả về JSON duy nhất cho từ: \"{search_word}\".\n"
-            "KHÔNG ĐƯỢC giải thích, KHÔNG dùng Markdown, KHÔNG dùng ```json.\n"
-            "Nội dung phải là tiếng Việt.\n"
-            "Mẫu JSON:\n"
-            "{\n"
-            "  \"phonetic\": \"phiên âm\",\n"
-            "  \"word_type\": \"loại từ\",\n"
-            "  \"definition\": \"nghĩa\",\n"
-            "  \"examples\": \"ví dụ\",\n"
-            "  \"grammar_notes\": \"ngữ pháp\"\n"
-            "}"
-        )
-
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": 0.1,
-                "maxOutputTokens": 1024
-            }
-        }
+            return jsonify(_entry_response(cached, "database", search_word)), 200
+
+        # 2. Gọi Gemini (gộp với các request đang tra cùng từ) và lưu vào MySQL
+        try:
+            entry, source = _inflight.do(lemma, lambda: _fetch_and_store(lemma))
+        except GeminiLookupError as e:
+            return jsonify({"reply": str(e)}), 200
+        except upstream.UpstreamUnavailable:
+            return jsonify({"reply": UNAVAILABLE_REPLY}), 200
+
+        # 3. Trả về kết quả cho Frontend (Flutter)
+        return jsonify(_entry_response(entry, source, search_word)), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"reply": f"Lỗi hệ thống: {str(e)}"}), 200
+
+
+# ============================================================
+# 📚 Tra nhiều từ một lúc (màn hình đọc cần nghĩa của cả đoạn văn)
+# Cache RAM → một truy vấn IN (...) → các từ còn thiếu hỏi AI trong MỘT prompt nhiều từ → một upsert.
+# ============================================================
+BATCH_LOOKUP_MAX = int(os.getenv("BATCH_LOOKUP_MAX", 50))
+FIELDS = ("phonetic", "word_type", "definition", "examples", "grammar_notes")
+_TOKENS_PER_WORD = 200  # Ngân sách output cho mỗi từ trong prompt nhiều từ
+
+
+def normalize_word(word):
+    # Cùng dạng key với _search_word / dictionary_memo (chữ thường, bỏ dấu câu hai đầu), giữ cụm nhiều chữ
+    return " ".join((word or "").lower().split()).strip("'.?!")[:100]
+
+
+def _batch_words(data):
+    """Danh sách từ (đã chuẩn hoá, bỏ trùng, giữ thứ tự) từ body {"words": [...]}; sai → ValueError."""
+    words = data.get("words")
+    if not isinstance(words, list) or not words:
+        raise ValueError("Vui lòng gửi danh sách từ cần tra (words)")
+    unique = list(dict.fromkeys(w for w in (normalize_word(x) for x in words if isinstance(x, str)) if w))
+    if not unique:
+        raise ValueError("Vui lòng gửi danh sách từ cần tra (words)")
+    if len(unique) > BATCH_LOOKUP_MAX:
+        raise ValueError(f"Tối đa {BATCH_LOOKUP_MAX} từ mỗi lần tra")
+    return unique
+
+
+def _batch_dictionary_prompt(words):
+    return (
+        "Trả về JSON duy nhất là một object, mỗi key là một từ trong danh sách dưới đây (giữ nguyên cách viết).\n"
+        "KHÔNG ĐƯỢC giải thích, KHÔNG dùng Markdown, KHÔNG dùng ```json.\n"
+        "Nội dung phải là tiếng Việt.\n"
+        f"Words (JSON): {json.dumps(words, ensure_ascii=False)}\n"
+        "Mẫu giá trị cho mỗi từ:\n"
+        "{\n"
+        "  \"phonetic\": \"phiên âm\",\n"
+        "  \"word_type\": \"loại từ\",\n"
+        "  \"definition\": \"nghĩa\",\n"
+        "  \"examples\": \"ví dụ\",\n"
+        "  \"grammar_notes\": \"ngữ pháp\"\n"
+        "}"
+    )
+
+
+def _batch_candidates(words, gemini_call=_gemini_call, chat_call=_chat_call):
+    max_tokens = _TOKENS_PER_WORD * len(words) + 256
+    return _dictionary_candidates(
+        _batch_dictionary_prompt(words),
+        gemini_call=lambda version, prompt: gemini_call(version, prompt, max_tokens),
+        chat_call=lambda provider, prompt: chat_call(provider, prompt, max_tokens),
+    )
+
+
+def _batch_entries(words, ai_data):
+    """JSON của AI → {từ: dict các cột} (chỉ các từ trong words mà AI có trả về)."""
+    if not isinstance(ai_data, dict):
+        raise GeminiLookupError("Lỗi xử lý AI: kết quả không phải object")
+    by_word = {normalize_word(k): v for k, v in ai_data.items() if isinstance(v, dict)}
+    return {w: {f: _fmt(by_word[w].get(f)) for f in FIELDS} for w in words if w in by_word}
+
+
+def _ask_batch(words, router=dictionary_router):
+    _, ai_data = router.call(_batch_candidates(words))
+    return _batch_entries(words, ai_data)
+
+
+def _memo_lookup(words):
+    """({từ: entry} có trong cache RAM, các từ cache RAM chưa biết → cần tra DB)."""
+    found, rest = {}, []
+    for word in words:
+        entry = dictionary_memo.get(word)
+        if entry is MISSING:
+            rest.append(word)
+        elif entry:
+            found[word] = entry
+        # None: vừa biết là chưa có trong DB → đi thẳng tới AI
+    return found, rest
 
-        # 3. Gọi API Gemini
-        resp = requests.post(full_url, json=payload, timeout=25)
 
-        # Xử lý trường hợp v1beta lỗi thì thử v1
-        if resp.status_code != 200:
-            alt_url = f"https://generativelanguage.googleapis.com/v1/models/{model_name}:generateContent?key={GEMINI_KEY}"
-            resp = requests.post(alt_url, json=payload, timeout=25)
+def _memo_remember(rest, rows, found):
+    """Thêm các dòng DB vừa tra vào found và ghi kết quả (kể cả "không có") của các từ trong rest vào cache RAM."""
+    for row in rows:
+        found[row.word] = row.to_dict()
+    for word in rest:
+        dictionary_memo.set(word, found.get(word))
+    return found
 
-        if resp.status_code != 200:
-            error_data = resp.json()
-            error_text = error_data.get('error', {}).get('message', 'Unknown error')
-            # Trả về lỗi chi tiết để dễ debug (như lỗi Quota 429 bạn gặp)
-            return jsonify({"reply": f"Lỗi API: {error_text}"}), 200
 
-        # 4. Parse JSON từ phản hồi của AI
-        res_json = resp.json()
+def _lookup_words(words):
+    """{từ: entry} cho các từ đã có: cache RAM trước, các từ còn lại tra bằng một truy vấn IN (...)."""
+    found, rest = _memo_lookup(words)
+    if rest:
+        _memo_remember(rest, DictionaryCache.query.filter(DictionaryCache.word.in_(rest)), found)
+    return found
+
+
+def _store_batch(entries):
+    """Lưu các từ AI vừa trả về bằng một upsert (chỉ điền cột trống nếu máy khác đã lưu từ đó trước)."""
+    if not entries:
+        return {}
+    upsert_rows(db.session, DictionaryCache.__table__,
+                [dict(word=w, **fields) for w, fields in entries.items()], ("word",), fill_only=True)
+    db.session.commit()
+    stored = {w: dict(word=w, **fields) for w, fields in entries.items()}
+    for word, entry in stored.items():
+        dictionary_memo.set(word, entry)
+        autocomplete_index.add(word)
+    return stored
+
+
+def _batch_lemmas(words):
+    """({từ gửi lên: dạng gốc}, các dạng gốc cần tra — bỏ trùng, giữ thứ tự)."""
+    lemmas = {w: _lemma(w) for w in words}
+    return lemmas, list(dict.fromkeys(lemmas.values()))
+
+
+def _batch_payload(words, found, fetched, error=None, lemmas=None):
+    """Mỗi từ một phần tử, theo thứ tự gửi lên, kèm source (database / api / error); found/fetched theo dạng gốc."""
+    entries = []
+    for word in words:
+        lemma = (lemmas or {}).get(word, word)
+        if lemma in found:
+            entries.append(_entry_response(found[lemma], "database", word))
+        elif lemma in fetched:
+            entries.append(_entry_response(fetched[lemma], "api", word))
+        else:
+            entries.append({"source": "error", "word": word.upper(),
+                            "reply": error or "Lỗi xử lý AI: không có dữ liệu cho từ này"})
+    return {"entries": entries}
+
+
+@gemini_bp.route("/gemini/batch-lookup", methods=["POST"])
+def gemini_batch_lookup():
+    try:
         try:
-            ai_text = res_json['candidates'][0]['content']['parts'][0]['text']
-            ai_text = ai_text.replace("```json", "").replace("```", "").strip()
-            # Tìm cặp dấu ngoặc nhọn để đảm bảo lấy đúng JSON
-            start = ai_text.find("{")
-            end = ai_text.rfind("}") + 1
-            if start == -1 :
-                raise ValueError("AI không trả về đúng định dạng JSON")
-            
-            ai_data = json.loads(ai_text[start:end])
-        except Exception as e:
-            print(f"Dữ liệu AI trả về lỗi: {ai_text}")
-            return jsonify({"reply": f"Lỗi xử lý AI: {str(e)}"}), 200
-
-        # 5. Hàm định dạng dữ liệu (Xử lý nếu AI trả về List thay vì String)
-        def fmt(val):
-            if isinstance(val, list): return "\n".join(str(x) for x in val)
-            return str(val or "")
-
-        # 6. Lưu vào MySQL
-        new_entry = DictionaryCache(
-            word=search_word,
-            phonetic=fmt(ai_data.get("phonetic")),
-            word_type=fmt(ai_data.get("word_type")),
-            definition=fmt(ai_data.get("definition")),
-            examples=fmt(ai_data.get("examples")),
-            grammar_notes=fmt(ai_data.get("grammar_notes"))
-        )
-        db.session.add(new_entry)
-        db.session.commit()
-
-        # 7. Trả về kết quả cho Frontend (Flutter)
-        return jsonify({
-            "source": "api",
-            "word": search_word.upper(),
-            "phonetic": new_entry.phonetic,
-            "word_type": new_entry.word_type,
-            "definition": new_entry.definition,
-            "examples": new_entry.examples,
-            "grammar_notes": new_entry.grammar_notes
-        }), 200
+            words = _batch_words(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        lemmas, keys = _batch_lemmas(words)
+        found = _lookup_words(keys)
+        missing = [w for w in keys if w not in found]
+        fetched, error = {}, None
+        if missing:
+            try:
+                fetched = _store_batch(_ask_batch(missing))
+            except GeminiLookupError as e:
+                error = str(e)
+            except upstream.UpstreamUnavailable:
+                error = UNAVAILABLE_REPLY
+        return jsonify(_batch_payload(words, found, fetched, error, lemmas)), 200
 
     except Exception as e:
-        if 'db' in locals() and db.session:
-            db.session.rollback()
-        return jsonify({"reply": f"Lỗi hệ thống: {str(e)}"}), 200
\ No newline at end of file
+        db.session.rollback()
+        return jsonify({"reply": f"Lỗi hệ thống: {str(e)}"}), 200
+
+
+# ============================================================
+# 🔎 Gợi ý khi đang gõ (autocomplete.py): chỉ mục trong RAM từ dictionary_cache + vocabulary.json
+# ============================================================
+AUTOCOMPLETE_LIMIT_MAX = 50
+
+
+def _autocomplete_words():
+    from app import app
+    from dictionary_prewarm import load_vocabulary  # Import lười: dictionary_prewarm import module này
+    words = [row["word"] for row in load_vocabulary()]
+    with app.app_context():
+        words.extend(normalize_word(w) for (w,) in db.session.query(DictionaryCache.word).yield_per(20000))
+    return words
+
+
+autocomplete_index = AutocompleteIndex(
+    _autocomplete_words,
+    ttl=float(os.getenv("AUTOCOMPLETE_TTL", 600)),
+    max_distance=int(os.getenv("AUTOCOMPLETE_MAX_DISTANCE", 1)),
+    fuzzy_prefix=int(os.getenv("AUTOCOMPLETE_FUZZY_PREFIX", 6)),
+)
+
+
+def _autocomplete_payload(args):
+    """(payload, status) cho ?q=...&limit=... (dùng chung cho bản Flask và ASGI)."""
+    query = normalize_word(args.get("q"))
+    if not query:
+        return {"error": "Thiếu q"}, 400
+    try:
+        limit = max(1, min(int(args.get("limit", 10)), AUTOCOMPLETE_LIMIT_MAX))
+    except (TypeError, ValueError):
+        return {"error": "limit không hợp lệ"}, 400
+    suggestions = autocomplete_index.suggest(query, limit)
+    return {
+        "query": query,
+        "suggestions": [{"word": w, "distance": d} for w, d in suggestions],
+    }, 200
+
+
+@gemini_bp.route("/gemini/autocomplete", methods=["GET"])
+def gemini_autocomplete():
+    payload, status = _autocomplete_payload(request.args)
+    return jsonify(payload), status
+
+
+COALESCED = metrics.counter(
+    "dictionary_lookups_coalesced_total", "Lượt tra Gemini được gộp vào một lời gọi đang chạy (single-flight)"
+)
+LEMMATIZED = metrics.counter(
+    "dictionary_lookups_lemmatized_total", "Lượt tra được đưa về dạng gốc trước khi tra cache (runs → run)"
+)
+
+@metrics.on_scrape
+def collect_lookup_metrics():
+    COALESCED.set(value=_inflight.stats()["coalesced"])
+    LEMMATIZED.set(value=lemmatizer.changed)
+
+
+@gemini_bp.route("/gemini/cache-stats", methods=["GET"])
+def gemini_cache_stats():
+    stats = dictionary_memo.stats()
+    stats["single_flight"] = _inflight.stats()
+    stats["router"] = dictionary_router.stats()
+    stats["autocomplete"] = autocomplete_index.stats()
+    stats["lemmatizer"] = dict(lemmatizer.stats(), enabled=LEMMATIZE)
+    return jsonify(stats), 200
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+🌱 Đưa dạng biến đổi của từ tiếng Anh về dạng gốc (lemma) trước khi tra dictionary_cache, hoàn toàn offline.
+
+"running", "runs", "ran" cùng về "run" → một dòng cache, một lần gọi AI thay vì ba.
+
+- Bảng ngoại lệ (IRREGULAR): động từ bất quy tắc, số nhiều bất quy tắc.
+- Quy tắc hậu tố cho -s/-es/-ies/-ves, -ed/-ied, -ing, -est/-ier (gấp đôi phụ âm, thêm lại "e"...).
+  Không bỏ -er: phần lớn là danh từ chỉ người/vật (teacher, player, computer) chứ không phải so sánh hơn.
+- known(word) -> bool: tập từ gốc cố định (bộ từ vựng đóng gói). Quy tắc chỉ sinh ứng viên; chỉ đổi sang ứng viên
+  nằm trong known, không có thì giữ nguyên từ ("herring" không thành "her"). Từ đã có trong known cũng giữ
+  nguyên ("building", "news"). known phải cố định để cùng một từ luôn ra cùng một key cache.
+- Chỉ xử lý một từ gồm chữ cái (kể cả sở hữu 's); cụm nhiều chữ, từ có gạch nối, số... giữ nguyên.
+"""
+import re
+
+_WORD = re.compile(r"^[a-z]+(?:['’]s)?$")
+_VOWELS = "aeiou"
+
+
+def _table(text):
+    """"ran:run went:go ..." → {"ran": "run", "went": "go", ...}; nhiều dạng cùng gốc viết "was,were:be"."""
+    table = {}
+    for pair in text.split():
+        forms, lemma = pair.split(":")
+        for form in forms.split(","):
+            table[form] = lemma
+    return table
+
+
+IRREGULAR = _table("""
+    am,is,are,was,were,been,being:be has,had,having:have does,did,done,doing:do goes,went,gone,going:go
+    arose,arisen:arise awoke,awoken:awake borne:bear beat,beaten:beat became:become began,begun:begin
+    bent:bend bet:bet bit,bitten:bite bled:bleed blew,blown:blow broke,broken:break bred:breed brought:bring
+    built:build burnt:burn bought:buy caught:catch chose,chosen:choose came:come cost:cost crept:creep cut:cut
+    dealt:deal dug:dig drew,drawn:draw dreamt:dream drank,drunk:drink drove,driven:drive ate,eaten:eat
+    fell,fallen:fall fed:feed felt:feel fought:fight found:find fled:flee flew,flown:fly forbade,forbidden:forbid
+    forgot,forgotten:forget forgave,forgiven:forgive froze,frozen:freeze got,gotten:get gave,given:give
+    grew,grown:grow hung:hang heard:hear hid,hidden:hide hit:hit held:hold hurt:hurt kept:keep
+    knelt:kneel knew,known:know laid:lay led:lead leant:lean leapt:leap learnt:learn lent:lend
+    let:let lain:lie lit:light lost:lose made:make meant:mean met:meet mistook,mistaken:mistake paid:pay
+    proved,proven:prove put:put quit:quit read:read rode,ridden:ride rang,rung:ring risen:rise ran:run
+    said:say saw,seen:see sought:seek sold:sell sent:send set:set sewn:sew shook,shaken:shake shed:shed
+    shone:shine shot:shoot showed,shown:show shrank,shrunk:shrink shut:shut sang,sung:sing sank,sunk:sink
+    sat:sit slept:sleep slid:slide spoke,spoken:speak sped:speed spent:spend spilt:spill spun:spin spat:spit
+    split:split spread:spread sprang,sprung:spring stood:stand stole,stolen:steal stuck:stick stung:sting
+    stank,stunk:stink strode:stride struck:strike strove,striven:strive swore,sworn:swear swept:sweep
+    swam,swum:swim swung:swing took,taken:take taught:teach tore,torn:tear told:tell thought:think threw,thrown:throw
+    understood:understand undertook,undertaken:undertake upset:upset woke,woken:wake wore,worn:wear wove,woven:weave
+    wept:weep won:win withdrew,withdrawn:withdraw wrote,written:write overcame:overcome
+    dying,died:die lying,lied:lie tying,tied:tie
+    children:child men:man women:woman feet:foot teeth:tooth geese:goose mice:mouse lice:louse
+    oxen:ox leaves:leaf lives:life wives:wife knives:knife wolves:wolf halves:half shelves:shelf thieves:thief
+    loaves:loaf calves:calf selves:self scarves:scarf elves:elf
+    movies:movie cookies:cookie calories:calorie zombies:zombie selfies:selfie
+    analyses:analysis crises:crisis theses:thesis hypotheses:hypothesis phenomena:phenomenon
+    criteria:criterion cacti:cactus fungi:fungus nuclei:nucleus stimuli:stimulus
+    alumni:alumnus indices:index appendices:appendix quizzes:quiz
+""")
+
+# Trông như có hậu tố nhưng chính là từ gốc (hư từ, từ chỉ có dạng số nhiều, danh từ/tính từ tận cùng -s/-ed/-ing/-est)
+KEEP = frozenset("""
+    this his its hers ours yours theirs ourselves yourselves themselves us yes thus plus always perhaps besides
+    sometimes whereas nowadays news series species means physics mathematics economics politics athletics
+    gymnastics lens bus gas chaos canvas atlas bias alias clothes jeans scissors trousers thanks goods savings
+    earnings belongings surroundings outskirts premises headquarters congratulations
+    it's he's she's that's what's there's here's who's where's let's
+    during nothing something anything everything morning evening ceiling king ring sing thing bring spring
+    string wing swing sting cling fling sling wedding pudding
+    bed red shed need seed speed feed weed greed breed bleed indeed proceed succeed exceed hundred sacred
+    naked wicked wretched
+    building meeting feeling painting clothing interesting cunning christmas thanksgiving
+    forest digest modest earnest carrier
+""".split())
+
+
+# Gốc động từ tận cùng các cụm này gần như luôn có "e" câm (judge, merge, change, challenge, nurse, sense,
+# collapse, realize, become, consume, explore, ignore, restore, handle, complete, delete, compete, promote)
+_E_ENDINGS = ("dg", "rg", "lg", "ang", "eng", "rs", "ns", "ps", "ls", "iz", "com", "sum", "plor", "gnor", "stor",
+              "bl", "pl", "tl", "dl", "gl", "kl", "cl", "fl", "plet", "elet", "mpet", "cret", "mot", "vot")
+
+
+def _add_e(stem):
+    """Gốc sau khi bỏ -ed/-ing có cần thêm lại "e" không (lik → like, danc → dance, decid → decide)."""
+    if len(stem) < 2 or stem[-1] in "wxy" or stem[-1] in _VOWELS and stem[-1] != "u":
+        return False
+    if stem[-1] in "cuvz" or stem.endswith(_E_ENDINGS):
+        return True
+    vowel, last = stem[-2], stem[-1]
+    before = stem[-3] if len(stem) > 2 else ""
+    if vowel in _VOWELS:
+        if last == "s":
+            return not (vowel == "u" and before not in _VOWELS)  # cause, choose, raise; nhưng focus, bus
+        if last == "d" and vowel in "aiou":
+            return before not in _VOWELS or stem.endswith("uid")  # decide, include, guide; nhưng load, avoid
+        if last == "r" and vowel in "aiu":
+            return before not in _VOWELS or stem.endswith("uir")  # prepare, inspire, secure, require; nhưng pour, repair
+        if last in "gkn" and vowel in ("a" if last in "gk" else "i") and before not in _VOWELS and len(stem) > 4:
+            return True  # manage, overtake, combine; nhưng explain, join
+        if last == "t" and vowel in "au" and before not in _VOWELS and len(stem) > 3:
+            return True  # relate, compute; nhưng treat, heat
+    # Âm tiết ngắn kiểu phụ âm-nguyên âm-phụ âm (hop, lik, us): động từ gốc tận cùng "e" câm
+    groups = re.findall(r"[aeiou]+", stem)
+    return len(groups) == 1 and len(groups[0]) == 1 and last not in _VOWELS and len(stem) <= 4 \
+        and (len(stem) == 2 or vowel in _VOWELS)
+
+
+def _undouble(stem):
+    """stopp → stop, travell → travel (kiểu Anh); giữ nguyên ll/ss/ff/zz (call, spell, pass) và gốc quá ngắn (add, egg)."""
+    if len(stem) >= 4 and stem[-1] == stem[-2] and stem[-1] not in _VOWELS + "lsfz":
+        return stem[:-1]
+    if len(stem) >= 6 and stem.endswith("ell"):
+        return stem[:-1]
+    return None
+
+
+def _verb_stem(stem):
+    """Ứng viên gốc cho phần còn lại sau khi bỏ -ed/-ing, theo thứ tự ưu tiên."""
+    undoubled = _undouble(stem)
+    if undoubled:
+        return [undoubled, stem]
+    if _add_e(stem):
+        return [stem + "e", stem]
+    return [stem, stem + "e"]
+
+
+class Lemmatizer:
+    def __init__(self, known=None, exceptions=IRREGULAR, keep=KEEP, min_stem=3):
+        """
+        known(word) -> bool: từ gốc được phép đổi sang; None → chỉ dùng bảng ngoại lệ.
+        min_stem: gốc ngắn hơn thì không bỏ hậu tố (tránh "bus" → "bu", "red" → "r").
+        """
+        self.known = known or (lambda word: False)
+        self.exceptions = exceptions
+        self.keep = keep
+        self.min_stem = min_stem
+        self.lookups = 0
+        self.changed = 0
+
+    def candidates(self, word):
+        """Các ứng viên gốc theo thứ tự ưu tiên (chưa kiểm tra có thật hay không)."""
+        n = len(word)
+        if word.endswith("s") and not word.endswith(("ss", "us", "is", "ous")):
+            if word.endswith("ies") and n > 4:
+                return [word[:-3] + "y", word[:-1]]
+            if word.endswith("ves"):
+                return [word[:-1], word[:-3] + "f", word[:-3] + "fe"]
+            if word.endswith(("sses", "xes", "ches", "shes", "zzes")):
+                return [word[:-2], word[:-1]]
+            if word.endswith("oes"):
+                return [word[:-2], word[:-1]] if n > 5 else [word[:-1], word[:-2]]
+            if word.endswith("uses") and not word.endswith(("ouses", "auses")):
+                return [word[:-2], word[:-1]]  # buses, viruses (nhưng houses, causes)
+            if word.endswith("ses"):
+                return [word[:-1], word[:-2]]
+            return [word[:-1]]
+        if word.endswith("ed"):
+            if word.endswith("ied") and n > 4:
+                return [word[:-3] + "y"]
+            if word.endswith("eed"):
+                return [word[:-1]]  # agreed → agree
+            return _verb_stem(word[:-2])
+        if word.endswith("ing") and n > 4:
+            return _verb_stem(word[:-3])
+        if word.endswith("iest") and n > 5:
+            return [word[:-4] + "y"]
+        if word.endswith("est") and n > 5:
+            stem = word[:-3]
+            return [stem + "e", stem, _undouble(stem)]  # finest → fine trước fin
+        if word.endswith("ier") and n > 5:
+            return [word[:-3] + "y"]  # happier → happy
+        return []
+
+    def lemma(self, word):
+        """Dạng gốc của word (đã chuẩn hoá chữ thường); không nhận ra thì trả về nguyên word."""
+        self.lookups += 1
+        result = self._lemma(word)
+        if result != word:
+            self.changed += 1
+        return result
+
+    def _lemma(self, word):
+        if not word or not _WORD.match(word) or word in self.keep or self.known(word):
+            return word
+        if word.endswith(("'s", "’s")):
+            return self._lemma(word[:-2]) or word
+        if word in self.exceptions:
+            return self.exceptions[word]
+        # Chỉ đổi sang ứng viên đã có thật: "herring" không thành "her", "united" không thành "unit"
+        for candidate in self.candidates(word):
+            if candidate and len(candidate) >= self.min_stem and self.known(candidate):
+                return candidate
+        return word
+
+    def stats(self):
+        return {"lookups": self.lookups, "changed": self.changed}
@@ -1,5 +1,6 @@
-from app import app
 import os
 if __name__ == "__main__":
+    # Import trong __main__: process con (pool băm mật khẩu) chạy lại file này sẽ không dựng lại app
+    from app import app
     port = int(os.getenv("PORT", 8000))
-    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+📈 Số liệu vận hành dạng Prometheus (text exposition format 0.0.4), không cần thư viện ngoài.
+
+- Counter / Gauge / Histogram có nhãn, an toàn đa luồng, lưu trong RAM của mỗi worker.
+- on_scrape(fn): đăng ký hàm chạy lúc /metrics được gọi để cập nhật gauge lấy từ nơi khác
+  (pool DB, cache...) → không tốn gì trên đường đi của request.
+- render(): xuất toàn bộ số liệu; chi phí tỉ lệ với số series, đủ rẻ để scrape mỗi 5 giây.
+
+Lưu ý: mỗi gunicorn worker có bộ số liệu riêng (giống TTLCache), một lần scrape chỉ thấy worker đã trả lời.
+"""
+import bisect
+import threading
+import time
+
+# Bucket (giây) đủ rộng cho cả route nhẹ lẫn lời gọi AI upstream (timeout tới 50s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: cần nhãn {self.labelnames}, nhận {labels}")
+        return tuple("" if v is None else str(v) for v in labels)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def set(self, *labels, value):
+        # Với counter: chép giá trị đã được đếm ở nơi khác (ví dụ TTLCache.hits) lúc scrape
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._series.items())
+        return self._header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+_INF_LABEL = 'le="+Inf"'
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [đếm theo từng bucket (không cộng dồn), +Inf, tổng, số lần]
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0, 0]
+            if idx < len(self.buckets):
+                series[0][idx] += 1
+            else:
+                series[1] += 1
+            series[2] += value
+            series[3] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2], s[3])) for k, s in self._series.items())
+        lines = self._header()
+        for key, (counts, _, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _fmt_labels(self.labelnames, key, f'le="{_fmt_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, _INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Module bị import lại → dùng lại metric cũ
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, doc, labels=()):
+        return self._register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self._register(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, doc, labels, buckets))
+
+    def on_scrape(self, fn):
+        """Đăng ký hàm (không tham số) chạy trước mỗi lần render. Dùng được như decorator."""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ [METRICS] Collector {getattr(fn, '__name__', fn)} lỗi: {e}")
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+on_scrape = REGISTRY.on_scrape
+render = REGISTRY.render
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ===== Số liệu dùng chung giữa các module =====
+UPSTREAM_LATENCY = histogram(
+    "upstream_request_duration_seconds",
+    "Thời gian gọi AI upstream tới khi nhận header (giây)",
+    ("provider", "status"),
+)
+UPSTREAM_REJECTED = counter(
+    "upstream_rejected_total",
+    "Lời gọi upstream bị từ chối ngay (circuit_open / concurrency_limit)",
+    ("provider", "reason"),
+)
+UPSTREAM_BREAKER = gauge("upstream_breaker_state", "Trạng thái circuit breaker: 0 closed, 1 half-open, 2 open", ("provider",))
+UPSTREAM_LIMIT = gauge("upstream_concurrency_limit", "Giới hạn số request đang chạy (AIMD)", ("provider",))
+UPSTREAM_IN_FLIGHT = gauge("upstream_in_flight", "Số request upstream đang chạy", ("provider",))
+CACHE_REQUESTS = counter(
+    "cache_requests_total",
+    "Số lần tra cache trong worker, theo kết quả (hit/negative_hit/miss)",
+    ("cache", "result"),
+)
+CACHE_HIT_RATIO = gauge("cache_hit_ratio", "Tỉ lệ hit của cache trong worker", ("cache",))
+CACHE_SIZE = gauge("cache_entries", "Số phần tử đang nằm trong cache", ("cache",))
+
+
+def observe_upstream(provider, status, started):
+    UPSTREAM_LATENCY.observe(provider, status, value=time.perf_counter() - started)
+
+
+def export_cache(name, hits, misses, size, negative_hits=0):
+    """Chép số liệu hit/miss (cache tự đếm) sang metric, gọi trong hàm on_scrape."""
+    CACHE_REQUESTS.set(name, "hit", value=hits)
+    CACHE_REQUESTS.set(name, "negative_hit", value=negative_hits)
+    CACHE_REQUESTS.set(name, "miss", value=misses)
+    total = hits + negative_hits + misses
+    CACHE_HIT_RATIO.set(name, value=round((hits + negative_hits) / total, 4) if total else 0)
+    CACHE_SIZE.set(name, value=size)
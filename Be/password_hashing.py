@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Hàm băm mật khẩu chạy trong process con của auth.py.
+
+Cố ý không import gì của app (Flask, DB, blueprint...): process con chỉ cần nạp file này.
+"""
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def hash_password(password):
+    return generate_password_hash(password)
+
+
+def verify_password(pwhash, password):
+    return check_password_hash(pwhash, password)
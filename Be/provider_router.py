@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+🧭 Chọn provider AI theo độ trễ/tỉ lệ lỗi thực tế, có gửi "hedge" request.
+
+- Mỗi (provider, endpoint) có cửa sổ mẫu gần đây (ROUTER_WINDOW_SECONDS): độ trễ các lần thành công + tỉ lệ lỗi.
+  Mẫu cũ tự hết hạn, nên provider từng lỗi sẽ được thử lại sau một thời gian.
+- ProviderRouter.call(candidates): gửi tới provider khỏe và nhanh nhất; nếu sau p95 độ trễ của nó
+  vẫn chưa có kết quả thì gửi thêm một request tới provider kế tiếp, lấy kết quả nào về trước.
+  Provider trả lỗi → chuyển ngay sang provider kế tiếp.
+- ProviderRouter.acall(candidates): cùng logic nhưng cho coroutine (chế độ ASGI, asgi.py).
+- ChatProvider: adapter cho các API kiểu OpenAI /chat/completions (OpenAI, Groq).
+
+Cấu hình:
+    ROUTER_HEDGE=1                bật hedge (mặc định tắt: hedge gửi thêm request, tốn gấp đôi quota lúc chậm;
+                                  khi tắt vẫn giữ xếp hạng + chuyển provider khi lỗi)
+    ROUTER_HEDGE_DELAY            độ trễ hedge (giây) khi chưa đủ mẫu để tính p95 (mặc định 3)
+    ROUTER_MAX_WORKERS            số thread gọi upstream song song mỗi worker (mặc định 16)
+    ROUTER_WINDOW_SECONDS         độ dài cửa sổ thống kê (mặc định 300)
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import upstream
+
+HEDGE_ENABLED = os.getenv("ROUTER_HEDGE", "0") not in ("0", "false", "False")
+HEDGE_DEFAULT_DELAY = float(os.getenv("ROUTER_HEDGE_DELAY", 3))
+HEDGE_MIN_DELAY = 0.05
+MAX_WORKERS = int(os.getenv("ROUTER_MAX_WORKERS", 16))
+WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", 300))
+MIN_SAMPLES = 5          # Số mẫu tối thiểu trước khi tin vào p50/p95
+UNHEALTHY_ERROR_RATE = 0.5
+_MAX_SAMPLES = 200
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class RollingStats:
+    """Mẫu (thời điểm, độ trễ, thành công) của một (provider, endpoint) trong cửa sổ thời gian."""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self._samples = deque(maxlen=_MAX_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+    def snapshot(self):
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            samples = list(self._samples)
+        latencies = sorted(s[1] for s in samples if s[2])
+        errors = sum(1 for s in samples if not s[2])
+        return {
+            "samples": len(samples),
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "p50": _percentile(latencies, 50) if len(latencies) >= MIN_SAMPLES else None,
+            "p95": _percentile(latencies, 95) if len(latencies) >= MIN_SAMPLES else None,
+        }
+
+
+_routers = []
+_background = set()  # Task hedge thua vẫn chạy tiếp để ghi thống kê; giữ tham chiếu để không bị GC
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="provider")
+                _executor_pid = pid
+    return _executor
+
+
+class ProviderRouter:
+    def __init__(self, endpoint, hedge=HEDGE_ENABLED):
+        self.endpoint = endpoint
+        self.hedge = hedge
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        _routers.append(self)  # Để /metrics thấy số liệu của router này
+
+    def stats_for(self, provider):
+        stats = self._stats.get(provider)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(provider, RollingStats())
+        return stats
+
+    def rank(self, providers):
+        """
+        Sắp xếp: provider khỏe trước, rồi theo p50; provider chưa đủ mẫu xếp sau provider đã đo được
+        (giữ thứ tự cấu hình), để provider dự phòng không nhận traffic chính chỉ vì chưa có số liệu.
+        """
+        def key(item):
+            idx, name = item
+            snap = self.stats_for(name).snapshot()
+            unhealthy = snap["samples"] >= 3 and snap["error_rate"] >= UNHEALTHY_ERROR_RATE
+            unmeasured = snap["p50"] is None
+            return (unhealthy, unmeasured, snap["p50"] or 0.0, idx)
+        return [name for _, name in sorted(enumerate(providers), key=key)]
+
+    def _hedge_delay(self, provider):
+        p95 = self.stats_for(provider).snapshot()["p95"]
+        return max(HEDGE_MIN_DELAY, p95 if p95 is not None else HEDGE_DEFAULT_DELAY)
+
+    def _timed(self, provider, fn):
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception:
+            self.stats_for(provider).record(time.perf_counter() - started, False)
+            raise
+        self.stats_for(provider).record(time.perf_counter() - started, True)
+        return result
+
+    def call(self, candidates):
+        """
+        candidates: list (tên provider, hàm không tham số). Hàm chạy ở thread khác nên không được
+        dùng request/db của Flask; lỗi (exception) được tính là provider lỗi.
+        Trả về (tên provider, kết quả); mọi provider đều lỗi → raise lỗi của provider cuối cùng.
+        """
+        if not candidates:
+            raise RuntimeError(f"Không có provider nào được cấu hình cho {self.endpoint}")
+        fns = dict(candidates)
+        order = self.rank([name for name, _ in candidates])
+        last_error = None
+
+        pending = {}
+        next_idx = 0
+        hedged = False
+        while True:
+            if not pending:
+                if next_idx >= len(order):
+                    raise last_error
+                name = order[next_idx]
+                next_idx += 1
+                if not _slots.acquire(blocking=False):
+                    # Hết thread: gọi tuần tự ngay trên thread hiện tại, không hedge
+                    try:
+                        return name, self._timed(name, fns[name])
+                    except Exception as e:
+                        last_error = e
+                        self.failovers += next_idx < len(order)
+                        continue
+                pending[self._submit(name, fns[name])] = name
+                primary = name
+
+            can_hedge = self.hedge and not hedged and next_idx < len(order)
+            done, _ = wait(pending, timeout=self._hedge_delay(primary) if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                if _slots.acquire(blocking=False):
+                    name = order[next_idx]
+                    next_idx += 1
+                    self.hedges += 1
+                    pending[self._submit(name, fns[name])] = name
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if name != primary:
+                    self.hedge_wins += 1
+                # Request còn lại (nếu có) chạy tiếp ở nền, kết quả chỉ dùng cho thống kê
+                return name, result
+            if not pending and next_idx < len(order):
+                self.failovers += 1
+
+    async def _atimed(self, provider, coro_fn):
+        started = time.perf_counter()
+        try:
+            result = await coro_fn()
+        except Exception:
+            self.stats_for(provider).record(time.perf_counter() - started, False)
+            raise
+        self.stats_for(provider).record(time.perf_counter() - started, True)
+        return result
+
+    async def acall(self, candidates):
+        """
+        Bản async của call(): candidates là list (tên provider, hàm không tham số trả về coroutine).
+        Không cần thread: hedge chỉ là thêm một task trên event loop.
+        """
+        if not candidates:
+            raise RuntimeError(f"Không có provider nào được cấu hình cho {self.endpoint}")
+        fns = dict(candidates)
+        order = self.rank([name for name, _ in candidates])
+        last_error = None
+
+        pending = {}
+        next_idx = 0
+        hedged = False
+        try:
+            while True:
+                if not pending:
+                    if next_idx >= len(order):
+                        raise last_error
+                    name = order[next_idx]
+                    next_idx += 1
+                    pending[asyncio.ensure_future(self._atimed(name, fns[name]))] = name
+                    primary = name
+
+                can_hedge = self.hedge and not hedged and next_idx < len(order)
+                done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(primary) if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    name = order[next_idx]
+                    next_idx += 1
+                    self.hedges += 1
+                    pending[asyncio.ensure_future(self._atimed(name, fns[name]))] = name
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if name != primary:
+                        self.hedge_wins += 1
+                    return name, result
+                if not pending and next_idx < len(order):
+                    self.failovers += 1
+        finally:
+            for task in pending:
+                _background.add(task)
+                task.add_done_callback(_discard_background)
+
+    def _submit(self, name, fn):
+        def run():
+            try:
+                return self._timed(name, fn)
+            finally:
+                _slots.release()
+        try:
+            return _get_executor().submit(run)
+        except BaseException:
+            _slots.release()
+            raise
+
+    def stats(self):
+        with self._lock:
+            providers = list(self._stats)
+        return {
+            "endpoint": self.endpoint,
+            "hedge": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "providers": {name: self.stats_for(name).snapshot() for name in providers},
+        }
+
+
+def _discard_background(task):
+    _background.discard(task)
+    if not task.cancelled():
+        task.exception()  # Lỗi của request thua đã được ghi vào thống kê, bỏ qua
+
+
+# ============================================================
+# Adapter cho API kiểu OpenAI /chat/completions
+# ============================================================
+class ChatProvider:
+    def __init__(self, name, base_url, api_key, model):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+
+    def _request_args(self, messages, temperature, max_tokens, stream, extra):
+        body = {"model": self.model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            body["max_tokens"] = max_tokens
+        if stream:
+            body["stream"] = True
+        body.update(extra)
+        return dict(
+            headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            json=body,
+            stream=stream,
+        )
+
+    def post(self, messages, temperature, max_tokens=None, stream=False, **extra):
+        return upstream.post(
+            self.name,
+            f"{self.base_url}/chat/completions",
+            **self._request_args(messages, temperature, max_tokens, stream, extra),
+        )
+
+    def complete(self, messages, temperature, max_tokens=None, **extra):
+        """Trả về nội dung text của câu trả lời; mã lỗi HTTP → upstream.UpstreamHTTPError."""
+        resp = self.post(messages, temperature, max_tokens, **extra)
+        return self._content(resp)
+
+    async def apost(self, messages, temperature, max_tokens=None, stream=False, **extra):
+        import async_upstream  # Chỉ cần httpx khi chạy chế độ ASGI
+        return await async_upstream.post(
+            self.name,
+            f"{self.base_url}/chat/completions",
+            **self._request_args(messages, temperature, max_tokens, stream, extra),
+        )
+
+    async def acomplete(self, messages, temperature, max_tokens=None, **extra):
+        resp = await self.apost(messages, temperature, max_tokens, **extra)
+        return self._content(resp)
+
+    def _content(self, resp):
+        if resp.status_code >= 400:
+            raise upstream.UpstreamHTTPError(self.name, resp.status_code, resp.text[:120])
+        return (
+            resp.json().get("choices", [{}])[0]
+                       .get("message", {})
+                       .get("content", "")
+                       .strip()
+        )
+
+
+def _chat_provider_configs():
+    return {
+        "openai": (
+            os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            os.getenv("OPENAI_API_KEY"),
+            os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini"),
+        ),
+        "groq": (
+            os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1"),
+            os.getenv("GROQ_API_KEY"),
+            os.getenv("GROQ_MODEL_NAME", "llama-3.3-70b-versatile"),
+        ),
+    }
+
+
+def chat_providers(setting, default):
+    """
+    Danh sách ChatProvider theo biến môi trường `setting` (vd "openai,groq"), bỏ qua provider thiếu API key.
+    """
+    configs = _chat_provider_configs()
+    providers = []
+    for name in (os.getenv(setting) or default).split(","):
+        name = name.strip().lower()
+        config = configs.get(name)
+        if config and config[1]:
+            providers.append(ChatProvider(name, *config))
+    return providers
+
+
+def parse_json_reply(text):
+    """Lấy object JSON từ câu trả lời của AI (bỏ ```json, chữ thừa quanh cặp ngoặc nhọn)."""
+    text = (text or "").replace("```json", "").replace("```", "").strip()
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start == -1 or end <= start:
+        raise ValueError("AI không trả về đúng định dạng JSON")
+    return json.loads(text[start:end])
+
+
+# ============================================================
+# 📈 Số liệu cho /metrics
+# ============================================================
+PROVIDER_P50 = metrics.gauge("provider_latency_p50_seconds", "p50 độ trễ provider trong cửa sổ", ("endpoint", "provider"))
+PROVIDER_P95 = metrics.gauge("provider_latency_p95_seconds", "p95 độ trễ provider trong cửa sổ", ("endpoint", "provider"))
+PROVIDER_ERRORS = metrics.gauge("provider_error_ratio", "Tỉ lệ lỗi provider trong cửa sổ", ("endpoint", "provider"))
+ROUTER_EVENTS = metrics.counter("provider_router_events_total", "Số lần hedge / hedge thắng / chuyển provider", ("endpoint", "event"))
+
+
+@metrics.on_scrape
+def collect_router_metrics():
+    for router in _routers:
+        stats = router.stats()
+        for event in ("hedges", "hedge_wins", "failovers"):
+            ROUTER_EVENTS.set(router.endpoint, event, value=stats[event])
+        for name, snap in stats["providers"].items():
+            PROVIDER_ERRORS.set(router.endpoint, name, value=snap["error_rate"])
+            if snap["p50"] is not None:
+                PROVIDER_P50.set(router.endpoint, name, value=round(snap["p50"], 4))
+                PROVIDER_P95.set(router.endpoint, name, value=round(snap["p95"], 4))
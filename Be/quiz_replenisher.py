@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+♻️ Bổ sung câu hỏi quiz ở nền thay vì bắt người dùng chờ AI sinh câu hỏi trong request.
+
+Mỗi pool (topic, level) có một ngưỡng low-water. Khi request thấy pool dưới ngưỡng,
+ensure() xếp một job vào thread pool giới hạn số luồng; job gọi AI theo từng batch
+cho tới khi đủ ngưỡng, hết số batch cho phép, hoặc AI không trả thêm câu mới.
+Mỗi pool chỉ có tối đa một job đang chờ/chạy.
+Job không thêm được câu nào (STALLED: AI lỗi/chỉ sinh câu trùng) → pool chờ retry_backoff giây (gấp đôi sau mỗi
+lần liên tiếp, tối đa max_backoff) mới được xếp job lại. Số pool được theo dõi có giới hạn (max_pools) vì topic
+do client gửi lên.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+IDLE, QUEUED, FILLING, FULL, STALLED = "idle", "queued", "filling", "full", "stalled"
+
+
+class QuizReplenisher:
+    def __init__(self, fill_batch, count_pool, low_water=800, max_workers=2, max_batches=5,
+                 retry_backoff=60, max_backoff=3600, max_pools=1000):
+        """
+        fill_batch(topic, level) -> số câu hỏi mới đã lưu vào DB
+        count_pool(topic, level) -> số câu hỏi hiện có của pool
+        Cả hai được gọi từ thread nền, tự lo app context / DB session.
+        """
+        self.fill_batch = fill_batch
+        self.count_pool = count_pool
+        self.low_water = low_water
+        self.max_workers = max_workers
+        self.max_batches = max_batches
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.max_pools = max(1, int(max_pools))
+        self._executor = None
+        self._pools = OrderedDict()  # key -> status, lâu không được hỏi tới nhất đứng đầu
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Tạo lười để thread pool được sinh ra trong worker sau khi fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quiz-fill")
+        return self._executor
+
+    def _status(self, key):
+        """Trạng thái của pool (tạo mới nếu chưa có); None nếu đã theo dõi đủ max_pools pool đang chờ/chạy."""
+        status = self._pools.get(key)
+        if status is not None:
+            self._pools.move_to_end(key)
+            return status
+        if len(self._pools) >= self.max_pools and not self._evict():
+            return None
+        status = {
+            "topic": key[0], "level": key[1], "state": IDLE, "count": None,
+            "batches": 0, "added": 0, "last_added": None, "last_error": None,
+            "queued_at": None, "started_at": None, "finished_at": None,
+            "failures": 0, "next_retry_at": None,
+        }
+        self._pools[key] = status
+        return status
+
+    def _evict(self):
+        # Bỏ pool lâu không được hỏi tới nhất, trừ pool đang có job (job vẫn giữ tham chiếu tới status)
+        for key, status in self._pools.items():
+            if status["state"] not in (QUEUED, FILLING):
+                del self._pools[key]
+                return True
+        return False
+
+    def ensure(self, topic, level, current_count):
+        """Ghi nhận số câu hiện có; xếp job bổ sung nếu pool dưới ngưỡng. Không bao giờ chặn request."""
+        key = (topic, level)
+        with self._lock:
+            status = self._status(key)
+            if status is None:
+                return False
+            status["count"] = current_count
+            if status["state"] in (QUEUED, FILLING):
+                return False
+            if current_count >= self.low_water:
+                status["state"] = FULL
+                return False
+            if status["state"] == STALLED and time.time() < status["next_retry_at"]:
+                return False  # Lần trước AI không thêm được câu nào: chờ hết backoff
+            status["state"] = QUEUED
+            status["queued_at"] = time.time()
+            executor = self._get_executor()
+        executor.submit(self._run, key, status)
+        return True
+
+    def _run(self, key, status):
+        topic, level = key
+        with self._lock:
+            status.update(state=FILLING, started_at=time.time(), last_error=None)
+        final_state = STALLED
+        try:
+            for _ in range(self.max_batches):
+                added = self.fill_batch(topic, level)
+                count = self.count_pool(topic, level)
+                with self._lock:
+                    status["batches"] += 1
+                    status["added"] += added
+                    status["last_added"] = added
+                    status["count"] = count
+                if count >= self.low_water:
+                    final_state = FULL
+                    break
+                if not added:
+                    # AI lỗi hoặc chỉ sinh câu trùng → dừng, thử lại sau retry_backoff
+                    break
+            else:
+                final_state = IDLE
+        except Exception as e:
+            print(f"⚠️ [QUIZ-FILL] {topic}/{level}: {e}")
+            with self._lock:
+                status["last_error"] = str(e)
+        finally:
+            with self._lock:
+                status["state"] = final_state
+                status["finished_at"] = time.time()
+                if final_state == STALLED:
+                    status["failures"] += 1
+                    delay = min(self.max_backoff, self.retry_backoff * 2 ** (status["failures"] - 1))
+                    status["next_retry_at"] = status["finished_at"] + delay
+                else:
+                    status["failures"] = 0
+                    status["next_retry_at"] = None
+
+    def status(self):
+        with self._lock:
+            return {
+                "low_water": self.low_water,
+                "max_workers": self.max_workers,
+                "max_pools": self.max_pools,
+                "pools": [dict(s) for s in self._pools.values()],
+            }
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+🎲 Lấy ngẫu nhiên câu hỏi quiz mà không cần ORDER BY RANDOM().
+
+Mỗi pool (topic, level) giữ mảng id trong RAM (array 'q', ~8 byte/id), nạp lại theo TTL.
+Số pool giữ trong RAM có giới hạn (max_pools, LRU): topic do client gửi lên có thể là bất kỳ chuỗi nào.
+Mỗi lần lấy mẫu chỉ là vài lần random.randrange trên mảng → O(k), không phụ thuộc kích thước bảng;
+sau đó lấy nội dung câu hỏi bằng một truy vấn theo primary key (id IN ...).
+
+Mỗi user có danh sách id vừa gặp gần đây để hạn chế lặp câu hỏi giữa các lượt quiz.
+"""
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+from singleflight import SingleFlight
+from ttl_cache import MISSING, TTLCache
+
+
+class QuizSampler:
+    def __init__(self, load_ids, ttl=300, recent_per_user=200, max_users=10000, max_pools=256):
+        """
+        load_ids(topic, level) -> iterable id của pool; topic=None nghĩa là cả level.
+        max_pools: số pool tối đa giữ trong RAM; quá thì bỏ pool lâu không dùng nhất.
+        """
+        self.load_ids = load_ids
+        self.ttl = ttl
+        self.recent_per_user = recent_per_user
+        self.max_pools = max(1, int(max_pools))
+        self._pools = OrderedDict()  # key -> (loaded_at, array), cũ nhất đứng đầu
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+        self._recent = TTLCache(maxsize=max_users, ttl=6 * 3600)
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    # ---------- Pool id ----------
+    def _load(self, key):
+        ids = array("q", self.load_ids(*key))
+        with self._lock:
+            self._pools[key] = (time.monotonic(), ids)
+            self._pools.move_to_end(key)
+            self.loads += 1
+            while len(self._pools) > self.max_pools:
+                self._pools.popitem(last=False)
+                self.evictions += 1
+        return ids
+
+    def ids_for(self, key):
+        with self._lock:
+            item = self._pools.get(key)
+            if item is not None and time.monotonic() - item[0] < self.ttl:
+                self._pools.move_to_end(key)
+                self.hits += 1
+                return item[1]
+        # Nhiều request cùng thấy pool hết hạn → chỉ một request đọc lại từ DB
+        return self._loads.do(key, lambda: self._load(key))
+
+    def add_ids(self, key, new_ids):
+        """Thêm id vừa insert vào pool đang nạp sẵn (nếu có) mà không phải đọc lại cả pool."""
+        with self._lock:
+            item = self._pools.get(key)
+            if item is not None:
+                item[1].extend(new_ids)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._pools.clear()
+            else:
+                self._pools.pop(key, None)
+
+    # ---------- Lấy mẫu ----------
+    def _recent_for(self, user_id):
+        if not user_id:
+            return None
+        recent = self._recent.get(user_id)
+        if recent is MISSING:
+            recent = deque(maxlen=self.recent_per_user)
+            self._recent.set(user_id, recent)
+        return recent
+
+    @staticmethod
+    def _pick(ids, k, exclude):
+        n = len(ids)
+        if n == 0 or k <= 0:
+            return []
+        if n <= 4 * (k + len(exclude)):
+            # Pool nhỏ: lọc tuyến tính vẫn rẻ; thiếu câu mới thì cho phép lặp lại câu đã gặp
+            fresh = [i for i in ids if i not in exclude]
+            picked = random.sample(fresh, min(k, len(fresh)))
+            if len(picked) < k:
+                taken = set(picked)
+                rest = [i for i in ids if i not in taken]
+                picked += random.sample(rest, min(k - len(picked), len(rest)))
+            return picked
+
+        picked, taken = [], set()
+        for _ in range(k * 20):
+            i = ids[random.randrange(n)]
+            if i in taken or i in exclude:
+                continue
+            taken.add(i)
+            picked.append(i)
+            if len(picked) == k:
+                break
+        return picked
+
+    def sample(self, topic, level, k=20, user_id=None, exclude=()):
+        """Trả về tối đa k id ngẫu nhiên của pool (topic, level), tránh các id user vừa gặp."""
+        ids = self.ids_for((topic, level))
+        recent = self._recent_for(user_id)
+        skip = set(exclude)
+        if recent:
+            skip.update(recent)
+        picked = self._pick(ids, k, skip)
+        if recent is not None:
+            recent.extend(picked)
+        return picked
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pools": len(self._pools),
+                "max_pools": self.max_pools,
+                "evictions": self.evictions,
+                "ids": sum(len(item[1]) for item in self._pools.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+                "users_tracked": len(self._recent),
+            }
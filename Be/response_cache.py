@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+💾 Cache câu trả lời /ai/chat theo đúng nội dung câu hỏi (exact match sau khi chuẩn hoá).
+
+Rất nhiều câu hỏi lặp lại y hệt ("difference between since and for") với history rỗng → trả luôn câu trả lời cũ
+thay vì gọi OpenAI lần nữa.
+
+- Key = sha256 của (model, tham số sinh, system prompt, history, câu hỏi đã chuẩn hoá: NFC + casefold +
+  gộp khoảng trắng + bỏ dấu câu ở cuối). Đổi prompt/model/temperature → key khác, không cần xoá cache.
+- Chỉ áp dụng khi history ngắn (≤ max_history tin nhắn); hội thoại dài gần như không bao giờ lặp lại.
+- Backend cắm được (RESPONSE_CACHE):
+    memory  – TTLCache trong RAM của mỗi worker (mặc định, hit ~ vài µs)
+    sqlite  – một file SQLite dùng chung cho mọi worker trên máy (RESPONSE_CACHE_PATH), hit ~ 0.1ms
+    off     – tắt
+  Cả hai đều giới hạn theo TTL (RESPONSE_CACHE_TTL) và số phần tử (RESPONSE_CACHE_SIZE).
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+
+from ttl_cache import MISSING, TTLCache
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    return _SPACES.sub(" ", text).strip().rstrip("?!.。 ")
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        value = self._cache.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def stats(self):
+        stats = self._cache.stats()
+        return {"hits": stats["hits"], "misses": stats["misses"], "size": stats["size"]}
+
+
+class SqliteBackend:
+    """
+    Bảng key/value trong một file SQLite (WAL) dùng chung giữa các worker/process trên cùng máy.
+    Mỗi thread một connection; cứ prune_every lần ghi thì xoá bản hết hạn và cắt bớt bản cũ nhất nếu quá maxsize.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, maxsize, ttl, prune_every=200):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires_at ON response_cache (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():  # Không dùng lại connection của process cha sau fork
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else row[0]
+
+    def set(self, key, value):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl),
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune(conn)
+
+    def prune(self, conn=None):
+        conn = conn or self._connect()
+        conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+class ResponseCache:
+    def __init__(self, backend=None, max_history=2):
+        self.backend = backend  # None → tắt
+        self.max_history = max_history
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key(self, messages, model, params):
+        """
+        Key cho prompt messages ([system..., history..., user]); None nếu không nên cache
+        (cache tắt hoặc history dài hơn max_history).
+        """
+        if self.backend is None or not messages or messages[-1].get("role") != "user":
+            return None
+        context = [m for m in messages[:-1] if m.get("role") != "system"]
+        if len(context) > self.max_history:
+            return None
+        payload = [model, params] + [
+            [m.get("role"), m.get("content") if m.get("role") == "system" else normalize_message(m.get("content"))]
+            for m in messages
+        ]
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:  # Cache hỏng không được làm hỏng request
+            print(f"⚠️ [RESPONSE-CACHE] Đọc cache lỗi: {e}")
+            return None
+
+    def set(self, key, reply):
+        if key is None or not reply or reply.startswith("[Fallback]"):
+            return
+        try:
+            self.backend.set(key, reply)
+        except Exception as e:
+            print(f"⚠️ [RESPONSE-CACHE] Ghi cache lỗi: {e}")
+
+    def stats(self):
+        if self.backend is None:
+            return {"backend": "off", "hits": 0, "misses": 0, "size": 0}
+        return {"backend": self.backend.name, **self.backend.stats()}
+
+
+def from_env():
+    kind = (os.getenv("RESPONSE_CACHE") or "memory").strip().lower()
+    maxsize = int(os.getenv("RESPONSE_CACHE_SIZE", 5000))
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", 86400))
+    if kind == "sqlite":
+        path = os.getenv("RESPONSE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "english-app-response-cache.sqlite3")
+        backend = SqliteBackend(path, maxsize, ttl)
+    elif kind in ("off", "0", "false", "none"):
+        backend = None
+    else:
+        backend = MemoryBackend(maxsize, ttl)
+    return ResponseCache(backend, max_history=int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", 2)))
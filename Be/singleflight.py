@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+🚦 Gộp các lời gọi trùng nhau đang chạy đồng thời (single-flight).
+
+- SingleFlight.do(key, fn): trong một worker, chỉ thread đầu tiên chạy fn, các thread khác
+  cùng key chờ và nhận chung kết quả (hoặc chung exception).
+- AsyncSingleFlight.do(key, coro_fn): bản cho asyncio (asgi.py), gộp các coroutine cùng key trong event loop.
+- host_lock(key): khoá file (fcntl.flock) để các worker gunicorn trên cùng máy xếp hàng theo key.
+  Key (thường do user nhập) được băm vào LOCK_STRIPES file cố định nên thư mục khoá không phình ra;
+  hai key chung một file chỉ phải chờ nhau. Trên hệ điều hành không có fcntl thì khoá này không làm gì.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCK_DIR = os.getenv("LOCK_DIR") or os.path.join(tempfile.gettempdir(), "english-app-locks")
+LOCK_STRIPES = int(os.getenv("LOCK_STRIPES", 256))
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not call.event.wait(self.wait_timeout):
+                raise TimeoutError(f"single-flight '{key}' chờ quá {self.wait_timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight:
+    """
+    Như SingleFlight nhưng cho coroutine: lời gọi chạy trong một task riêng, các request cùng key cùng chờ task đó.
+    Request gọi đầu tiên bị huỷ (client ngắt) thì task vẫn chạy tiếp cho các request đang chờ.
+    """
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: một waiter bị huỷ không được huỷ lời gọi chung
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+
+        task = asyncio.ensure_future(coro_fn())
+        self._calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Đánh dấu đã lấy lỗi, tránh cảnh báo khi không còn ai chờ
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+@contextmanager
+def host_lock(key, timeout=30.0, poll=0.05, striped=True):
+    """
+    Khoá theo key giữa các process trên cùng host. Yield True nếu giữ được khoá,
+    False nếu hết timeout (khi đó caller vẫn chạy tiếp, chỉ mất phần gộp giữa các worker).
+    striped=False: file riêng cho key, chỉ dùng với vài key cố định giữ khoá lâu (không chặn các key khác).
+    """
+    if fcntl is None:
+        yield False
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    name = f"stripe-{int(digest, 16) % LOCK_STRIPES:03d}" if striped else digest
+    fd = os.open(os.path.join(LOCK_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(poll)
+        yield acquired
+    finally:
+        if acquired:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
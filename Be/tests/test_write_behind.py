@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Kiểm tra WriteBehindBuffer (write_behind.py) với write_rows giả, không cần DB.
+
+Thread nền chỉ tự ghi khi lô đầy hoặc quá flush_interval, nên các test dùng max_batch/flush_interval lớn
+để tự gọi flush()/close() (trừ test ghi theo thời gian).
+
+Chạy:  python -m pytest -q tests/test_write_behind.py
+"""
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_behind import WriteBehindBuffer  # noqa: E402
+
+metadata = MetaData()
+SESSIONS = Table("sessions", metadata, Column("id", Integer, primary_key=True))
+TURNS = Table("turns", metadata, Column("id", Integer, primary_key=True), Column("text", String(50)))
+
+
+class BadRow(Exception):
+    """Giống IntegrityError: lỗi do dữ liệu của một dòng, cả lô chứa dòng đó bị từ chối."""
+
+
+def test_close_drains_pending_rows_in_table_order():
+    batches = []
+    buffer = WriteBehindBuffer(lambda table, rows: batches.append((table.name, list(rows))),
+                               [SESSIONS, TURNS], max_batch=2, flush_interval=60)
+    assert buffer.add(SESSIONS, {"id": 1})
+    assert buffer.add_many(TURNS, [{"id": i, "text": "hi"} for i in range(5)])
+
+    buffer.close()
+
+    assert [name for name, _ in batches] == ["sessions", "turns", "turns", "turns"]
+    assert sum(len(rows) for _, rows in batches) == 6
+    assert buffer.stats()["pending"] == 0
+    assert buffer.written == 6
+    assert buffer.lost == 0
+    assert not buffer.add(SESSIONS, {"id": 3})  # Đã đóng: caller tự ghi
+
+
+def test_bad_row_is_isolated_from_the_rest_of_the_batch():
+    written = []
+
+    def write_rows(table, rows):
+        if any(row["text"] == "bad" for row in rows):
+            raise BadRow("foreign key")
+        written.extend(row["id"] for row in rows)
+
+    buffer = WriteBehindBuffer(write_rows, [TURNS], max_batch=200, flush_interval=60, retries=3,
+                               backoff=10, row_errors=(BadRow,))
+    rows = [{"id": i, "text": "bad" if i in (3, 11) else "ok"} for i in range(16)]
+    buffer.add_many(TURNS, rows)
+
+    started = time.monotonic()
+    assert buffer.flush() == 14
+    assert time.monotonic() - started < 1.0  # Lỗi dữ liệu: không thử lại cả lô theo backoff
+
+    assert sorted(written) == [i for i in range(16) if i not in (3, 11)]
+    stats = buffer.stats()
+    assert stats["dropped"] == 2
+    assert stats["lost"] == 0
+    assert stats["pending"] == 0
+    buffer.close()
+
+
+def test_failing_writes_are_retried_with_backoff_then_counted_as_lost():
+    calls = []
+
+    def write_rows(table, rows):
+        calls.append(time.monotonic())
+        raise RuntimeError("db down")
+
+    buffer = WriteBehindBuffer(write_rows, [TURNS], max_batch=200, flush_interval=60, retries=2,
+                               backoff=0.02, row_errors=(BadRow,))
+    buffer.add_many(TURNS, [{"id": 1}, {"id": 2}])
+
+    assert buffer.flush() == 0
+
+    assert len(calls) == 3  # Lỗi không phải do dữ liệu: thử lại cả lô, không tách
+    assert calls[1] - calls[0] >= 0.02 and calls[2] - calls[1] >= 0.04
+    assert buffer.lost == 2
+    assert buffer.dropped == 0
+    assert buffer.written == 0
+    assert not buffer.is_pending(TURNS, 1)
+    buffer.close()
+
+
+def test_close_stops_retrying_at_drain_deadline():
+    calls = []
+
+    def write_rows(table, rows):
+        calls.append(table.name)
+        raise RuntimeError("db down")
+
+    buffer = WriteBehindBuffer(write_rows, [SESSIONS, TURNS], max_batch=200, flush_interval=60, retries=10,
+                               backoff=0.05, drain_timeout=0.12)
+    buffer.add_many(SESSIONS, [{"id": 1}])
+    buffer.add_many(TURNS, [{"id": 1}, {"id": 2}])
+
+    started = time.monotonic()
+    buffer.close()
+
+    assert time.monotonic() - started < 1.0
+    assert len(calls) < 2 * 11  # Không chạy hết số lần thử sau deadline
+    assert buffer.lost == 3
+    assert buffer.stats()["pending"] == 0
+
+
+def test_background_thread_keeps_running_after_a_failed_write():
+    fail = threading.Event()
+    fail.set()
+    written = []
+    done = threading.Event()
+
+    def write_rows(table, rows):
+        if fail.is_set():
+            fail.clear()
+            raise RuntimeError("connection reset")
+        written.extend(row["id"] for row in rows)
+        done.set()
+
+    buffer = WriteBehindBuffer(write_rows, [TURNS], max_batch=1, flush_interval=60, retries=0)
+    buffer.add(TURNS, {"id": 1})
+    deadline = time.monotonic() + 2.0
+    while buffer.lost == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    buffer.add(TURNS, {"id": 2})
+
+    assert done.wait(2.0)
+    assert written == [2]
+    assert buffer.lost == 1
+    buffer.close()
+
+
+def test_add_many_rejects_whole_batch_over_max_pending():
+    buffer = WriteBehindBuffer(lambda table, rows: None, [SESSIONS], max_batch=200, flush_interval=60,
+                               max_pending=3)
+    assert buffer.add_many(SESSIONS, [{"id": 1}, {"id": 2}])
+
+    assert not buffer.add_many(SESSIONS, [{"id": 3}, {"id": 4}])
+
+    stats = buffer.stats()
+    assert stats["pending"] == 2
+    assert stats["rejected"] == 2
+    assert not buffer.is_pending(SESSIONS, 3)
+    assert buffer.add(SESSIONS, {"id": 3})  # Vẫn còn chỗ cho đúng một dòng
+    buffer.close()
+
+
+def test_background_thread_flushes_after_flush_interval():
+    batches = []
+    written = threading.Event()
+
+    def write_rows(table, rows):
+        batches.append((table.name, list(rows)))
+        written.set()
+
+    buffer = WriteBehindBuffer(write_rows, [TURNS], max_batch=200, flush_interval=0.05)
+    buffer.add(TURNS, {"id": 1, "text": "hi"})
+    assert buffer.is_pending(TURNS, 1)
+
+    assert written.wait(2.0)
+
+    assert batches == [("turns", [{"id": 1, "text": "hi"}])]
+    deadline = time.monotonic() + 2.0
+    while buffer.is_pending(TURNS, 1) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not buffer.is_pending(TURNS, 1)
+    buffer.close()
+
+
+def test_is_pending_counts_duplicate_keys():
+    seen = []
+    both_added = threading.Event()
+    buffer = None
+
+    def write_rows(table, rows):
+        both_added.wait(2.0)  # Thread nền có thể lấy dòng đầu ngay (max_batch=1): chờ đủ hai dòng rồi mới ghi
+        seen.append(buffer.is_pending(table, 7))
+
+    buffer = WriteBehindBuffer(write_rows, [TURNS], max_batch=1, flush_interval=60)
+    buffer.add(TURNS, {"id": 7, "text": "first"})
+    buffer.add(TURNS, {"id": 7, "text": "second"})
+    assert buffer.is_pending(TURNS, 7)
+    assert not buffer.is_pending(TURNS, 8)
+    both_added.set()
+
+    buffer.close()
+
+    # Lô đầu ghi xong vẫn còn dòng thứ hai cùng khoá đang chờ
+    assert seen == [True, True]
+    assert buffer.written == 2
+    assert not buffer.is_pending(TURNS, 7)
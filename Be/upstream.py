@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+🌐 HTTP client dùng chung cho mọi lời gọi AI upstream (OpenAI, Gemini, Groq).
+
+Mỗi provider có một requests.Session riêng trong process, giữ kết nối keep-alive
+tới host của provider đó → không phải bắt tay TCP + TLS lại ở mỗi request.
+
+Cấu hình qua biến môi trường (<PROVIDER> = OPENAI | GEMINI | GROQ):
+    UPSTREAM_POOL_CONNECTIONS / <PROVIDER>_POOL_CONNECTIONS  số host được giữ pool (mặc định 4)
+    UPSTREAM_POOL_MAXSIZE     / <PROVIDER>_POOL_MAXSIZE      số kết nối mỗi host (mặc định 16)
+    UPSTREAM_CONNECT_TIMEOUT  / <PROVIDER>_CONNECT_TIMEOUT   timeout kết nối, giây (mặc định 5)
+    <PROVIDER>_TIMEOUT                                       timeout đọc, giây
+    UPSTREAM_RETRIES          / <PROVIDER>_RETRIES           số lần thử lại (mặc định 1)
+    UPSTREAM_BACKOFF          / <PROVIDER>_BACKOFF           hệ số backoff, giây (mặc định 0.3)
+
+Bảo vệ worker khi provider chậm/lỗi (mỗi provider một bộ, trong từng process):
+    <PROVIDER>_LATENCY_TARGET        độ trễ coi là "chậm", giây (mặc định = nửa timeout đọc)
+    UPSTREAM_BREAKER_FAILURE_RATE    tỉ lệ lỗi/chậm để ngắt mạch (mặc định 0.5)
+    UPSTREAM_BREAKER_MIN_CALLS       số lời gọi tối thiểu trong cửa sổ trước khi xét ngắt (mặc định 10)
+    UPSTREAM_BREAKER_WINDOW          cửa sổ thống kê, giây (mặc định 30)
+    UPSTREAM_BREAKER_COOLDOWN        thời gian ngắt trước khi cho một request thử lại, giây (mặc định 30)
+    UPSTREAM_LIMIT_INITIAL / _MIN / _MAX  giới hạn số request đang chạy (AIMD, mặc định 4 / 1 / POOL_MAXSIZE)
+(mọi biến UPSTREAM_* đều đặt riêng được theo <PROVIDER>_*)
+Bị ngắt mạch hoặc vượt giới hạn → raise UpstreamUnavailable ngay, route dùng câu trả lời dự phòng.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+# Timeout đọc mặc định giữ nguyên như các route cũ đang dùng
+_DEFAULT_READ_TIMEOUT = {
+    "openai": 25,
+    "gemini": 25,
+    "groq": 50,
+}
+
+# Lỗi tạm thời đáng thử lại. 429 không nằm ở đây: thử lại ngay chỉ đốt thêm quota.
+_RETRY_STATUSES = (500, 502, 503, 504)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class UpstreamHTTPError(Exception):
+    """Provider trả về mã lỗi HTTP (dùng ở những chỗ không đọc được response như stream)."""
+
+    def __init__(self, provider, status_code, text=""):
+        super().__init__(f"{provider} upstream error {status_code}: {text}")
+        self.provider = provider
+        self.status_code = status_code
+        self.text = text
+
+
+class UpstreamUnavailable(Exception):
+    """Không gửi request: provider đang bị ngắt mạch hoặc đã đủ số request đang chạy."""
+
+    def __init__(self, provider, reason):
+        super().__init__(f"{provider} upstream unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+def _env(provider, key, default, cast):
+    raw = os.getenv(f"{provider.upper()}_{key}") or os.getenv(f"UPSTREAM_{key}")
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        print(f"⚠️ [UPSTREAM] Giá trị không hợp lệ cho {key}: {raw!r}, dùng {default}")
+        return default
+
+
+class CircuitBreaker:
+    """
+    closed → open khi tỉ lệ lỗi/chậm trong cửa sổ vượt ngưỡng; open → half_open sau cooldown
+    (cho đúng một request thử); request thử thành công → closed, thất bại → open lại.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=30.0, cooldown=30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.opens = 0
+        self._calls = deque()  # (thời điểm, lỗi?)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True nếu được gửi request; ở half_open chỉ một request thử được đi qua."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def cancel(self):
+        with self._lock:
+            self._probing = False
+
+    def record(self, failed):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            if self.state == OPEN:
+                return  # Request gửi trước khi ngắt, về muộn
+            self._calls.append((now, failed))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, f in self._calls if f)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opens += 1
+        self._calls.clear()
+
+
+class AdaptiveLimiter:
+    """
+    Giới hạn số request đang chạy theo AIMD: mỗi request nhanh và thành công cộng 1/limit,
+    request lỗi/chậm (hoặc có request treo quá latency_target) nhân limit với `backoff`.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, latency_target=10.0, backoff=0.7):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.rejected = 0
+        self._in_flight = {}  # token -> thời điểm bắt đầu
+        self._tokens = itertools.count()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def acquire(self):
+        """Trả về token, hoặc None nếu đã đủ số request đang chạy."""
+        now = time.monotonic()
+        with self._lock:
+            if self._in_flight and now - min(self._in_flight.values()) > self.latency_target:
+                # Không chờ request treo trả về mới giảm: thấy treo là giảm luôn
+                self._decrease(now)
+            if len(self._in_flight) >= int(self.limit):
+                self.rejected += 1
+                return None
+            token = next(self._tokens)
+            self._in_flight[token] = now
+            return token
+
+    def release(self, token, latency, failed):
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight.pop(token, None)
+            if failed or latency > self.latency_target:
+                self._decrease(now)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def cancel(self, token):
+        """Request bị huỷ giữa chừng: trả chỗ, không tính là tín hiệu nhanh/chậm."""
+        with self._lock:
+            self._in_flight.pop(token, None)
+
+    def _decrease(self, now):
+        # Tối đa một lần mỗi giây: một đợt lỗi dồn dập chỉ tính là một tín hiệu
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+
+
+class ProviderClient:
+    """Session + connection pool + chính sách timeout/retry cho một provider."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pool_connections = _env(name, "POOL_CONNECTIONS", 4, int)
+        self.pool_maxsize = _env(name, "POOL_MAXSIZE", 16, int)
+        self.connect_timeout = _env(name, "CONNECT_TIMEOUT", 5.0, float)
+        self.read_timeout = float(os.getenv(f"{name.upper()}_TIMEOUT") or _DEFAULT_READ_TIMEOUT.get(name, 25))
+        self.retries = _env(name, "RETRIES", 1, int)
+        self.backoff = _env(name, "BACKOFF", 0.3, float)
+        self.latency_target = float(os.getenv(f"{name.upper()}_LATENCY_TARGET") or self.read_timeout / 2)
+        self.breaker = CircuitBreaker(
+            failure_rate=_env(name, "BREAKER_FAILURE_RATE", 0.5, float),
+            min_calls=_env(name, "BREAKER_MIN_CALLS", 10, int),
+            window=_env(name, "BREAKER_WINDOW", 30.0, float),
+            cooldown=_env(name, "BREAKER_COOLDOWN", 30.0, float),
+        )
+        self.limiter = AdaptiveLimiter(
+            initial=_env(name, "LIMIT_INITIAL", 4, int),
+            minimum=_env(name, "LIMIT_MIN", 1, int),
+            maximum=_env(name, "LIMIT_MAX", self.pool_maxsize, int),
+            latency_target=self.latency_target,
+        )
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,  # Không gửi lại POST khi upstream đã nhận request và đang sinh dữ liệu
+            status=self.retries,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            backoff_factor=self.backoff,
+            respect_retry_after_header=False,
+            raise_on_status=False,  # Hết lượt thử thì trả response cuối cho route tự xử lý
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def session(self):
+        # Tạo lại session sau khi gunicorn fork worker (không dùng chung socket với process cha)
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if not self.breaker.allow():
+            metrics.UPSTREAM_REJECTED.inc(self.name, "circuit_open")
+            raise UpstreamUnavailable(self.name, "circuit open")
+        token = self.limiter.acquire()
+        if token is None:
+            metrics.UPSTREAM_REJECTED.inc(self.name, "concurrency_limit")
+            self.breaker.cancel()  # Request không được gửi → trả lại lượt thử của half_open (nếu có)
+            raise UpstreamUnavailable(self.name, "concurrency limit")
+
+        started = time.perf_counter()
+        resp = None
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            metrics.observe_upstream(self.name, type(e).__name__, started)
+            raise
+        finally:
+            # Với stream=True đây là thời gian tới khi nhận header, chưa gồm phần body
+            latency = time.perf_counter() - started
+            failed = resp is None or resp.status_code == 429 or resp.status_code >= 500
+            self.limiter.release(token, latency, failed)
+            self.breaker.record(failed or latency > self.latency_target)
+        metrics.observe_upstream(self.name, str(resp.status_code), started)
+        return resp
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = ProviderClient(provider)
+                _clients[provider] = client
+    return client
+
+
+def status():
+    """Trạng thái breaker + limiter của các provider đã dùng trong process này."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {
+        c.name: {
+            "breaker": c.breaker.state,
+            "breaker_opens": c.breaker.opens,
+            "limit": round(c.limiter.limit, 2),
+            "in_flight": c.limiter.in_flight,
+            "rejected": c.limiter.rejected,
+        }
+        for c in clients
+    }
+
+
+@metrics.on_scrape
+def collect_upstream_metrics():
+    for name, st in status().items():
+        metrics.UPSTREAM_BREAKER.set(name, value={CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[st["breaker"]])
+        metrics.UPSTREAM_LIMIT.set(name, value=st["limit"])
+        metrics.UPSTREAM_IN_FLIGHT.set(name, value=st["in_flight"])
+
+
+def post(provider, url, **kwargs):
+    """Thay cho requests.post(...): dùng lại kết nối của provider tương ứng."""
+    return get_client(provider).post(url, **kwargs)
+
+
+def iter_chat_stream(resp):
+    """
+    Đọc response stream (SSE) của API /chat/completions kiểu OpenAI (OpenAI, Groq)
+    và yield từng đoạn text (delta.content) theo thứ tự.
+    """
+    if not resp.encoding:
+        resp.encoding = "utf-8"  # SSE luôn là UTF-8, tránh iter_lines trả về bytes
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+    finally:
+        resp.close()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+✍️ Ghi trễ (write-behind) cho các bản ghi chỉ-thêm (SpeakingSession, SpeakingTurn, log sự kiện...).
+
+Request chỉ bỏ dòng vào bộ đệm trong RAM rồi trả lời ngay; một thread nền gom lại và ghi bằng
+một lệnh INSERT nhiều dòng + một commit, khi:
+  - một bảng có đủ max_batch dòng, hoặc
+  - dòng cũ nhất đã chờ quá flush_interval giây.
+
+- Bộ nhớ có giới hạn: quá max_pending dòng đang chờ thì add() trả về False → caller tự ghi ngay như cũ.
+- Các bảng được ghi theo thứ tự đăng ký, nhưng chỉ trong một process: dòng cha mà bảng khác tham chiếu tới
+  (vd. speaking_sessions) nên ghi ngay trong request, đừng đệm, vì dòng con có thể nằm ở worker khác.
+- Một lô gồm dòng của nhiều request. Lỗi do chính dữ liệu (row_errors, vd. IntegrityError vì khoá ngoại sai)
+  → chia đôi lô và ghi lại từng nửa cho tới khi chỉ còn đúng các dòng lỗi; các dòng đó bị bỏ, cộng vào dropped.
+- Lỗi khác (DB mất kết nối...) → thử lại cả lô (retries lần, chờ tăng dần); vẫn lỗi thì bỏ lô đó, cộng vào lost.
+- Khi worker tắt (gunicorn/uvicorn thoát bình thường sau SIGTERM → atexit) bộ đệm được ghi nốt trong drain_timeout giây;
+  phần không kịp ghi cũng được tính vào lost. Process bị kill -9 thì mất tối đa flush_interval giây dữ liệu.
+- is_pending(table, key): dòng còn nằm trong bộ đệm (chưa có trong DB) của worker này.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+
+class WriteBehindBuffer:
+    def __init__(self, write_rows, tables, max_batch=200, flush_interval=0.5, max_pending=10000,
+                 retries=3, backoff=0.5, drain_timeout=10.0, enabled=True, row_errors=()):
+        """
+        write_rows(table, rows): ghi list dict vào table trong một transaction (raise nếu lỗi).
+        tables: các sqlalchemy.Table được phép đệm, theo thứ tự ghi.
+        row_errors: các loại exception do dữ liệu của một vài dòng gây ra → tách lô để chỉ bỏ các dòng đó.
+        """
+        self.write_rows = write_rows
+        self.tables = list(tables)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff = backoff
+        self.drain_timeout = drain_timeout
+        self.enabled = enabled
+        self.row_errors = tuple(row_errors)
+        self._queues = {t: deque() for t in self.tables}   # table -> deque (thời điểm thêm, row)
+        self._keys = {t: {} for t in self.tables}          # table -> {khoá chính: số dòng đang chờ}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()                # Chỉ một thread ghi tại một thời điểm
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.written = 0
+        self.flushes = 0
+        self.rejected = 0
+        self.lost = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    # ---------- Thêm dòng ----------
+    @staticmethod
+    def _key(table, row):
+        return tuple(row.get(c.name) for c in table.primary_key.columns)
+
+    def add(self, table, row):
+        return self.add_many(table, [row])
+
+    def add_many(self, table, rows):
+        """Đệm các dòng (cả lô hoặc không dòng nào). False → bộ đệm tắt/đầy, caller phải tự ghi."""
+        if not self.enabled or self._closed or not rows:
+            return not rows
+        if table not in self._queues:
+            raise ValueError(f"Bảng {table.name} chưa được đăng ký với write-behind")
+        now = time.monotonic()
+        with self._lock:
+            if self._pending + len(rows) > self.max_pending:
+                self.rejected += len(rows)
+                return False
+            queue, keys = self._queues[table], self._keys[table]
+            for row in rows:
+                queue.append((now, row))
+                key = self._key(table, row)
+                keys[key] = keys.get(key, 0) + 1
+            self._pending += len(rows)
+            if len(queue) >= self.max_batch:
+                self._wake.notify()
+        self._ensure_thread()
+        return True
+
+    def is_pending(self, table, *key):
+        with self._lock:
+            return key in self._keys.get(table, {})
+
+    # ---------- Ghi ----------
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is None or self._pid != pid:  # Worker vừa fork: thread của process cha không còn
+                self._pid = pid
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def _due(self, now):
+        for queue in self._queues.values():
+            if queue and (len(queue) >= self.max_batch or now - queue[0][0] >= self.flush_interval):
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed and not self._due(time.monotonic()):
+                    self._wake.wait(self.flush_interval / 2)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self, deadline=None):
+        """Ghi hết các dòng đang chờ (theo thứ tự bảng, mỗi lô tối đa max_batch dòng). Trả về số dòng đã ghi."""
+        written = 0
+        with self._flush_lock:
+            for table in self.tables:
+                while True:
+                    with self._lock:
+                        queue = self._queues[table]
+                        batch = [queue[i][1] for i in range(min(len(queue), self.max_batch))]
+                    if not batch:
+                        break
+                    ok, dropped, lost = self._write(table, batch, deadline)
+                    with self._lock:
+                        for _ in batch:
+                            _, row = queue.popleft()
+                            self._forget(table, row)
+                        self._pending -= len(batch)
+                        self.written += ok
+                        self.flushes += 1 if ok else 0
+                        self.dropped += dropped
+                        self.lost += lost
+                    written += ok
+        return written
+
+    def _forget(self, table, row):
+        keys = self._keys[table]
+        key = self._key(table, row)
+        if keys.get(key, 0) <= 1:
+            keys.pop(key, None)
+        else:
+            keys[key] -= 1
+
+    def _write(self, table, batch, deadline):
+        """Ghi một lô; trả về (số dòng đã ghi, số dòng bị DB từ chối, số dòng mất vì ghi lỗi)."""
+        for attempt in range(self.retries + 1):
+            try:
+                self.write_rows(table, batch)
+                return len(batch), 0, 0
+            except self.row_errors as e:
+                return self._split(table, batch, deadline, e)
+            except Exception as e:
+                error = e
+            delay = self.backoff * (2 ** attempt)
+            if attempt == self.retries or (deadline is not None and time.monotonic() + delay > deadline):
+                break
+            time.sleep(delay)
+        print(f"⚠️ [WRITE-BEHIND] Mất {len(batch)} dòng {table.name} sau {attempt + 1} lần ghi lỗi: {error}")
+        return 0, 0, len(batch)
+
+    def _split(self, table, batch, deadline, error):
+        # Lô lỗi vì dữ liệu của vài dòng: ghi lại từng nửa, chỉ bỏ đúng các dòng lỗi
+        if len(batch) == 1:
+            print(f"⚠️ [WRITE-BEHIND] Bỏ 1 dòng {table.name} bị DB từ chối: {error}")
+            return 0, 1, 0
+        middle = len(batch) // 2
+        left = self._write(table, batch[:middle], deadline)
+        right = self._write(table, batch[middle:], deadline)
+        return tuple(a + b for a, b in zip(left, right))
+
+    def close(self):
+        """Ngừng nhận dòng mới và ghi nốt bộ đệm (gọi bởi atexit khi worker thoát)."""
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            self._wake.notify_all()
+        if self._pid != os.getpid():
+            return  # Bộ đệm của process khác (bản sao sau fork) không có gì để ghi
+        self.flush(deadline=time.monotonic() + self.drain_timeout)
+        with self._lock:
+            left = self._pending
+        if left:
+            self.lost += left
+            print(f"⚠️ [WRITE-BEHIND] Tắt worker khi còn {left} dòng chưa ghi")
+        if self.lost or self.dropped:
+            print(f"⚠️ [WRITE-BEHIND] Worker {os.getpid()}: mất {self.lost} dòng, DB từ chối {self.dropped} dòng")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": self._pending,
+                "pending_by_table": {t.name: len(q) for t, q in self._queues.items()},
+                "written": self.written,
+                "flushes": self.flushes,
+                "rejected": self.rejected,
+                "lost": self.lost,
+                "dropped": self.dropped,
+            }